@@ -1,6 +1,16 @@
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from routers import (
+from dotenv import load_dotenv
+from pathlib import Path
+
+# Load environment variables from backend/.env explicitly. This has to run
+# before the imports below: their modules read settings (e.g. the scoring
+# pool size and cache sizes) at import time, and spawned scoring workers
+# inherit the environment from here.
+_env_path = Path(__file__).resolve().parent / ".env"
+load_dotenv(dotenv_path=_env_path)
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.middleware.cors import CORSMiddleware  # noqa: E402
+from routers import (  # noqa: E402
     authrouter,
     journalrouter,
     onboardingrouter,
@@ -8,12 +18,9 @@ from routers import (
     poserouter,
     contactrouter,
 )
-from dotenv import load_dotenv
-from pathlib import Path
-
-# Load environment variables from backend/.env explicitly
-_env_path = Path(__file__).resolve().parent / ".env"
-load_dotenv(dotenv_path=_env_path)
+from utils.PoseTracker.scoring_service import scoring_service  # noqa: E402
+from utils.exercise_catalog import exercise_catalog  # noqa: E402
+from utils.PoseTracker.reference_loader import missing_references  # noqa: E402
 
 app = FastAPI(title="BreakFree API", version="1.0.0")
 
@@ -38,6 +45,33 @@ app.include_router(poserouter.router, prefix="/api")
 app.include_router(contactrouter.router, prefix="/api")
 
 
+@app.on_event("startup")
+def start_scoring_pool():
+    scoring_service.start()
+
+
+@app.on_event("startup")
+def load_exercise_catalog():
+    exercise_catalog.load()
+
+
+@app.on_event("startup")
+def check_precomputed_references():
+    # Missing references are extracted inside the first compare request
+    missing = missing_references()
+    if missing:
+        print(
+            f"[ReferenceLoader] Warning: {len(missing)} exercises have no precomputed "
+            f"reference pose: {', '.join(str(ex.get('id')) for ex in missing)}. "
+            f"Run: python -m utils.PoseTracker.precompute"
+        )
+
+
+@app.on_event("shutdown")
+def shutdown_scoring_pool():
+    scoring_service.shutdown()
+
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to BreakFree API"}
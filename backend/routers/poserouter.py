@@ -1,102 +1,617 @@
-from fastapi import APIRouter, Depends
-from utils.PoseTracker.pose_compare import compare_pose_sequences
-from utils.PoseTracker.reference_loader import load_reference_pose
-from utils.models import PoseCompareRequest
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Request,
+    Response,
+    WebSocket,
+    WebSocketDisconnect,
+    status,
+)
+from starlette.concurrency import run_in_threadpool
+from utils.PoseTracker.keypoint_schemas import detect_schema, get_schema
+from utils.PoseTracker.motion_index import identify
+from utils.PoseTracker.pose_codec import decode_pose_packet
+from utils.PoseTracker.pose_sequence import PoseSequence
+from utils.PoseTracker.reference_cache import reference_cache_stats
+from utils.PoseTracker.repetitions import rep_template_cache_stats
+from utils.PoseTracker.result_cache import compare_cache_key, compare_results
+from utils.PoseTracker.reference_index import reference_index
+from utils.PoseTracker.reference_loader import load_reference
+from utils.PoseTracker.scoring_service import (
+    ScoringBusyError,
+    score_user_sequence,
+    scoring_service,
+)
+from utils.PoseTracker.stream_scorer import STREAM_MODE, StreamingPoseScorer
+from utils.exercise_catalog import exercise_catalog
+from utils.models import PoseCompareRequest, PoseIdentifyRequest
 from utils import database, auth
 from datetime import datetime
+from typing import Any, Dict, Optional
+import asyncio
+import base64
 import os
 import json
 
 router = APIRouter(prefix="/pose", tags=["pose"])
 
+# compare_cache_key -> result of the attempt being scored (see _compare)
+_compares_in_flight: Dict[str, asyncio.Future] = {}
+
 USER_POSE_DIR = "user_poses"
 os.makedirs(USER_POSE_DIR, exist_ok=True)
 
 
+def _save_user_pose(task_id: str, user_pose_sequence: list) -> str:
+    """Save user sequence for inspection"""
+    timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    user_out_path = os.path.join(USER_POSE_DIR, f"user_task{task_id}_{timestamp}.json")
+    with open(user_out_path, "w") as f:
+        json.dump(user_pose_sequence, f)
+    return user_out_path
+
+
+def _save_user_pose_packed(task_id: str, packed: bytes) -> str:
+    """Save a binary pose packet as received, without expanding it to JSON"""
+    timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    user_out_path = os.path.join(USER_POSE_DIR, f"user_task{task_id}_{timestamp}.bfps")
+    with open(user_out_path, "wb") as f:
+        f.write(packed)
+    return user_out_path
+
+
+def _save_pose_metadata(user_out_path: str, metadata: Dict[str, Any]) -> None:
+    """
+    Write what is needed to re-score a saved recording later (rescore.py)
+    next to it, as <recording>.meta.json
+    """
+    meta_path = os.path.splitext(user_out_path)[0] + ".meta.json"
+    metadata = {
+        "recording": os.path.basename(user_out_path),
+        "scored_at": datetime.utcnow().isoformat(),
+        **metadata,
+    }
+    with open(meta_path, "w") as f:
+        json.dump(metadata, f)
+
+
+def _points_per_frame(seq) -> int:
+    if not len(seq):
+        return 0
+    if isinstance(seq, PoseSequence):
+        return int((seq.scores[0] > 0).sum())
+    return len(seq[0])
+
+
 @router.post("/compare")
-def compare_pose(
+async def compare_pose(
     req: PoseCompareRequest,
+    response: Response,
     current_user: database.FirestoreUser = Depends(auth.get_current_active_user),
 ):
-    try:
-        # Use reference_video_url from request to find the matching exercise
-        if not req.reference_video_url:
-            return {
-                "error": "reference_video_url is required to find the correct reference pose"
-            }
-
-        video_url = req.reference_video_url
-        print(f"[PoseCompare] Looking up reference pose for video: {video_url}")
-
-        # Find the exercise in exercises.json that matches this video_url
-        exercises_path = os.path.join(os.path.dirname(__file__), "..", "exercises.json")
-        with open(exercises_path, "r") as f:
-            exercises_data = json.load(f)
-
-        matching_exercise = None
-        for exercise in exercises_data.get("exercises", []):
-            if exercise.get("videolink") == video_url:
-                matching_exercise = exercise
-                break
+    """
+    Score a recording on the scoring worker pool (scoring_service).
+    Answers 503 with Retry-After when the pool is saturated.
 
-        if not matching_exercise:
-            return {
-                "error": f"No exercise found in exercises.json with videolink: {video_url}"
-            }
+    A repeat of an attempt already scored in the last POSE_RESULT_CACHE_TTL_S
+    seconds (same user, task, recording, reference and parameters) returns the
+    stored result without scoring or saving it again, and a repeat that
+    arrives while the attempt is still being scored waits for its result; the
+    X-Pose-Cache response header is "hit" then, "miss" otherwise.
+    """
+    return await _compare(req, current_user, response)
 
-        exercise_id = matching_exercise.get("id")
-        exercise_name = matching_exercise.get("name", "unknown")
-        print(
-            f"[PoseCompare] Found matching exercise: ID={exercise_id}, Name={exercise_name}"
-        )
 
-        # Load reference pose using exercise ID and video URL
+@router.post("/compare/packed")
+async def compare_pose_packed(
+    request: Request,
+    response: Response,
+    task_id: str,
+    reference_video_url: Optional[str] = None,
+    user_id: Optional[str] = None,
+    mode: str = "window",
+    use_gemini: bool = True,
+    features: str = "coords",
+    recognize: bool = False,
+    current_user: database.FirestoreUser = Depends(auth.get_current_active_user),
+):
+    """
+    Same as /compare, with the user sequence sent as the raw request body in the
+    binary pose packet format (Content-Type: application/octet-stream).
+    """
+    packed = await request.body()
+    req = PoseCompareRequest(
+        task_id=task_id,
+        reference_video_url=reference_video_url,
+        user_id=user_id,
+        mode=mode,
+        use_gemini=use_gemini,
+        features=features,
+        recognize=recognize,
+    )
+    return await _compare(req, current_user, response, packed)
+
+
+def _decode_user_sequence(req, packed: Optional[bytes] = None):
+    """
+    Decode the user sequence of a compare or identify request.
+    Returns (user_seq, schema, packed bytes or None, error message or None).
+    """
+    # The user sequence arrives as JSON frames, a base64 packet field, or a raw packet
+    if packed is not None or req.user_pose_packed:
+        try:
+            if packed is None:
+                packed = base64.b64decode(req.user_pose_packed, validate=True)
+            return decode_pose_packet(packed), None, packed, None
+        except ValueError as e:
+            return None, None, None, f"Invalid pose packet: {str(e)}"
+    if req.user_pose_sequence is not None:
+        # Schema declared by the client, or detected once from the first frame
+        frames = req.user_pose_sequence
         try:
-            reference_seq = load_reference_pose(str(exercise_id), video_url=video_url)
+            if req.keypoint_schema:
+                schema = get_schema(req.keypoint_schema)
+            else:
+                schema = detect_schema(frames[0]) if frames else None
+            return PoseSequence.from_frames(frames, schema), schema, None, None
+        except ValueError as e:
+            return None, None, None, f"Invalid user_pose_sequence: {str(e)}"
+    return None, None, None, "user_pose_sequence or user_pose_packed is required"
+
+
+def _recognize(user_seq: PoseSequence, exercise_id: str) -> Dict[str, Any]:
+    """Candidate exercises of a recording and whether the top one is exercise_id."""
+    try:
+        candidates = identify(user_seq)
+    except Exception as e:
+        print(f"[PoseCompare] Exercise recognition failed: {e}")
+        return {"candidates": [], "error": str(e)}
+    recognition: Dict[str, Any] = {"candidates": candidates}
+    if candidates:
+        top = candidates[0]
+        recognition["matches_reference"] = top["exercise_id"] == exercise_id
+        if not recognition["matches_reference"]:
             print(
-                f"[PoseCompare] Loaded pre-computed reference poses for exercise {exercise_id} (task {req.task_id})"
+                f"[PoseCompare] Recording looks most like exercise "
+                f"{top['exercise_id']} ({top['name']}), not {exercise_id}"
             )
-        except Exception as e:
-            print(f"[PoseCompare] Error loading reference poses: {e}")
-            return {
-                "error": f"Failed to load reference poses for exercise {exercise_id}: {str(e)}"
-            }
-
-        # Save user sequence for inspection
-        timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-        user_out_path = os.path.join(
-            USER_POSE_DIR, f"user_task{req.task_id}_{timestamp}.json"
-        )
-        with open(user_out_path, "w") as f:
-            json.dump(req.user_pose_sequence, f)
-
-        # Print quick debug info
-        ref_frames = len(reference_seq)
-        user_frames = len(req.user_pose_sequence)
-        avg_ref_points = len(reference_seq[0]) if ref_frames else 0
-        avg_user_points = len(req.user_pose_sequence[0]) if user_frames else 0
+    return recognition
+
+
+def _prepare_compare(
+    req: PoseCompareRequest, user_id: str, packed: Optional[bytes] = None
+) -> Dict[str, Any]:
+    """
+    Decode the user sequence and find the exercise and its reference.
+    Returns {"error": ...}, {"cached": result} for a repeated attempt (see
+    result_cache.py), or the inputs for _save_recording and
+    score_user_sequence.
+    """
+    # Use reference_video_url from request to find the matching exercise
+    if not req.reference_video_url:
+        return {
+            "error": "reference_video_url is required to find the correct reference pose"
+        }
+
+    user_seq, schema, packed, error = _decode_user_sequence(req, packed)
+    if error:
+        return {"error": error}
+
+    video_url = req.reference_video_url
+    print(f"[PoseCompare] Looking up reference pose for video: {video_url}")
+
+    matching_exercise = exercise_catalog.by_videolink(video_url)
+
+    if not matching_exercise:
+        return {
+            "error": f"No exercise found in exercises.json with videolink: {video_url}"
+        }
+
+    exercise_id = matching_exercise.get("id")
+    exercise_name = matching_exercise.get("name", "unknown")
+    print(
+        f"[PoseCompare] Found matching exercise: ID={exercise_id}, Name={exercise_name}"
+    )
+
+    timestamps = req.user_frame_timestamps
+    if timestamps is None and user_seq.timestamps is not None:
+        timestamps = user_seq.timestamps.tolist()
+
+    # Resolved (and extracted if missing) before the cache key is computed, so
+    # the first attempt and its retries are keyed on the same reference version
+    try:
+        reference_version = load_reference(str(exercise_id), video_url).content_hash
+    except Exception as e:
+        return {
+            "error": (
+                f"Failed to load reference poses for exercise {exercise_id}: {str(e)}"
+            )
+        }
+    cache_key = compare_cache_key(
+        user_seq.data,
+        timestamps,
+        user_id=user_id,
+        task_id=req.task_id,
+        exercise_id=str(exercise_id),
+        reference_version=reference_version,
+        mode=req.mode,
+        features=req.features,
+        use_gemini=req.use_gemini,
+        recognize=req.recognize,
+    )
+    cached = compare_results.get(cache_key)
+    if cached is not None:
         print(
-            f"[PoseCompare] Task={req.task_id} | RefFrames={ref_frames}, UserFrames={user_frames}, "
-            f"RefPoints={avg_ref_points}, UserPoints={avg_user_points}"
+            f"[PoseCompare] Repeated attempt, returning cached result "
+            f"({cache_key[:12]})"
         )
+        return {"cached": cached}
+
+    return {
+        "cache_key": cache_key,
+        "exercise_id": str(exercise_id),
+        "video_url": video_url,
+        "user_seq": user_seq,
+        "user_timestamps": timestamps,
+        "schema": schema.name if schema else None,
+        "packed": packed,
+    }
+
 
-        # Compare using motion-based analysis (only common visible points)
-        # Backend already implements: common points filtering + motion vectors + relative movement
-        score = compare_pose_sequences(
-            reference_seq, req.user_pose_sequence, task_id=req.task_id
+def _save_recording(
+    req: PoseCompareRequest, prepared: Dict[str, Any]
+) -> Optional[Dict[str, Any]]:
+    """
+    Save the user sequence for inspection and, with req.recognize, rank the
+    exercises it most resembles (motion_index.identify) so mislabelled attempts
+    can be spotted; the ranking never chooses the reference.
+    Returns the recognition result or None.
+    """
+    user_seq = prepared["user_seq"]
+    if prepared["packed"] is not None:
+        prepared["user_out_path"] = _save_user_pose_packed(
+            req.task_id, prepared["packed"]
+        )
+    else:
+        prepared["user_out_path"] = _save_user_pose(
+            req.task_id, req.user_pose_sequence
         )
 
-        # Save score to database
-        today = datetime.utcnow().strftime("%Y-%m-%d")
-        user_id = req.user_id or current_user.id
-        database.save_exercise_score(user_id, req.task_id, today, score)
+    # Print quick debug info
+    print(
+        f"[PoseCompare] Task={req.task_id} | UserFrames={len(user_seq)}, "
+        f"UserPoints={_points_per_frame(user_seq)}"
+    )
+    if not req.recognize:
+        return None
+    return _recognize(user_seq, prepared["exercise_id"])
 
-        # Return score + file reference
-        return {
+
+async def _score_attempt(
+    req: PoseCompareRequest, user_id: str, prepared: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Save, score and store one attempt prepared by _prepare_compare."""
+    recognition = await run_in_threadpool(_save_recording, req, prepared)
+
+    # Compare using motion-based analysis (only common visible points)
+    # Backend already implements: common points filtering + motion vectors + relative movement
+    try:
+        score, diagnostics = await scoring_service.run(
+            score_user_sequence,
+            prepared["exercise_id"],
+            prepared["video_url"],
+            prepared["user_seq"].data,
+            prepared["user_timestamps"],
+            req.task_id,
+            req.mode,
+            req.use_gemini,
+            req.features,
+        )
+    except ScoringBusyError as e:
+        print(f"[PoseCompare] {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "1"},
+        )
+    if prepared["schema"] is not None:
+        diagnostics["keypoint_schema"] = prepared["schema"]
+    if recognition is not None:
+        diagnostics["recognition"] = recognition
+
+    # Save score to database
+    today = datetime.utcnow().strftime("%Y-%m-%d")
+    await run_in_threadpool(
+        database.save_exercise_score, user_id, req.task_id, today, score
+    )
+    await run_in_threadpool(
+        _save_pose_metadata,
+        prepared["user_out_path"],
+        {
+            "task_id": req.task_id,
+            "user_id": user_id,
+            "exercise_id": prepared["exercise_id"],
+            "reference_video_url": prepared["video_url"],
+            "mode": req.mode,
+            "features": req.features,
+            "keypoint_schema": prepared["schema"],
+            "user_frame_timestamps": prepared["user_timestamps"],
             "score": score,
-            "saved_user_pose": user_out_path,
-            "message": "Pose comparison completed using pre-computed reference poses",
-        }
+            "scorers": diagnostics.get("scorers"),
+        },
+    )
 
+    # Return score + file reference
+    result = {
+        "score": score,
+        "saved_user_pose": prepared["user_out_path"],
+        "diagnostics": diagnostics,
+        "message": "Pose comparison completed using pre-computed reference poses",
+    }
+    compare_results.put(prepared["cache_key"], result)
+    return result
+
+
+async def _compare(
+    req: PoseCompareRequest,
+    current_user: database.FirestoreUser,
+    response: Response,
+    packed: Optional[bytes] = None,
+):
+    try:
+        user_id = req.user_id or current_user.id
+        prepared = await run_in_threadpool(_prepare_compare, req, user_id, packed)
+        if "error" in prepared:
+            return prepared
+        if "cached" in prepared:
+            response.headers["X-Pose-Cache"] = "hit"
+            return prepared["cached"]
+
+        # A retry that arrives while its attempt is still scoring waits for it,
+        # and scores it itself if that one fails
+        cache_key = prepared["cache_key"]
+        while cache_key in _compares_in_flight:
+            print(
+                f"[PoseCompare] Repeated attempt, waiting for the one in flight "
+                f"({cache_key[:12]})"
+            )
+            result = await asyncio.shield(_compares_in_flight[cache_key])
+            if result is not None:
+                response.headers["X-Pose-Cache"] = "hit"
+                return result
+
+        response.headers["X-Pose-Cache"] = "miss"
+        future = asyncio.get_running_loop().create_future()
+        _compares_in_flight[cache_key] = future
+        result = None
+        try:
+            result = await _score_attempt(req, user_id, prepared)
+        finally:
+            del _compares_in_flight[cache_key]
+            future.set_result(result)
+        return result
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@router.post("/identify")
+async def identify_exercise(
+    req: PoseIdentifyRequest,
+    current_user: database.FirestoreUser = Depends(auth.get_current_active_user),
+):
+    """
+    Rank the exercises a recording most resembles by motion signature
+    (motion_index), without running any DTW.
+    """
+
+    def run() -> Dict[str, Any]:
+        user_seq, _, _, error = _decode_user_sequence(req)
+        if error:
+            return {"error": error}
+        return {"candidates": identify(user_seq, req.top_k)}
+
+    try:
+        return await run_in_threadpool(run)
     except Exception as e:
         return {"error": str(e)}
+
+
+@router.get("/cache/stats")
+def pose_cache_stats(
+    current_user: database.FirestoreUser = Depends(auth.get_current_active_user),
+):
+    # The reference cache of this process serves stream sessions; compares use
+    # the per-worker caches of the scoring pool
+    return {
+        "reference_cache": reference_cache_stats(),
+        "reference_index": reference_index.stats(),
+        "rep_templates": rep_template_cache_stats(),
+        "compare_results": compare_results.stats(),
+        "scoring": scoring_service.stats(),
+    }
+
+
+@router.websocket("/stream")
+async def stream_pose(websocket: WebSocket, token: str = ""):
+    """
+    Score a recording while it is captured.
+
+    Browsers cannot set headers on WebSocket requests, so the access token is
+    passed as ?token=. Messages (JSON):
+        client -> {"type": "start", "task_id", "reference_video_url", "user_id"?,
+                   "keypoint_schema"?}
+        server <- {"type": "ready", "exercise_id"}
+                  (send frames only after it; another start restarts the
+                  session and discards the frames received so far)
+        client -> {"type": "frames", "frames": [[{name, x, y, score}, ...], ...],
+                   "timestamps"?: [capture time in ms per frame]}
+                  (timestamps in every frames message of a session or in none)
+        server <- {"type": "progress", "frames", "resampled_frames",
+                   "aligned_frames", "partial_score", ...}
+        client -> {"type": "stop"}
+        server <- {"type": "result", "score", "saved_user_pose", "diagnostics"}
+    Errors are sent as {"type": "error", "error"} and close the socket.
+    """
+    current_user = await run_in_threadpool(auth.get_user_from_token, token)
+    if current_user is None or not current_user.is_active:
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    scorer = None
+    task_id = None
+    user_id = None
+    user_pose_sequence = []
+    user_timestamps = []
+
+    try:
+        while True:
+            message = await websocket.receive_json()
+            msg_type = message.get("type")
+
+            if msg_type == "start":
+                video_url = message.get("reference_video_url")
+                task_id = message.get("task_id")
+                user_id = message.get("user_id") or current_user.id
+                if not video_url or not task_id:
+                    await websocket.send_json(
+                        {
+                            "type": "error",
+                            "error": "task_id and reference_video_url are required",
+                        }
+                    )
+                    break
+
+                matching_exercise = exercise_catalog.by_videolink(video_url)
+                if not matching_exercise:
+                    await websocket.send_json(
+                        {
+                            "type": "error",
+                            "error": (
+                                f"No exercise found in exercises.json with "
+                                f"videolink: {video_url}"
+                            ),
+                        }
+                    )
+                    break
+
+                exercise_id = matching_exercise.get("id")
+                try:
+                    reference = await run_in_threadpool(
+                        load_reference, str(exercise_id), video_url
+                    )
+                except Exception as e:
+                    print(f"[PoseStream] Error loading reference poses: {e}")
+                    await websocket.send_json(
+                        {
+                            "type": "error",
+                            "error": (
+                                f"Failed to load reference poses for exercise "
+                                f"{exercise_id}: {str(e)}"
+                            ),
+                        }
+                    )
+                    break
+
+                try:
+                    schema = (
+                        get_schema(message["keypoint_schema"])
+                        if message.get("keypoint_schema")
+                        else None
+                    )
+                except ValueError as e:
+                    await websocket.send_json({"type": "error", "error": str(e)})
+                    break
+
+                scorer = StreamingPoseScorer(
+                    reference.sequence,
+                    reference_key=reference.cache_key,
+                    schema=schema,
+                )
+                # A new start begins a new recording
+                user_pose_sequence = []
+                user_timestamps = []
+                print(
+                    f"[PoseStream] Started session for exercise {exercise_id} "
+                    f"(task {task_id})"
+                )
+                await websocket.send_json({"type": "ready", "exercise_id": exercise_id})
+
+            elif msg_type == "frames":
+                if scorer is None:
+                    await websocket.send_json(
+                        {"type": "error", "error": "Send a start message first"}
+                    )
+                    break
+                frames = message.get("frames") or []
+                progress = await run_in_threadpool(
+                    scorer.add_frames, frames, message.get("timestamps")
+                )
+                # Recorded only once accepted, so frames and timestamps line up
+                user_pose_sequence.extend(frames)
+                if message.get("timestamps") is not None:
+                    user_timestamps.extend(message["timestamps"])
+                await websocket.send_json({"type": "progress", **progress})
+
+            elif msg_type == "stop":
+                if scorer is None:
+                    await websocket.send_json(
+                        {"type": "error", "error": "Send a start message first"}
+                    )
+                    break
+                score, diagnostics = await run_in_threadpool(scorer.finish)
+                user_out_path = await run_in_threadpool(
+                    _save_user_pose, task_id, user_pose_sequence
+                )
+                today = datetime.utcnow().strftime("%Y-%m-%d")
+                await run_in_threadpool(
+                    database.save_exercise_score, user_id, task_id, today, score
+                )
+                await run_in_threadpool(
+                    _save_pose_metadata,
+                    user_out_path,
+                    {
+                        "task_id": task_id,
+                        "user_id": user_id,
+                        "exercise_id": str(exercise_id),
+                        "reference_video_url": video_url,
+                        "mode": STREAM_MODE,
+                        "keypoint_schema": (
+                            scorer.schema.name if scorer.schema else None
+                        ),
+                        "user_frame_timestamps": user_timestamps or None,
+                        "score": score,
+                        "scorers": ["dtw"],
+                    },
+                )
+                await websocket.send_json(
+                    {
+                        "type": "result",
+                        "score": score,
+                        "saved_user_pose": user_out_path,
+                        "diagnostics": diagnostics,
+                    }
+                )
+                break
+
+            else:
+                await websocket.send_json(
+                    {"type": "error", "error": f"Unknown message type: {msg_type}"}
+                )
+                break
+
+        await websocket.close()
+
+    except WebSocketDisconnect:
+        print(f"[PoseStream] Client disconnected (task {task_id})")
+    except Exception as e:
+        print(f"[PoseStream] Error: {e}")
+        try:
+            await websocket.send_json({"type": "error", "error": str(e)})
+            await websocket.close()
+        except Exception:
+            pass
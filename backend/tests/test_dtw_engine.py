@@ -0,0 +1,126 @@
+"""
+Parity of dtw_engine with dtw-python (symmetric2), which it replaced.
+
+Expected values were computed with dtw-python 1.9.0 and are pinned here so the
+test runs without it. Run from backend/: python -m pytest tests
+"""
+
+import numpy as np
+import pytest
+
+from utils.PoseTracker.dtw_engine import (
+    ITAKURA,
+    SAKOE_CHIBA,
+    dtw_distance,
+    dtw_path,
+    pairwise_distances,
+    window_ranges,
+)
+
+SQUARE_A = np.array([[0.0], [1.0], [2.0], [1.5], [0.5], [0.0]])
+SQUARE_B = np.array([[0.0], [0.2], [1.1], [2.2], [1.4], [0.3]])
+RECT_A = np.array([[0.1], [-0.1], [0.6], [0.1], [-0.5]])
+RECT_B = np.array([[0.4], [1.3], [0.9], [-0.7], [-1.3], [-0.6], [0.0], [-2.3]])
+
+# (a, b, window_type, window_size, distance, path) as given by dtw-python
+DTW_PYTHON_CASES = [
+    (
+        SQUARE_A,
+        SQUARE_B,
+        None,
+        None,
+        1.7,
+        [[0, 0], [0, 1], [1, 2], [2, 3], [3, 4], [4, 5], [5, 5]],
+    ),
+    (
+        SQUARE_A,
+        SQUARE_B,
+        ITAKURA,
+        None,
+        3.0,
+        [[0, 0], [1, 1], [1, 2], [2, 3], [3, 4], [4, 5], [5, 5]],
+    ),
+    (
+        SQUARE_A,
+        SQUARE_B,
+        SAKOE_CHIBA,
+        1,
+        1.7,
+        [[0, 0], [0, 1], [1, 2], [2, 3], [3, 4], [4, 5], [5, 5]],
+    ),
+    (
+        RECT_A,
+        RECT_B,
+        None,
+        None,
+        6.4,
+        [
+            [0, 0],
+            [1, 0],
+            [2, 0],
+            [2, 1],
+            [2, 2],
+            [3, 2],
+            [4, 3],
+            [4, 4],
+            [4, 5],
+            [4, 6],
+            [4, 7],
+        ],
+    ),
+]
+
+
+def _ranges(a, b, window_type, window_size):
+    return window_ranges(len(a), len(b), window_type, window_size)
+
+
+@pytest.mark.parametrize(
+    "a, b, window_type, window_size, distance, path", DTW_PYTHON_CASES
+)
+def test_matches_dtw_python(a, b, window_type, window_size, distance, path):
+    cost = pairwise_distances(a, b)
+    assert dtw_distance(cost, window_type, window_size) == pytest.approx(distance)
+    dist, found = dtw_path(a, b, _ranges(a, b, window_type, window_size))
+    assert dist == pytest.approx(distance)
+    assert found.tolist() == path
+
+
+def test_non_square_sakoe_chiba_is_slope_adjusted():
+    # dtw-python's band is |i - j| <= 3, which gives 6.4 via
+    # [[0, 0], [1, 0], [2, 0], [2, 1], [2, 2], [3, 2], [4, 3], ...]; ours
+    # follows the diagonal from (0, 0) to (n - 1, m - 1), which excludes (2, 0)
+    cost = pairwise_distances(RECT_A, RECT_B)
+    assert dtw_distance(cost, SAKOE_CHIBA, 3) == pytest.approx(8.0)
+    dist, path = dtw_path(RECT_A, RECT_B, _ranges(RECT_A, RECT_B, SAKOE_CHIBA, 3))
+    assert dist == pytest.approx(8.0)
+    assert path.tolist() == [
+        [0, 0],
+        [1, 0],
+        [2, 1],
+        [2, 2],
+        [3, 3],
+        [3, 4],
+        [4, 5],
+        [4, 6],
+        [4, 7],
+    ]
+
+
+def test_non_square_sakoe_chiba_reaches_corner():
+    # dtw-python finds no path here: (4, 7) is outside |i - j| <= 1
+    cost = pairwise_distances(RECT_A, RECT_B)
+    assert np.isfinite(dtw_distance(cost, SAKOE_CHIBA, 1))
+
+
+@pytest.mark.parametrize(
+    "a, b, window_type, window_size, distance, path", DTW_PYTHON_CASES
+)
+def test_pinned_values_are_dtw_python(a, b, window_type, window_size, distance, path):
+    dtw = pytest.importorskip("dtw")
+    kwargs = {} if window_type is None else {"window_type": window_type}
+    if window_size is not None:
+        kwargs["window_args"] = {"window_size": window_size}
+    alignment = dtw.dtw(pairwise_distances(a, b), step_pattern="symmetric2", **kwargs)
+    assert alignment.distance == pytest.approx(distance)
+    assert np.stack([alignment.index1, alignment.index2], axis=1).tolist() == path
@@ -0,0 +1,81 @@
+"""
+Keypoint schema registry and the index maps that move each schema's columns
+into the PoseSequence layout. Run from backend/: python -m pytest tests
+"""
+
+import numpy as np
+import pytest
+
+from utils.PoseTracker.keypoint_schemas import (
+    MEDIAPIPE_33,
+    MOVENET_17,
+    detect_schema,
+    get_schema,
+    index_map,
+    names_index_map,
+)
+from utils.PoseTracker.landmarks import LANDMARK_INDEX
+from utils.PoseTracker.pose_sequence import PoseSequence
+
+
+def test_movenet_columns_map_to_mediapipe_landmarks():
+    source_cols, target_cols = index_map(MOVENET_17)
+    assert len(source_cols) == len(MOVENET_17)
+    for s, t in zip(source_cols, target_cols):
+        assert MEDIAPIPE_33.keypoint_names[t] == MOVENET_17.keypoint_names[s]
+
+
+def test_index_maps_are_computed_once():
+    assert index_map(MOVENET_17) is index_map(MOVENET_17)
+    names = ("right_hip", "nose")
+    assert names_index_map(names) is names_index_map(names)
+
+
+def test_names_index_map_skips_unknown_names():
+    source_cols, target_cols = names_index_map(("nose", "tail", "left_knee"))
+    assert list(source_cols) == [0, 2]
+    assert list(target_cols) == [LANDMARK_INDEX["nose"], LANDMARK_INDEX["left_knee"]]
+
+
+def test_get_schema():
+    assert get_schema("movenet17") is MOVENET_17
+    with pytest.raises(ValueError, match="Unknown keypoint schema"):
+        get_schema("openpose25")
+
+
+@pytest.mark.parametrize(
+    "first_frame, expected",
+    [
+        ([{"name": "nose"}, {"name": "left_ankle"}], MOVENET_17),
+        ([{"name": "nose"}, {"name": "left_pinky"}], MEDIAPIPE_33),
+        ([{"name": "tail"}], None),
+        ([[0.0, 0.0, 1.0]] * 17, MOVENET_17),
+        ([[0.0, 0.0, 1.0]] * 33, MEDIAPIPE_33),
+        ([[0.0, 0.0, 1.0]] * 20, None),
+        ([], None),
+    ],
+)
+def test_detect_schema(first_frame, expected):
+    assert detect_schema(first_frame) is expected
+
+
+def test_dense_and_named_frames_give_the_same_sequence():
+    values = np.random.default_rng(0).random((3, len(MOVENET_17), 3))
+    dense = values.tolist()
+    named = [
+        [
+            {"name": n, "x": x, "y": y, "score": s}
+            for n, (x, y, s) in zip(MOVENET_17.keypoint_names, frame)
+        ]
+        for frame in values
+    ]
+    np.testing.assert_array_equal(
+        PoseSequence.from_frames(dense).data, PoseSequence.from_frames(named).data
+    )
+
+
+def test_dense_frames_must_match_the_schema():
+    with pytest.raises(ValueError, match="keypoint schema"):
+        PoseSequence.from_frames([[[0.0, 0.0, 1.0]] * 20])
+    with pytest.raises(ValueError, match="movenet17"):
+        PoseSequence.from_frames([[[0.0, 0.0]] * 17], MOVENET_17)
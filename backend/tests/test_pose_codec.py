@@ -0,0 +1,81 @@
+"""
+Round trips of the binary pose packet (pose_codec) against the JSON frames
+it replaces. Run from backend/: python -m pytest tests
+"""
+
+import numpy as np
+import pytest
+
+from utils.PoseTracker.keypoint_schemas import MOVENET_17
+from utils.PoseTracker.landmarks import LANDMARK_INDEX, NUM_LANDMARKS
+from utils.PoseTracker.pose_codec import (
+    MAGIC,
+    decode_pose_packet,
+    encode_pose_packet,
+)
+from utils.PoseTracker.pose_sequence import PoseSequence
+
+
+def _values(frames: int, points: int, seed: int = 0) -> np.ndarray:
+    return (
+        np.random.default_rng(seed).random((frames, points, 3)).astype(np.float32)
+    )
+
+
+def test_named_packet_matches_json_frames():
+    names = ["left_wrist", "nose", "right_ankle"]
+    values = _values(4, len(names))
+    frames = [
+        [
+            {"name": n, "x": float(x), "y": float(y), "score": float(s)}
+            for n, (x, y, s) in zip(names, frame)
+        ]
+        for frame in values
+    ]
+
+    decoded = decode_pose_packet(encode_pose_packet(names, values))
+
+    expected = PoseSequence.from_frames(frames)
+    assert decoded.data.shape == (4, NUM_LANDMARKS, 3)
+    np.testing.assert_array_equal(decoded.data, expected.data)
+    assert decoded.timestamps is None
+
+
+def test_schema_packet_places_columns_and_keeps_timestamps():
+    values = _values(3, len(MOVENET_17), seed=1)
+    timestamps = [0.0, 33.5, 70.25]
+
+    decoded = decode_pose_packet(encode_pose_packet(MOVENET_17, values, timestamps))
+
+    for col, name in enumerate(MOVENET_17.keypoint_names):
+        np.testing.assert_array_equal(
+            decoded.data[:, LANDMARK_INDEX[name]], values[:, col]
+        )
+    # MediaPipe-only landmarks stay empty
+    assert not decoded.data[:, LANDMARK_INDEX["left_pinky"]].any()
+    np.testing.assert_array_equal(decoded.timestamps, timestamps)
+
+
+def test_empty_packet():
+    decoded = decode_pose_packet(encode_pose_packet(["nose"], np.zeros((0, 1, 3))))
+    assert len(decoded) == 0
+
+
+@pytest.mark.parametrize(
+    "mutate, message",
+    [
+        (lambda p: p[:5], "too short"),
+        (lambda p: b"XXXX" + p[len(MAGIC) :], "bad magic"),
+        (lambda p: p[:-4], "payload"),
+        (lambda p: p + b"\0\0\0\0", "payload"),
+    ],
+)
+def test_malformed_packets_are_rejected(mutate, message):
+    packet = encode_pose_packet(["nose", "left_hip"], _values(2, 2))
+    with pytest.raises(ValueError, match=message):
+        decode_pose_packet(mutate(packet))
+
+
+def test_encode_checks_shape():
+    with pytest.raises(ValueError):
+        encode_pose_packet(["nose", "left_hip"], _values(2, 3))
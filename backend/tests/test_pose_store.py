@@ -0,0 +1,140 @@
+"""
+Binary reference store (pose_store.py): conversion, staleness and the
+store-only deployments reference_loader falls back to.
+Run from backend/: python -m pytest tests
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pytest
+
+from utils.PoseTracker import reference_loader
+from utils.PoseTracker.pose_sequence import PoseSequence
+from utils.PoseTracker.pose_store import (
+    STORE_FORMAT_VERSION,
+    convert_reference,
+    frames_from_array,
+    load_pose_store,
+    save_pose_store,
+)
+from utils.PoseTracker.reference_index import (
+    REFERENCE_FOLDER,
+    reference_index,
+    store_meta_path,
+    store_path,
+)
+
+
+def _write_reference(path, frames: int = 6, seed: int = 0) -> np.ndarray:
+    data = np.random.default_rng(seed).random((frames, 33, 3)).astype(np.float32)
+    with open(path, "w") as f:
+        json.dump(frames_from_array(data), f)
+    return data
+
+
+def _set_meta(pose_path, **changes):
+    with open(store_meta_path(pose_path)) as f:
+        meta = json.load(f)
+    meta.update(changes)
+    with open(store_meta_path(pose_path), "w") as f:
+        json.dump(meta, f)
+
+
+def test_convert_and_load(tmp_path):
+    pose_path = str(tmp_path / "task_1_pose.json")
+    data = _write_reference(pose_path)
+    convert_reference(pose_path)
+
+    array, meta = load_pose_store(pose_path)
+    assert isinstance(array, np.memmap)
+    np.testing.assert_array_equal(array, data)
+    with open(pose_path, "rb") as f:
+        assert meta["source_hash"] == hashlib.sha1(f.read()).hexdigest()
+    assert meta["format_version"] == STORE_FORMAT_VERSION
+
+
+def test_new_mtime_with_same_content_keeps_the_store(tmp_path):
+    pose_path = str(tmp_path / "task_1_pose.json")
+    _write_reference(pose_path)
+    convert_reference(pose_path)
+    stat = os.stat(pose_path)
+    # As after a git checkout or a copy into a container image
+    os.utime(pose_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert load_pose_store(pose_path) is not None
+
+
+@pytest.mark.parametrize("same_size", [True, False])
+def test_changed_json_makes_the_store_stale(tmp_path, same_size):
+    pose_path = str(tmp_path / "task_1_pose.json")
+    _write_reference(pose_path)
+    convert_reference(pose_path)
+    with open(pose_path, "r") as f:
+        text = f.read()
+    # "0." -> "1." keeps the size; appending a space does not
+    text = text.replace("0.", "1.", 1) if same_size else text + " "
+    with open(pose_path, "w") as f:
+        f.write(text)
+    assert load_pose_store(pose_path) is None
+
+
+@pytest.mark.parametrize(
+    "damage",
+    [
+        lambda p: os.remove(store_meta_path(p)),
+        lambda p: open(store_meta_path(p), "w").close(),
+        lambda p: _set_meta(p, format_version=STORE_FORMAT_VERSION + 1),
+    ],
+)
+def test_unusable_metadata(tmp_path, damage):
+    pose_path = str(tmp_path / "task_1_pose.json")
+    _write_reference(pose_path)
+    convert_reference(pose_path)
+    damage(pose_path)
+    assert load_pose_store(pose_path) is None
+
+
+@pytest.fixture
+def reference_dir(tmp_path, monkeypatch):
+    """Work in a temporary backend directory with an empty reference folder."""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(REFERENCE_FOLDER)
+    reference_index.refresh()
+    yield tmp_path
+    monkeypatch.undo()
+    reference_index.refresh()
+
+
+def _store_only_reference(exercise_id: str) -> np.ndarray:
+    pose_path = os.path.join(REFERENCE_FOLDER, f"task_{exercise_id}_pose.json")
+    data = np.random.default_rng(1).random((4, 33, 3)).astype(np.float32)
+    save_pose_store(pose_path, data, source_hash="f" * 40)
+    reference_index.refresh()
+    return data
+
+
+def test_store_only_reference_is_loaded(reference_dir):
+    data = _store_only_reference("9001")
+
+    reference = reference_loader.load_reference("9001", generate=False)
+    np.testing.assert_array_equal(reference.sequence.data, data)
+    assert reference.content_hash == "f" * 40
+    frames = reference_loader.load_reference_pose("9001")
+    np.testing.assert_allclose(PoseSequence.from_frames(frames).data, data)
+
+
+def test_unusable_store_without_json_is_reported(reference_dir):
+    _store_only_reference("9002")
+    os.remove(store_meta_path(os.path.join(REFERENCE_FOLDER, "task_9002_pose.json")))
+    reference_index.refresh()
+
+    with pytest.raises(RuntimeError, match="no .* to fall back to"):
+        reference_loader.load_reference("9002", generate=False)
+    with pytest.raises(RuntimeError, match="unusable"):
+        reference_loader.load_reference_pose("9002")
+
+
+def test_store_path_naming():
+    assert store_path("reference_poses/x_pose.json") == "reference_poses/x_pose.npy"
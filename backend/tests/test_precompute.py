@@ -0,0 +1,180 @@
+"""
+Deploy-time reference precomputation (precompute.py): which exercises are
+skipped, adopted or extracted again, and how video downloads fail.
+MediaPipe and the network are replaced by fakes.
+Run from backend/: python -m pytest tests
+"""
+
+import json
+import os
+
+import numpy as np
+import pytest
+import requests
+
+from utils.PoseTracker import precompute
+from utils.PoseTracker.pose_store import file_sha1, frames_from_array
+from utils.PoseTracker.reference_index import (
+    REFERENCE_FOLDER,
+    VIDEO_FOLDER,
+    reference_index,
+    store_path,
+)
+
+EXERCISE = {"id": "9101", "name": "Test Stretch", "videolink": "https://x/clip.mp4"}
+VIDEO_PATH = os.path.join(VIDEO_FOLDER, "clip.mp4")
+
+
+def _frames(seed: int = 0):
+    return frames_from_array(np.random.default_rng(seed).random((3, 33, 3)))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Temporary backend directory with a video and a fake extractor."""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(REFERENCE_FOLDER)
+    os.makedirs(VIDEO_FOLDER)
+    with open(VIDEO_PATH, "wb") as f:
+        f.write(b"video v1")
+    extractions = []
+
+    def fake_extract(video_path, out_json_path, stats=None, **kwargs):
+        extractions.append(out_json_path)
+        frames = _frames(len(extractions))
+        with open(out_json_path, "w") as f:
+            json.dump(frames, f)
+        return frames
+
+    monkeypatch.setattr(precompute, "extract_pose_from_video", fake_extract)
+    reference_index.refresh()
+    yield extractions
+    monkeypatch.undo()
+    reference_index.refresh()
+
+
+def _existing_pose(name: str = "task_9101_pose.json") -> str:
+    path = os.path.join(REFERENCE_FOLDER, name)
+    with open(path, "w") as f:
+        json.dump(_frames(), f)
+    reference_index.refresh()
+    return path
+
+
+def test_missing_reference_is_extracted(workdir):
+    entry = precompute.precompute_exercise(EXERCISE, None)
+    assert entry["status"] == "ok"
+    assert entry["action"] == "extracted"
+    assert entry["video_hash"] == file_sha1(VIDEO_PATH)
+    assert os.path.exists(entry["pose_path"])
+    assert os.path.exists(store_path(entry["pose_path"]))
+    assert workdir == [entry["pose_path"]]
+
+
+def test_reference_without_manifest_entry_is_adopted(workdir):
+    path = _existing_pose()
+    entry = precompute.precompute_exercise(EXERCISE, None)
+    assert (entry["action"], entry["pose_path"]) == ("adopted", path)
+    assert os.path.exists(store_path(path))
+    assert workdir == []
+
+
+def test_unchanged_video_is_skipped_and_changed_one_extracted(workdir):
+    path = _existing_pose()
+    previous = {"status": "ok", "video_hash": file_sha1(VIDEO_PATH), "frames": 3}
+
+    entry = precompute.precompute_exercise(EXERCISE, previous)
+    assert entry["action"] == "unchanged"
+    assert entry["frames"] == 3
+    assert workdir == []
+
+    with open(VIDEO_PATH, "wb") as f:
+        f.write(b"video v2")
+    entry = precompute.precompute_exercise(EXERCISE, previous)
+    # The file the loader serves is overwritten
+    assert (entry["action"], entry["pose_path"]) == ("extracted", path)
+    assert workdir == [path]
+
+
+def test_failed_entry_is_retried(workdir):
+    _existing_pose()
+    previous = {"status": "error", "video_hash": file_sha1(VIDEO_PATH)}
+    assert precompute.precompute_exercise(EXERCISE, previous)["action"] == "extracted"
+
+
+def test_force_extracts_unchanged_video(workdir):
+    _existing_pose()
+    previous = {"status": "ok", "video_hash": file_sha1(VIDEO_PATH)}
+    entry = precompute.precompute_exercise(EXERCISE, previous, force=True)
+    assert entry["action"] == "extracted"
+
+
+def test_download_error(workdir):
+    os.remove(VIDEO_PATH)
+    entry = precompute.precompute_exercise(EXERCISE, None, download_error="offline")
+    assert entry["status"] == "error"
+    assert "offline" in entry["error"]
+
+    # An existing pose file is kept
+    path = _existing_pose()
+    entry = precompute.precompute_exercise(EXERCISE, None, download_error="offline")
+    assert (entry["status"], entry["pose_path"]) == ("ok", path)
+
+
+def test_manifest_round_trip(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    assert precompute.load_manifest(path) == {"exercises": {}}
+    precompute.save_manifest({"exercises": {"1": {"status": "ok"}}}, path)
+    manifest = precompute.load_manifest(path)
+    assert manifest["exercises"] == {"1": {"status": "ok"}}
+    assert "updated_at" in manifest
+    assert not os.path.exists(path + ".tmp")
+
+
+class _FakeResponse:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for chunk in self.chunks:
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+
+
+def test_shared_videos_are_downloaded_once(workdir, monkeypatch):
+    os.remove(VIDEO_PATH)
+    urls = []
+
+    def fake_get(url, **kwargs):
+        urls.append(url)
+        return _FakeResponse([b"data"])
+
+    monkeypatch.setattr(precompute.requests, "get", fake_get)
+    exercises = [EXERCISE, {**EXERCISE, "id": "9102"}, {**EXERCISE, "id": "9103"}]
+    assert precompute.download_videos(exercises, workers=3) == {}
+    assert urls == [EXERCISE["videolink"]]
+    with open(VIDEO_PATH, "rb") as f:
+        assert f.read() == b"data"
+
+
+@pytest.mark.parametrize(
+    "error", [OSError(28, "No space left on device"), requests.ConnectionError("x")]
+)
+def test_failed_download_is_reported_and_cleaned_up(workdir, monkeypatch, error):
+    os.remove(VIDEO_PATH)
+    monkeypatch.setattr(
+        precompute.requests, "get", lambda url, **kw: _FakeResponse([b"da", error])
+    )
+    errors = precompute.download_videos([EXERCISE])
+    assert list(errors) == [VIDEO_PATH]
+    assert os.listdir(VIDEO_FOLDER) == []
@@ -0,0 +1,149 @@
+"""
+On-demand reference extraction (reference_loader._extract_reference): one
+extraction per pose path however many callers miss it, shared failures, and
+the files load_reference leaves behind. MediaPipe is replaced by fakes.
+Run from backend/: python -m pytest tests
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from utils.PoseTracker import reference_loader
+from utils.PoseTracker.pose_store import frames_from_array
+from utils.PoseTracker.reference_index import (
+    REFERENCE_FOLDER,
+    VIDEO_FOLDER,
+    reference_index,
+    store_path,
+)
+
+CALLERS = 8
+
+
+def _frames():
+    return frames_from_array(np.random.default_rng(0).random((3, 33, 3)))
+
+
+def _run_concurrently(fn, *args):
+    """Call fn(*args) from CALLERS threads at once; (results, exceptions)."""
+    barrier = threading.Barrier(CALLERS)
+
+    def call():
+        barrier.wait()
+        try:
+            return fn(*args), None
+        except Exception as e:
+            return None, e
+
+    with ThreadPoolExecutor(CALLERS) as executor:
+        outcomes = list(executor.map(lambda _: call(), range(CALLERS)))
+    return [r for r, _ in outcomes], [e for _, e in outcomes]
+
+
+@pytest.fixture
+def generate(monkeypatch):
+    """Fake _generate_reference: slow enough for every caller to pile up."""
+    calls = []
+    outcome = {"error": None}
+
+    def fake_generate(exercise_id, path, found_video_path):
+        calls.append(path)
+        time.sleep(0.2)
+        if outcome["error"]:
+            raise RuntimeError(outcome["error"])
+        return _frames()
+
+    monkeypatch.setattr(reference_loader, "_generate_reference", fake_generate)
+    return calls, outcome
+
+
+def test_concurrent_misses_share_one_extraction(tmp_path, generate):
+    calls, _ = generate
+    path = str(tmp_path / "exercise_1_pose.json")
+    results, errors = _run_concurrently(
+        reference_loader._extract_reference, "1", path, "video.mp4"
+    )
+    assert calls == [path]
+    assert errors == [None] * CALLERS
+    assert all(r == _frames() for r in results)
+    assert reference_loader._extractions == {}
+
+
+def test_failure_is_shared_and_remembered(tmp_path, generate, monkeypatch):
+    calls, outcome = generate
+    outcome["error"] = "no pose detected"
+    path = str(tmp_path / "exercise_2_pose.json")
+
+    _, errors = _run_concurrently(
+        reference_loader._extract_reference, "2", path, "video.mp4"
+    )
+    assert len(calls) == 1
+    assert all(
+        isinstance(e, RuntimeError) and "no pose detected" in str(e) for e in errors
+    )
+
+    # Within the TTL the failure is re-raised without extracting again
+    with pytest.raises(RuntimeError, match="no pose detected"):
+        reference_loader._extract_reference("2", path, "video.mp4")
+    assert len(calls) == 1
+
+    # After it, extraction is tried again
+    now = time.monotonic() + reference_loader.EXTRACTION_FAILURE_TTL_S + 1
+    monkeypatch.setattr(reference_loader.time, "monotonic", lambda: now)
+    outcome["error"] = None
+    assert reference_loader._extract_reference("2", path, "video.mp4") == _frames()
+    assert len(calls) == 2
+    assert path not in reference_loader._failed_extractions
+
+
+def test_file_written_in_the_meantime_is_not_extracted_again(tmp_path, generate):
+    calls, _ = generate
+    path = tmp_path / "exercise_3_pose.json"
+    path.write_text("[]")
+    assert reference_loader._extract_reference("3", str(path), "video.mp4") is None
+    assert calls == []
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Temporary backend directory with one local reference video."""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(VIDEO_FOLDER)
+    with open(os.path.join(VIDEO_FOLDER, "exercise_9201.mp4"), "wb") as f:
+        f.write(b"video")
+    reference_index.refresh()
+    yield tmp_path
+    monkeypatch.undo()
+    reference_index.refresh()
+
+
+def test_load_reference_extracts_once_and_writes_the_store(workdir, monkeypatch):
+    extractions = []
+
+    def fake_extract(video_path, out_json_path, **kwargs):
+        extractions.append(video_path)
+        time.sleep(0.2)
+        with open(out_json_path, "w") as f:
+            json.dump(_frames(), f)
+        return _frames()
+
+    monkeypatch.setattr(reference_loader, "extract_pose_from_video", fake_extract)
+    results, errors = _run_concurrently(reference_loader.load_reference, "9201")
+
+    assert errors == [None] * CALLERS
+    assert extractions == [os.path.join(VIDEO_FOLDER, "exercise_9201.mp4")]
+    path = os.path.join(REFERENCE_FOLDER, "exercise_9201_pose.json")
+    assert os.path.exists(store_path(path))
+    assert len({r.content_hash for r in results}) == 1
+    assert results[0].sequence.data.shape == (3, 33, 3)
+
+    # Later lookups find the file; workers never extract
+    assert reference_loader.load_reference("9201", generate=False).path == path
+    with pytest.raises(FileNotFoundError):
+        reference_loader.load_reference("9202", generate=False)
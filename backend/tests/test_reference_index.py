@@ -0,0 +1,73 @@
+"""
+Reference file index (reference_index.py): folders are re-scanned only when
+their mtime changes, and exercises resolve to the files found by the scan.
+Run from backend/: python -m pytest tests
+"""
+
+import os
+
+import pytest
+
+from utils.PoseTracker.reference_index import (
+    ReferenceIndex,
+    compact_reference_path,
+    store_meta_path,
+    store_path,
+)
+
+
+def _age(folder: str) -> None:
+    """Move a folder's mtime out of the racy window, as if written long ago."""
+    old = os.stat(folder).st_mtime_ns - 10 * 10**9
+    os.utime(folder, ns=(old, old))
+
+
+@pytest.fixture
+def index(tmp_path):
+    poses, videos = str(tmp_path / "poses"), str(tmp_path / "videos")
+    os.makedirs(poses)
+    os.makedirs(videos)
+    with open(os.path.join(poses, "a_pose.json"), "w") as f:
+        f.write("[]")
+    _age(poses)
+    _age(videos)
+    return ReferenceIndex(folders=(poses, videos), poll_interval_s=0), poses
+
+
+def test_unchanged_folders_are_not_rescanned(index):
+    index, poses = index
+    assert index.exists(os.path.join(poses, "a_pose.json"))
+    for _ in range(5):
+        index.version(os.path.join(poses, "a_pose.json"))
+    assert index.scans == 1
+    assert index.checks == 6
+
+
+def test_renamed_file_triggers_a_rescan(index):
+    index, poses = index
+    index.refresh()
+    scans = index.scans
+    tmp = os.path.join(poses, "b_pose.json.tmp")
+    with open(tmp, "w") as f:
+        f.write("[]")
+    os.replace(tmp, os.path.join(poses, "b_pose.json"))
+    assert index.exists(os.path.join(poses, "b_pose.json"))
+    assert index.scans == scans + 1
+
+
+def test_recently_changed_folder_is_checked_again(index):
+    index, poses = index
+    with open(os.path.join(poses, "c_pose.json"), "w") as f:
+        f.write("[]")
+    index.refresh()
+    scans = index.scans
+    # Still within the racy window: the next lookup scans again
+    index.exists(os.path.join(poses, "c_pose.json"))
+    assert index.scans == scans + 1
+
+
+def test_reference_file_naming():
+    path = os.path.join("reference_poses", "exercise_1_pose.json")
+    assert store_path(path) == os.path.join("reference_poses", "exercise_1_pose.npy")
+    assert store_meta_path(path).endswith("exercise_1_pose.meta.json")
+    assert compact_reference_path(path).endswith("exercise_1_pose_keyframes.json")
@@ -0,0 +1,64 @@
+"""
+Repetition period estimation and rep segmentation (repetitions.py).
+Run from backend/: python -m pytest tests
+"""
+
+import numpy as np
+
+from utils.PoseTracker.repetitions import (
+    build_rep_template,
+    estimate_period,
+    segment_repetitions,
+    user_repetitions,
+)
+
+
+def _periodic_vecs(period: float, frames: int, seed: int = 0) -> np.ndarray:
+    """(frames, 8) positions moving along one direction with the given period."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(frames)
+    direction = rng.normal(size=8)
+    wave = np.sin(2 * np.pi * t / period)[:, None] * direction
+    return 0.5 + 0.1 * wave + rng.normal(0, 0.002, (frames, 8))
+
+
+def test_estimate_period_finds_the_cycle_not_its_multiples():
+    signal = np.sin(2 * np.pi * np.arange(200) / 20)
+    assert estimate_period(signal) == 20
+
+
+def test_estimate_period_rejects_non_periodic_signals():
+    assert estimate_period(np.linspace(0, 1, 200)) is None
+    assert estimate_period(np.random.default_rng(0).normal(size=200)) is None
+    assert estimate_period(np.sin(np.arange(10))) is None  # too short
+
+
+def test_segment_repetitions_cuts_at_minima():
+    signal = np.sin(2 * np.pi * np.arange(100) / 20)
+    reps = segment_repetitions(signal, 20)
+    assert len(reps) == 4
+    for start, end in reps:
+        assert end - start == 20
+        assert signal[start] == signal[:20].min()
+
+
+def test_segment_repetitions_needs_a_full_period():
+    assert segment_repetitions(np.zeros(10), 20) == []
+
+
+def test_user_reps_follow_the_user_tempo():
+    template = build_rep_template(_periodic_vecs(24, 240))
+    assert template is not None
+    assert template.period == 24
+    assert template.reference_reps >= 8
+
+    # Same motion, performed faster
+    reps, period = user_repetitions(template, _periodic_vecs(16, 120))
+    assert period == 16
+    assert len(reps) >= 5
+    assert all(12 <= end - start <= 20 for start, end in reps)
+
+
+def test_no_template_for_a_single_motion():
+    frames = np.linspace(0, 1, 100)[:, None] * np.ones(8)
+    assert build_rep_template(frames) is None
@@ -0,0 +1,84 @@
+"""
+Resampling of timestamped user sequences to the reference frame rate, in batch
+(resample_pose_sequence) and while streaming (StreamingPoseScorer).
+Run from backend/: python -m pytest tests
+"""
+
+import numpy as np
+import pytest
+
+from utils.PoseTracker.pose_sequence import (
+    REFERENCE_FPS,
+    PoseSequence,
+    resample_pose_sequence,
+)
+from utils.PoseTracker.stream_scorer import StreamingPoseScorer
+
+STEP_MS = 1000.0 / REFERENCE_FPS
+
+
+def _linear_sequence(times_ms: np.ndarray) -> PoseSequence:
+    """Every landmark at x = t (seconds), y = 2t, fully visible."""
+    seconds = np.asarray(times_ms, dtype=np.float32) / 1000.0
+    data = np.empty((len(seconds), 33, 3), dtype=np.float32)
+    data[:, :, 0] = seconds[:, None]
+    data[:, :, 1] = 2 * seconds[:, None]
+    data[:, :, 2] = 1.0
+    return PoseSequence(data)
+
+
+def test_fast_client_is_thinned_to_reference_rate():
+    times = np.arange(0, 1000, 1000 / 60)  # 60 fps for one second
+    resampled = resample_pose_sequence(_linear_sequence(times), times)
+    assert len(resampled) == REFERENCE_FPS
+    np.testing.assert_allclose(
+        resampled.xy[:, 0, 0], np.arange(REFERENCE_FPS) / REFERENCE_FPS, atol=1e-5
+    )
+
+
+def test_dropped_frames_are_interpolated():
+    times = np.array([0.0, STEP_MS, 5 * STEP_MS, 6 * STEP_MS])
+    resampled = resample_pose_sequence(_linear_sequence(times), times)
+    assert len(resampled) == 7
+    np.testing.assert_allclose(
+        resampled.xy[:, 0, 1], 2 * np.arange(7) / REFERENCE_FPS, atol=1e-5
+    )
+
+
+def test_invisible_points_are_not_blended_with_zeros():
+    times = np.array([0.0, 2 * STEP_MS])
+    seq = _linear_sequence(times)
+    seq.data[1, 0] = 0.0  # nose lost in the second frame
+    resampled = resample_pose_sequence(seq, times)
+    # Midway: visible points are blended, the nose copies the nearer frame
+    np.testing.assert_allclose(resampled.xy[1, 1, 0], 1 / REFERENCE_FPS, atol=1e-5)
+    assert resampled.xy[1, 0, 0] in (0.0, seq.xy[0, 0, 0])
+
+
+@pytest.mark.parametrize("times", [[0.0, 10.0], [0.0, 20.0, 10.0], [0, np.nan, 30]])
+def test_bad_timestamps_are_rejected(times):
+    seq = _linear_sequence(np.zeros(3))
+    with pytest.raises(ValueError):
+        resample_pose_sequence(seq, times)
+
+
+def test_streaming_matches_batch_resampling():
+    times = np.cumsum(np.random.default_rng(0).uniform(10, 120, 40))
+    seq = _linear_sequence(times)
+    scorer = StreamingPoseScorer(_linear_sequence(np.arange(60) * STEP_MS))
+    for start in range(0, len(times), 7):
+        scorer.add_frames(
+            PoseSequence(seq.data[start : start + 7]),
+            list(times[start : start + 7]),
+        )
+    streamed = np.concatenate(scorer._chunks, axis=0)
+    np.testing.assert_allclose(
+        streamed, resample_pose_sequence(seq, times).data, atol=1e-5
+    )
+
+
+def test_stream_rejects_switching_timestamp_modes():
+    scorer = StreamingPoseScorer(_linear_sequence(np.arange(10) * STEP_MS))
+    scorer.add_frames(_linear_sequence(np.array([0.0, STEP_MS])), [0.0, STEP_MS])
+    with pytest.raises(ValueError, match="timestamps"):
+        scorer.add_frames(_linear_sequence(np.array([0.0])))
@@ -0,0 +1,66 @@
+"""
+Compare result cache: key derivation, TTL expiry and LRU bound.
+Run from backend/: python -m pytest tests
+"""
+
+import numpy as np
+
+from utils.PoseTracker import result_cache
+from utils.PoseTracker.result_cache import ResultCache, compare_cache_key
+
+PARAMS = dict(user_id="u1", task_id="7", exercise_id="3", reference_version="abc")
+
+
+def _data(seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).random((5, 33, 3)).astype(np.float32)
+
+
+def test_key_depends_on_recording_and_parameters():
+    key = compare_cache_key(_data(), None, **PARAMS)
+    assert key == compare_cache_key(_data().copy(), None, **PARAMS)
+    assert key != compare_cache_key(_data(1), None, **PARAMS)
+    assert key != compare_cache_key(_data(), [0.0, 1.0, 2.0, 3.0, 4.0], **PARAMS)
+    assert key != compare_cache_key(
+        _data(), None, **{**PARAMS, "reference_version": "def"}
+    )
+    # Same bytes, other shape
+    assert key != compare_cache_key(_data().reshape(33, 5, 3), None, **PARAMS)
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(result_cache.time, "monotonic", clock)
+    cache = ResultCache(max_entries=4, ttl_s=10)
+    cache.put("k", {"score": 0.5})
+
+    clock.now += 9.9
+    assert cache.get("k") == {"score": 0.5}
+    clock.now += 0.2
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResultCache(max_entries=2, ttl_s=60)
+    cache.put("a", {"score": 1})
+    cache.put("b", {"score": 2})
+    cache.get("a")
+    cache.put("c", {"score": 3})
+    assert cache.get("b") is None
+    assert cache.get("a") == {"score": 1}
+    assert cache.get("c") == {"score": 3}
+
+
+def test_disabled_cache_stores_nothing():
+    for cache in (ResultCache(0, 60), ResultCache(8, 0)):
+        cache.put("k", {"score": 1})
+        assert cache.get("k") is None
@@ -0,0 +1,402 @@
+"""
+dtw_engine.py
+
+Vectorized DTW used by pose_compare.
+
+The local cost matrix is built in one broadcast and the accumulation runs row
+by row with the symmetric2 step pattern (the dtw-python default):
+
+    D[i, j] = min(D[i-1, j-1] + 2 c[i, j], D[i-1, j] + c[i, j], D[i, j-1] + c[i, j])
+
+The horizontal term makes each row a prefix scan. Unrolled, it becomes
+D[i, j] = S[j] + min_{k <= j}(A[k] - S[k]), where S is the cumulative row cost
+and A holds the diagonal/vertical candidates, so each row costs one
+np.minimum.accumulate instead of a Python loop over cells.
+"""
+
+import numpy as np
+from typing import List, Optional, Tuple
+
+SAKOE_CHIBA = "sakoechiba"
+ITAKURA = "itakura"
+
+
+def pairwise_distances(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Euclidean distance between every row of a (N, D) and b (M, D) -> (N, M)."""
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    sq = (
+        np.einsum("ij,ij->i", a, a)[:, None]
+        + np.einsum("ij,ij->i", b, b)[None, :]
+        - 2.0 * (a @ b.T)
+    )
+    return np.sqrt(np.maximum(sq, 0.0))
+
+
+def window_ranges(
+    n: int,
+    m: int,
+    window_type: Optional[str] = None,
+    window_size: Optional[int] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Allowed column range [lo[i], hi[i]) for every row of an (n, m) cost matrix.
+
+    window_type:
+        None         - no constraint
+        "sakoechiba" - band of +/- window_size columns around the diagonal
+                       (the diagonal is slope-adjusted when n != m, so unlike
+                       dtw-python's |i - j| <= window_size band it always
+                       reaches (n - 1, m - 1); distances then differ, see
+                       tests/test_dtw_engine.py)
+        "itakura"    - parallelogram with local slopes between 1/2 and 2,
+                       same cells as dtw-python's itakuraWindow
+    """
+    rows = np.arange(n)
+    if window_type is None:
+        lo = np.zeros(n, dtype=np.int64)
+        hi = np.full(n, m, dtype=np.int64)
+    elif window_type == SAKOE_CHIBA:
+        if window_size is None:
+            raise ValueError("sakoechiba window requires window_size")
+        centre = rows * (m - 1) / max(n - 1, 1)
+        lo = np.ceil(centre - window_size).astype(np.int64)
+        hi = np.floor(centre + window_size).astype(np.int64) + 1
+    elif window_type == ITAKURA:
+        lo = np.maximum(np.ceil((rows - 1) / 2.0), m - 2 * n + 2 * rows + 1)
+        hi = np.minimum(2 * rows, np.floor((rows - n + 2 * m) / 2.0)) + 1
+        lo, hi = lo.astype(np.int64), hi.astype(np.int64)
+    else:
+        raise ValueError(f"Unknown DTW window type: {window_type}")
+
+    return np.clip(lo, 0, m), np.clip(hi, 0, m)
+
+
+def _transpose_ranges(
+    lo: np.ndarray, hi: np.ndarray, m: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-column row ranges of a window given as non-decreasing row ranges."""
+    cols = np.arange(m)
+    return (
+        np.searchsorted(hi, cols, side="right"),
+        np.searchsorted(lo, cols, side="right"),
+    )
+
+
+def dtw_distance(
+    cost: np.ndarray,
+    window_type: Optional[str] = None,
+    window_size: Optional[int] = None,
+    abandon_above: Optional[float] = None,
+    ranges: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+    row_weights: Optional[np.ndarray] = None,
+) -> float:
+    """
+    Accumulated symmetric2 DTW distance over a precomputed (n, m) cost matrix.
+    Matches dtw-python's `alignment.distance` for the same costs and window.
+
+    Args:
+        cost: local distance matrix, e.g. from pairwise_distances
+        window_type / window_size: optional global constraint (see window_ranges)
+        abandon_above: stop early and return inf once every partial path in a
+                       row already exceeds this value
+        ranges: explicit per-row [lo, hi) column ranges (non-decreasing),
+                overrides window_type
+        row_weights: optional number of original frames each row stands for
+                     (keyframe durations). Entering row i charges its cost
+                     w[i] - 1 extra times, as if the path held on that column
+                     through the repeated frames; with all weights 1 this is
+                     plain symmetric2, otherwise an upper bound on the DTW of
+                     the expanded rows.
+
+    Returns:
+        The DTW distance, or inf if no path fits the window or it was abandoned.
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    n, m = cost.shape
+    if n == 0 or m == 0:
+        return float("inf")
+    if ranges is None:
+        ranges = window_ranges(n, m, window_type, window_size)
+    if row_weights is not None:
+        # Weighted rows break the symmetry, so the loop stays on the rows
+        extra = np.asarray(row_weights, dtype=np.float64) - 1.0
+    elif n > m:
+        # symmetric2 is symmetric, so loop over the shorter axis
+        cost = cost.T
+        ranges = _transpose_ranges(ranges[0], ranges[1], m)
+        n, m = m, n
+    lo_arr, hi_arr = ranges
+
+    lo, hi = int(lo_arr[0]), int(hi_arr[0])
+    if lo != 0 or hi <= lo:
+        return float("inf")
+    check_abandon = abandon_above is not None and np.isfinite(abandon_above)
+
+    # Rows are stored with a leading inf sentinel so that column j lives at
+    # index j + 1 and the diagonal predecessor of column lo is index lo.
+    # Row-wide cumulative costs are computed once; any constant offset of the
+    # running sum cancels out in the prefix-scan form.
+    running = np.cumsum(cost, axis=1)
+    double_cost = 2.0 * cost
+    prev = np.full(m + 1, np.inf)
+    prev[1 : hi + 1] = running[0, :hi]
+    if row_weights is not None:
+        prev[1 : hi + 1] += extra[0] * cost[0, 0]
+
+    for i in range(1, n):
+        lo, hi = int(lo_arr[i]), int(hi_arr[i])
+        if hi <= lo:
+            return float("inf")
+        best = np.minimum(
+            prev[lo:hi] + double_cost[i, lo:hi], prev[lo + 1 : hi + 1] + cost[i, lo:hi]
+        )
+        if row_weights is not None:
+            best += extra[i] * cost[i, lo:hi]
+        run = running[i, lo:hi]
+        row = run + np.minimum.accumulate(best - run)
+        if check_abandon and row.min() > abandon_above:
+            return float("inf")
+        prev = np.full(m + 1, np.inf)
+        prev[lo + 1 : hi + 1] = row
+
+    return float(prev[m])
+
+
+def dtw_path(
+    a: np.ndarray, b: np.ndarray, ranges: Tuple[np.ndarray, np.ndarray]
+) -> Tuple[float, np.ndarray]:
+    """
+    symmetric2 DTW of frames a (n, D) against b (m, D) restricted to the
+    per-row column ranges [lo[i], hi[i]) (non-decreasing), with its warping path.
+
+    Local costs are computed only inside the corridor, so time and memory are
+    proportional to the number of cells in it rather than n * m.
+
+    Returns:
+        (distance, path) where path is a (k, 2) array of (row, column) cells
+        from (0, 0) to (n - 1, m - 1); (inf, empty) if the corridor has no path.
+    """
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    n, m = len(a), len(b)
+    no_path = (float("inf"), np.zeros((0, 2), dtype=np.int64))
+    if n == 0 or m == 0:
+        return no_path
+    if n > m:
+        # Loop (and backtrack) over the shorter axis
+        dist, path = dtw_path(b, a, _transpose_ranges(ranges[0], ranges[1], m))
+        return dist, path[:, ::-1]
+    lo_arr, hi_arr = ranges
+    if lo_arr[0] != 0 or hi_arr[n - 1] != m:
+        return no_path
+
+    # Per row: whether each cell was reached from the row above (else from the
+    # left) and, if so, whether diagonally
+    from_above: List[np.ndarray] = []
+    from_diag: List[np.ndarray] = []
+    prev, plo, phi = None, 0, 0
+    for i in range(n):
+        lo, hi = int(lo_arr[i]), int(hi_arr[i])
+        if hi <= lo:
+            return no_path
+        cost = np.sqrt(((b[lo:hi] - a[i]) ** 2).sum(axis=1))
+        run = np.cumsum(cost)
+        if prev is None:
+            row = run
+            above = np.zeros(hi - lo, dtype=bool)
+            above[0] = True
+            diag = np.zeros(hi - lo, dtype=bool)
+        else:
+            # ext[k] holds the previous row at column plo - 1 + k
+            ext = np.full(max(hi, phi) - plo + 1, np.inf)
+            ext[1 : phi - plo + 1] = prev
+            diag_cand = ext[lo - plo : hi - plo] + 2.0 * cost
+            vert_cand = ext[lo - plo + 1 : hi - plo + 1] + cost
+            best = np.minimum(diag_cand, vert_cand) - run
+            scan = np.minimum.accumulate(best)
+            row = run + scan
+            above = best <= scan
+            diag = diag_cand <= vert_cand
+        from_above.append(above)
+        from_diag.append(diag)
+        prev, plo, phi = row, lo, hi
+    if not np.isfinite(prev[-1]):
+        return no_path
+
+    # Backtrack one row at a time: walk left to the cell entered from above
+    segments = []
+    j = m - 1
+    for i in range(n - 1, -1, -1):
+        lo = int(lo_arr[i])
+        k = lo + int(np.flatnonzero(from_above[i][: j - lo + 1])[-1])
+        cols = np.arange(k, j + 1)
+        segments.append(np.stack((np.full(len(cols), i), cols), axis=1))
+        j = k - 1 if from_diag[i][k - lo] else k
+    return float(prev[-1]), np.concatenate(segments[::-1], axis=0)
+
+
+def _halve(x: np.ndarray) -> np.ndarray:
+    """Average consecutive pairs of frames (the last frame of an odd count is kept)."""
+    if len(x) % 2:
+        x = np.concatenate((x, x[-1:]), axis=0)
+    return x.reshape(len(x) // 2, 2, -1).mean(axis=1)
+
+
+def _corridor(
+    coarse_path: np.ndarray, n: int, m: int, radius: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Per-row column ranges at full resolution covering every cell of the
+    projected coarse path, widened by radius cells in each direction.
+    """
+    rows = (len(coarse_path) and coarse_path[:, 0].max() + 1) or 0
+    coarse_lo = np.full(rows, np.iinfo(np.int64).max)
+    coarse_hi = np.full(rows, -1)
+    np.minimum.at(coarse_lo, coarse_path[:, 0], coarse_path[:, 1])
+    np.maximum.at(coarse_hi, coarse_path[:, 0], coarse_path[:, 1])
+
+    fine_rows = np.arange(n)
+    lo = 2 * coarse_lo[fine_rows // 2]
+    hi = 2 * coarse_hi[fine_rows // 2] + 2
+    # Both bounds are non-decreasing, so the widened bound is a shifted lookup
+    lo = lo[np.maximum(fine_rows - radius, 0)] - radius
+    hi = hi[np.minimum(fine_rows + radius, n - 1)] + radius
+    lo, hi = np.clip(lo, 0, m), np.clip(hi, 0, m)
+    lo[0], hi[-1] = 0, m
+    return lo, hi
+
+
+def fast_dtw(
+    a: np.ndarray, b: np.ndarray, radius: int = 10, exact_cells: int = 40000
+) -> Tuple[float, np.ndarray]:
+    """
+    Coarse-to-fine approximation of symmetric2 DTW (FastDTW, Salvador & Chan).
+
+    Both sequences are halved recursively until the cost matrix has at most
+    exact_cells cells, aligned exactly there, and at every finer level DTW is
+    only evaluated inside a corridor of +/- radius cells around the projected
+    coarser path. Time and memory are O((n + m) * radius) instead of O(n * m).
+
+    The result is the cost of a valid warping path, so it is never below the
+    exact DTW distance; it is exact whenever the optimal path stays within the
+    corridor. It can overestimate when the best alignment at full resolution
+    differs from the one at half resolution by more than radius frames (e.g.
+    short, fast movements that averaging blurs away); a larger radius narrows
+    the gap at a linear cost.
+
+    Returns:
+        (distance, path) as dtw_path.
+    """
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    n, m = len(a), len(b)
+    if n <= radius + 2 or m <= radius + 2 or n * m <= exact_cells:
+        return dtw_path(
+            a, b, (np.zeros(n, dtype=np.int64), np.full(n, m, dtype=np.int64))
+        )
+    _, coarse_path = fast_dtw(_halve(a), _halve(b), radius)
+    return dtw_path(a, b, _corridor(coarse_path, n, m, radius))
+
+
+class SubsequenceDTW:
+    """
+    Incremental open-begin/open-end DTW of a growing query against any segment
+    of a fixed reference.
+
+    The asymmetric step pattern is used: every query frame is matched exactly
+    once, while the reference may hold, advance by one or skip one frame per
+    step. Each query column depends only on the previous one, so the state is
+    just the last column of accumulated costs plus the reference row each
+    partial path started from; query frames can be appended in any batch size.
+    """
+
+    def __init__(self, n: int):
+        self.n = n
+        self.length = 0
+        self.acc = np.full(n, np.inf)
+        self.start = np.arange(n)
+
+    def update(self, cost: np.ndarray) -> None:
+        """Append query frames given their (n, k) cost columns against the reference."""
+        cost = np.asarray(cost, dtype=np.float64)
+        rows = np.arange(self.n)
+        inf2 = np.full(2, np.inf)
+        for j in range(cost.shape[1]):
+            if self.length == 0:
+                # Open begin: a path may start at any reference frame
+                self.acc = cost[:, j].copy()
+                self.start = rows.copy()
+            else:
+                padded = np.concatenate((inf2, self.acc))
+                # candidates: hold (i), advance (i - 1), skip (i - 2)
+                candidates = np.stack((padded[2:], padded[1:-1], padded[:-2]))
+                step = candidates.argmin(axis=0)
+                self.acc = cost[:, j] + candidates[step, rows]
+                self.start = np.concatenate(((0, 0), self.start))[rows + 2 - step]
+            self.length += 1
+
+    def best(self) -> Tuple[float, int, int]:
+        """
+        Open end: (distance, start_row, end_row) of the best segment so far;
+        distance is the sum of one local cost per query frame.
+        """
+        if self.length == 0 or self.n == 0:
+            return float("inf"), 0, 0
+        end = int(self.acc.argmin())
+        return float(self.acc[end]), int(self.start[end]), end
+
+
+def subsequence_dtw(cost: np.ndarray) -> Tuple[float, int, int]:
+    """
+    Open-begin/open-end DTW of a short query against any segment of a longer
+    reference, in a single O(n * m) pass (see SubsequenceDTW).
+
+    cost is (n reference frames, m query frames).
+
+    Returns:
+        (distance, start_row, end_row) of the best-matching reference segment;
+        distance is the sum of m local costs.
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    state = SubsequenceDTW(cost.shape[0])
+    state.update(cost)
+    return state.best()
+
+
+def lb_kim(cost: np.ndarray, starts: np.ndarray, length: int) -> np.ndarray:
+    """
+    LB_Kim for square windows cost[s : s + length] of a (n, length) cost matrix:
+    every symmetric2 path pays for its first and last cell at least once.
+    """
+    first = cost[starts, 0]
+    if length < 2:
+        return first
+    return first + cost[starts + length - 1, length - 1]
+
+
+def lb_keogh(
+    cost: np.ndarray, starts: np.ndarray, length: int, radius: int
+) -> np.ndarray:
+    """
+    Two-sided LB_Keogh for square windows cost[s : s + length], evaluated on the
+    precomputed cost matrix instead of a coordinate envelope.
+
+    A symmetric2 path enters every row and every column exactly once; a
+    diagonal step (weight 2) enters one of each, a vertical or horizontal step
+    (weight 1) enters one, and the first cell (weight 1) enters both. So
+
+        DTW = sum_i c[entry of row i] + sum_j c[entry of column j] - c[0, 0]
+
+    and replacing each entry cost by the row/column minimum within +/- radius
+    of the diagonal (the envelope) gives a lower bound.
+    """
+    offsets = np.arange(length)
+    blocks = cost[starts[:, None] + offsets[None, :]]  # (windows, length, length)
+    outside = np.abs(offsets[:, None] - offsets[None, :]) > radius
+    blocks = np.where(outside[None], np.inf, blocks)
+    return (
+        blocks.min(axis=2).sum(axis=1)
+        + blocks.min(axis=1).sum(axis=1)
+        - cost[starts, 0]
+    )
@@ -16,50 +16,23 @@ Outputs:
     ]
 """
 
+import argparse
 import cv2
 import mediapipe as mp
 import json
 import numpy as np
-from typing import List, Dict, Optional
+import tempfile
+import time
+from typing import Any, List, Dict, Optional
 import os
+from utils.PoseTracker.landmarks import MP_LANDMARK_NAMES
 
-
-# MediaPipe landmark names in order (33 landmarks)
-MP_LANDMARK_NAMES = [
-    "nose",
-    "left_eye_inner",
-    "left_eye",
-    "left_eye_outer",
-    "right_eye_inner",
-    "right_eye",
-    "right_eye_outer",
-    "left_ear",
-    "right_ear",
-    "mouth_left",
-    "mouth_right",
-    "left_shoulder",
-    "right_shoulder",
-    "left_elbow",
-    "right_elbow",
-    "left_wrist",
-    "right_wrist",
-    "left_pinky",
-    "right_pinky",
-    "left_index",
-    "right_index",
-    "left_thumb",
-    "right_thumb",
-    "left_hip",
-    "right_hip",
-    "left_knee",
-    "right_knee",
-    "left_ankle",
-    "right_ankle",
-    "left_heel",
-    "right_heel",
-    "left_foot_index",
-    "right_foot_index",
-]
+# Inference width of fast mode; MediaPipe crops and scales to 256 px internally
+FAST_INFERENCE_WIDTH = 640
+# Largest difference from a native-width, model_complexity=1 extraction a fast
+# extraction may have to be used as a reference (see extraction_difference):
+# mean x,y error in normalized units and fraction of frames detected in only one
+FAST_MODE_TOLERANCE = {"mean": 0.01, "detection_mismatch": 0.02}
 
 
 def smooth_sequence(frames: List[List[Dict]], window: int = 3) -> List[List[Dict]]:
@@ -103,12 +76,44 @@ def smooth_sequence(frames: List[List[Dict]], window: int = 3) -> List[List[Dict
     return out
 
 
+def _landmark_frame(results) -> List[Dict]:
+    if not results.pose_landmarks:
+        # If no detection, create a frame of zeros (so time-series lengths
+        # remain comparable)
+        return [
+            {"name": MP_LANDMARK_NAMES[i], "x": 0.0, "y": 0.0, "score": 0.0}
+            for i in range(len(MP_LANDMARK_NAMES))
+        ]
+    # landmarks are normalized (x,y in [0,1]) already by MediaPipe
+    lm_list = []
+    for i, lm in enumerate(results.pose_landmarks.landmark):
+        # some landmarks can be missing; mediapipe gives visibility/confidence
+        lm_list.append(
+            {
+                "name": (
+                    MP_LANDMARK_NAMES[i] if i < len(MP_LANDMARK_NAMES) else f"lm_{i}"
+                ),
+                "x": float(lm.x),  # already 0..1 relative to image width
+                "y": float(lm.y),  # already 0..1 relative to image height
+                "score": float(
+                    lm.visibility
+                    if hasattr(lm, "visibility")
+                    else lm.presence if hasattr(lm, "presence") else 1.0
+                ),
+            }
+        )
+    return lm_list
+
+
 def extract_pose_from_video(
     video_path: str,
     out_json_path: str,
     target_fps: Optional[float] = None,
     smoothing_window: int = 1,
     max_frames: Optional[int] = None,
+    inference_width: Optional[int] = None,
+    model_complexity: int = 1,
+    stats: Optional[Dict[str, Any]] = None,
 ) -> List[List[Dict]]:
     """
     Extract pose landmarks from a video and save as JSON.
@@ -119,6 +124,14 @@ def extract_pose_from_video(
         target_fps: if set, sample frames to approximately this fps (else use native fps)
         smoothing_window: integer > 1 to smooth landmark trajectories (optional)
         max_frames: optional cap on number of frames to process (useful for testing)
+        inference_width: if set, sampled frames wider than this are downscaled to it
+            before MediaPipe runs (fast mode, e.g. FAST_INFERENCE_WIDTH)
+        model_complexity: MediaPipe Pose model, 0 (lite), 1 (full) or 2 (heavy)
+        stats: optional dict filled with frames decoded/inferred and seconds per stage
+
+    Frames dropped by target_fps are only grabbed, never decoded into an image.
+    Landmarks are normalized to the frame size, so downscaling keeps them
+    comparable; see FAST_MODE_TOLERANCE.
 
     Returns:
         List of frames; each frame is a list of landmark dicts {name, x, y, score}
@@ -143,58 +156,52 @@ def extract_pose_from_video(
     mp_pose = mp.solutions.pose
     pose = mp_pose.Pose(
         static_image_mode=False,
+        model_complexity=model_complexity,
         min_detection_confidence=0.4,
         min_tracking_confidence=0.4,
     )
 
     frames_output: List[List[Dict]] = []
     frame_idx = 0
+    grabbed = 0
+    decoded = 0
     processed = 0
+    timings = {"grab": 0.0, "decode": 0.0, "preprocess": 0.0, "inference": 0.0}
 
     try:
         while True:
-            ret, frame = cap.read()
+            started = time.perf_counter()
+            ret = cap.grab()
+            timings["grab"] += time.perf_counter() - started
             if not ret:
                 break
+            grabbed += 1
 
             if frame_idx % frame_interval == 0:
+                started = time.perf_counter()
+                ret, frame = cap.retrieve()
+                timings["decode"] += time.perf_counter() - started
+                if not ret:
+                    break
+                decoded += 1
+
+                started = time.perf_counter()
+                if inference_width and frame.shape[1] > inference_width:
+                    height = int(
+                        round(frame.shape[0] * inference_width / frame.shape[1])
+                    )
+                    frame = cv2.resize(
+                        frame, (inference_width, height), interpolation=cv2.INTER_AREA
+                    )
                 # Convert BGR -> RGB
                 image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                timings["preprocess"] += time.perf_counter() - started
+
+                started = time.perf_counter()
                 results = pose.process(image_rgb)
+                timings["inference"] += time.perf_counter() - started
 
-                if results.pose_landmarks:
-                    # landmarks are normalized (x,y in [0,1]) already by MediaPipe
-                    lm_list = []
-                    for i, lm in enumerate(results.pose_landmarks.landmark):
-                        # some landmarks can be missing; mediapipe gives visibility/confidence
-                        lm_list.append(
-                            {
-                                "name": (
-                                    MP_LANDMARK_NAMES[i]
-                                    if i < len(MP_LANDMARK_NAMES)
-                                    else f"lm_{i}"
-                                ),
-                                "x": float(
-                                    lm.x
-                                ),  # already 0..1 relative to image width
-                                "y": float(
-                                    lm.y
-                                ),  # already 0..1 relative to image height
-                                "score": float(
-                                    lm.visibility
-                                    if hasattr(lm, "visibility")
-                                    else lm.presence if hasattr(lm, "presence") else 1.0
-                                ),
-                            }
-                        )
-                else:
-                    # If no detection, create a frame of zeros (so time-series lengths remain comparable)
-                    lm_list = [
-                        {"name": MP_LANDMARK_NAMES[i], "x": 0.0, "y": 0.0, "score": 0.0}
-                        for i in range(len(MP_LANDMARK_NAMES))
-                    ]
-
-                frames_output.append(lm_list)
+                frames_output.append(_landmark_frame(results))
                 processed += 1
 
                 if max_frames and processed >= max_frames:
@@ -214,22 +221,134 @@ def extract_pose_from_video(
     ):
         frames_output = smooth_sequence(frames_output, window=smoothing_window)
 
-    # Write JSON to disk
-    with open(out_json_path, "w") as f:
-        json.dump(frames_output, f)
+    # Write JSON to disk; via a temp file and rename so readers never see a partial file
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(out_json_path) or ".", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(frames_output, f)
+        os.replace(tmp_path, out_json_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
 
+    if stats is not None:
+        stats.update(
+            {
+                "frames_grabbed": grabbed,
+                "frames_decoded": decoded,
+                "frames_inferred": processed,
+                "inference_width": inference_width,
+                "model_complexity": model_complexity,
+                "seconds": {k: round(v, 3) for k, v in timings.items()},
+            }
+        )
     print(
         f"Extracted {len(frames_output)} frames from {video_path} -> {out_json_path} (native_fps={native_fps}, sampled interval={frame_interval})"
     )
+    print(
+        f"[ExtractPose] decoded {decoded} of {grabbed} frames, inferred {processed}"
+        f" (width {inference_width or 'native'}, model_complexity {model_complexity}): "
+        + ", ".join(f"{k} {v:.2f}s" for k, v in timings.items())
+    )
     return frames_output
 
 
-# Example call:
-if __name__ == "__main__":
-    # Example usage:
-    video_file = "reference_videos/veo_demo_task1.mp4"
-    out_json = "reference_poses/task_1_pose.json"
+def extraction_difference(
+    baseline: List[List[Dict]], candidate: List[List[Dict]], min_score: float = 0.5
+) -> Dict[str, float]:
+    """
+    How far an extraction is from a baseline extraction of the same video:
+    mean / p95 / max absolute x,y difference over landmarks with score >=
+    min_score in both, and the fraction of frames detected in only one.
+    """
+    a = np.array([[[lm["x"], lm["y"], lm["score"]] for lm in f] for f in baseline])
+    b = np.array([[[lm["x"], lm["y"], lm["score"]] for lm in f] for f in candidate])
+    frames = min(len(a), len(b))
+    if frames == 0:
+        return {
+            "frames": 0,
+            "mean": 0.0,
+            "p95": 0.0,
+            "max": 0.0,
+            "detection_mismatch": 0.0,
+        }
+    a, b = a[:frames], b[:frames]
+    confident = (a[..., 2] >= min_score) & (b[..., 2] >= min_score)
+    diffs = np.abs(a[..., :2] - b[..., :2])[confident]
+    detected_a = a[..., 2].max(axis=1) > 0
+    detected_b = b[..., 2].max(axis=1) > 0
+    return {
+        "frames": frames,
+        "mean": float(diffs.mean()) if diffs.size else 0.0,
+        "p95": float(np.percentile(diffs, 95)) if diffs.size else 0.0,
+        "max": float(diffs.max()) if diffs.size else 0.0,
+        "detection_mismatch": float(np.mean(detected_a != detected_b)),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Extract pose landmarks from a video")
+    parser.add_argument("video")
+    parser.add_argument("out_json")
     # sample at ~15 fps, smooth with window=5, max 450 frames (30s @15fps)
+    parser.add_argument("--target-fps", type=float, default=15)
+    parser.add_argument("--smoothing-window", type=int, default=5)
+    parser.add_argument("--max-frames", type=int, default=450)
+    parser.add_argument(
+        "--fast",
+        action="store_true",
+        help=f"Same as --inference-width {FAST_INFERENCE_WIDTH}",
+    )
+    parser.add_argument("--inference-width", type=int, default=None)
+    parser.add_argument("--model-complexity", type=int, default=1, choices=[0, 1, 2])
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Also extract at native width with model_complexity 1 and check the "
+        "result is within FAST_MODE_TOLERANCE of it",
+    )
+    args = parser.parse_args(argv)
+
+    settings = {
+        "target_fps": args.target_fps,
+        "smoothing_window": args.smoothing_window,
+        "max_frames": args.max_frames,
+    }
+    inference_width = args.inference_width or (
+        FAST_INFERENCE_WIDTH if args.fast else None
+    )
+    stats: Dict[str, Any] = {}
     frames = extract_pose_from_video(
-        video_file, out_json, target_fps=15, smoothing_window=5, max_frames=450
+        args.video,
+        args.out_json,
+        inference_width=inference_width,
+        model_complexity=args.model_complexity,
+        stats=stats,
+        **settings,
     )
+    print(json.dumps(stats, indent=2))
+    if not args.verify:
+        return
+
+    baseline_path = args.out_json + ".baseline.json"
+    baseline = extract_pose_from_video(args.video, baseline_path, **settings)
+    os.remove(baseline_path)
+    difference = extraction_difference(baseline, frames)
+    within = (
+        difference["mean"] <= FAST_MODE_TOLERANCE["mean"]
+        and difference["detection_mismatch"]
+        <= FAST_MODE_TOLERANCE["detection_mismatch"]
+    )
+    print(json.dumps(difference, indent=2))
+    print(
+        f"[ExtractPose] {'Within' if within else 'Outside'} "
+        f"tolerance {FAST_MODE_TOLERANCE}"
+    )
+    if not within:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
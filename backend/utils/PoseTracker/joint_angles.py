@@ -0,0 +1,96 @@
+"""
+joint_angles.py
+
+Joint-angle features for pose comparison.
+
+Instead of the min-max scaled x/y of every compared point (2 x points
+dimensions), a frame is described by a fixed set of joint angles: elbows,
+shoulders, hips, knees and the neck tilt. Angles do not change when the
+person moves in the frame or stands closer to the camera, and at most
+len(JOINT_ANGLES) values per frame make every DTW cell cheaper.
+
+Each angle is the interior angle at a vertex, in [0, pi], scaled to [0, 1].
+A vertex or end point may be the midpoint of two landmarks (e.g. the neck
+tilt is measured at the middle of the shoulders, between the nose and the
+middle of the hips).
+"""
+
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from utils.PoseTracker.landmarks import LANDMARK_INDEX
+from utils.PoseTracker.pose_sequence import PoseSequence
+
+COORD_FEATURES = "coords"
+ANGLE_FEATURES = "angles"
+
+# name -> (end point, vertex, end point); a tuple of two names is their midpoint
+JOINT_ANGLES: Dict[str, Tuple] = {
+    "left_elbow": ("left_shoulder", "left_elbow", "left_wrist"),
+    "right_elbow": ("right_shoulder", "right_elbow", "right_wrist"),
+    "left_shoulder": ("left_elbow", "left_shoulder", "left_hip"),
+    "right_shoulder": ("right_elbow", "right_shoulder", "right_hip"),
+    "left_hip": ("left_shoulder", "left_hip", "left_knee"),
+    "right_hip": ("right_shoulder", "right_hip", "right_knee"),
+    "left_knee": ("left_hip", "left_knee", "left_ankle"),
+    "right_knee": ("right_hip", "right_knee", "right_ankle"),
+    "neck_tilt": (
+        "nose",
+        ("left_shoulder", "right_shoulder"),
+        ("left_hip", "right_hip"),
+    ),
+}
+ANGLE_NAMES: List[str] = list(JOINT_ANGLES)
+
+
+def _point_pair(point) -> Tuple[int, int]:
+    if isinstance(point, tuple):
+        return LANDMARK_INDEX[point[0]], LANDMARK_INDEX[point[1]]
+    return LANDMARK_INDEX[point], LANDMARK_INDEX[point]
+
+
+# (angles, 3 points, 2 landmarks averaged per point)
+_ANGLE_LANDMARKS = np.asarray(
+    [[_point_pair(p) for p in JOINT_ANGLES[name]] for name in ANGLE_NAMES],
+    dtype=np.int64,
+)
+
+
+def available_angles(point_indices: np.ndarray) -> np.ndarray:
+    """
+    Indices (into ANGLE_NAMES) of the angles whose landmarks are all in
+    point_indices.
+    """
+    inside = np.isin(_ANGLE_LANDMARKS, point_indices)
+    return np.flatnonzero(inside.reshape(len(ANGLE_NAMES), -1).all(axis=1))
+
+
+def angle_vectors(
+    seq: PoseSequence, angle_indices: np.ndarray, min_score: float = 0.2
+) -> np.ndarray:
+    """
+    (frames, len(angle_indices)) joint angles scaled to [0, 1], computed for
+    all frames at once. An angle is undefined in frames where one of its
+    landmarks is not visible; those frames get the angle's mean over the
+    frames where it is defined (0.5 if it never is).
+    """
+    landmarks = _ANGLE_LANDMARKS[angle_indices]  # (K, 3, 2)
+    points = seq.xy[:, landmarks].astype(np.float64).mean(axis=3)  # (F, K, 3, 2)
+    first = points[:, :, 0] - points[:, :, 1]
+    second = points[:, :, 2] - points[:, :, 1]
+    cross = first[..., 0] * second[..., 1] - first[..., 1] * second[..., 0]
+    dot = (first * second).sum(axis=-1)
+    angles = np.arctan2(np.abs(cross), dot) / np.pi
+
+    visible = (seq.scores[:, landmarks] > min_score).reshape(
+        len(seq), len(landmarks), -1
+    )
+    defined = visible.all(axis=2)
+    counts = defined.sum(axis=0)
+    means = np.where(
+        counts > 0,
+        np.where(defined, angles, 0.0).sum(axis=0) / np.maximum(counts, 1),
+        0.5,
+    )
+    return np.where(defined, angles, means).astype(np.float32)
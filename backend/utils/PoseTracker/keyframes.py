@@ -0,0 +1,253 @@
+"""
+keyframes.py
+
+Offline keyframe compaction of reference pose sequences.
+
+References are extracted at 15 fps, and holds or slow breathing produce long
+runs of nearly identical frames. A compact reference keeps only the frames
+where the pose has moved beyond a threshold since the last kept frame, plus
+how many original frames each keyframe stands for. pose_compare consumes the
+durations through a duration-aware DTW, so the reference axis of the DTW
+matrix shrinks by the compression ratio.
+
+Usage (from backend/):
+    python -m utils.PoseTracker.keyframes reference_poses/exercise_3_pose.json
+    python -m utils.PoseTracker.keyframes reference_poses/*.json --threshold 0.03 \\
+        --probe user_poses/user_task12_20250101_120000.json --dry-run
+
+Each run prints the compression ratio and the score drift of the compact
+reference against the full one, and writes <name>_keyframes.json next to the
+source file (unless --dry-run).
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import numpy as np
+from typing import Any, Dict, List, Optional
+
+from utils.PoseTracker.landmarks import landmark_names
+from utils.PoseTracker.pose_sequence import (
+    PoseSequence,
+    as_pose_sequence,
+    normalize_frames,
+)
+from utils.PoseTracker.pose_compare import sliding_window_dtw
+from utils.PoseTracker.reference_index import KEYFRAMES_SUFFIX, compact_reference_path
+
+DEFAULT_THRESHOLD = 0.02  # mean per-point displacement, in normalized pose units
+
+
+class CompactReference:
+    """Keyframes of a reference plus the number of original frames each covers."""
+
+    def __init__(self, sequence: PoseSequence, durations: np.ndarray):
+        self.sequence = sequence
+        self.durations = np.asarray(durations, dtype=np.int64)
+
+    @property
+    def num_frames(self) -> int:
+        """Length of the original sequence."""
+        return int(self.durations.sum())
+
+    @property
+    def compression_ratio(self) -> float:
+        return self.num_frames / max(len(self.sequence), 1)
+
+    def frame_starts(self) -> np.ndarray:
+        """Original frame index at which every keyframe starts."""
+        return np.concatenate(([0], np.cumsum(self.durations)[:-1])).astype(np.int64)
+
+    def expand(self) -> PoseSequence:
+        """Original-length sequence with every keyframe repeated over its duration."""
+        return PoseSequence(np.repeat(self.sequence.data, self.durations, axis=0))
+
+
+def compact_pose_sequence(
+    seq, threshold: float = DEFAULT_THRESHOLD, min_score: float = 0.2
+) -> CompactReference:
+    """
+    Keep a frame whenever the mean displacement of the visible points since the
+    last kept frame exceeds threshold; every dropped frame extends the duration
+    of the keyframe before it.
+    """
+    seq = as_pose_sequence(seq)
+    if not len(seq):
+        return CompactReference(seq, np.zeros(0, dtype=np.int64))
+
+    indices = np.flatnonzero(seq.visible_mask(min_score))
+    vecs = normalize_frames(seq.keypoint_vectors(indices, min_score))
+    pts = vecs.reshape(len(vecs), -1, 2)
+
+    keep = [0]
+    last = pts[0]
+    for f in range(1, len(pts)):
+        displacement = (
+            np.linalg.norm(pts[f] - last, axis=1).mean() if len(indices) else 0.0
+        )
+        if displacement > threshold:
+            keep.append(f)
+            last = pts[f]
+
+    keep_arr = np.asarray(keep, dtype=np.int64)
+    durations = np.diff(np.append(keep_arr, len(seq)))
+    return CompactReference(PoseSequence(seq.data[keep_arr]), durations)
+
+
+def save_compact_reference(
+    compact: CompactReference,
+    path: str,
+    source_hash: str,
+    threshold: float,
+) -> None:
+    """
+    Write the keyframes in the usual frames-of-dicts layout plus their durations.
+    source_hash ties the file to the exact reference it was computed from.
+    """
+    names = landmark_names(range(compact.sequence.data.shape[1]))
+    frames = []
+    for frame in compact.sequence.data:
+        frames.append(
+            [
+                {"name": name, "x": float(x), "y": float(y), "score": float(s)}
+                for name, (x, y, s) in zip(names, frame)
+                if s > 0
+            ]
+        )
+    # Renamed into place, so the reference index notices the new version
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(
+            {
+                "source_hash": source_hash,
+                "threshold": threshold,
+                "durations": compact.durations.tolist(),
+                "frames": frames,
+            },
+            f,
+        )
+    os.replace(tmp_path, path)
+
+
+def load_compact_reference(
+    path: str, source_hash: Optional[str] = None
+) -> Optional[CompactReference]:
+    """
+    Read a compact reference; returns None if the file is missing or was
+    computed from a different version of the reference (source_hash mismatch).
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        payload = json.load(f)
+    if source_hash is not None and payload.get("source_hash") != source_hash:
+        print(f"[Keyframes] Ignoring stale keyframe file: {path}")
+        return None
+    return CompactReference(
+        PoseSequence.from_frames(payload.get("frames", [])),
+        np.asarray(payload.get("durations", []), dtype=np.int64),
+    )
+
+
+def _default_probes(seq: PoseSequence) -> Dict[str, PoseSequence]:
+    """
+    Stand-in user recordings cut from the reference itself: its middle third at
+    normal, faster (0.75x length) and slower (1.25x length) speed, with a little
+    detector-like jitter so an exact copy does not score a perfect motion match.
+    """
+    rng = np.random.default_rng(0)
+    n = len(seq)
+    start, length = n // 3, max(n // 3, 2)
+    probes = {}
+    speeds = (("middle", 1.0), ("middle_fast", 0.75), ("middle_slow", 1.25))
+    for label, factor in speeds:
+        out_len = min(max(int(length * factor), 2), n)
+        idx = np.linspace(start, start + length - 1, out_len).round().astype(np.int64)
+        data = seq.data[np.clip(idx, 0, n - 1)].copy()
+        visible = data[:, :, 2] > 0
+        data[:, :, :2] += np.where(
+            visible[:, :, None], rng.normal(0.0, 0.002, data[:, :, :2].shape), 0.0
+        ).astype(np.float32)
+        probes[label] = PoseSequence(data)
+    return probes
+
+
+def score_drift(
+    reference: PoseSequence,
+    compact: CompactReference,
+    probes: Dict[str, PoseSequence],
+) -> List[Dict[str, Any]]:
+    """DTW score of every probe against the full and the compact reference."""
+    rows = []
+    for label, probe in probes.items():
+        full = sliding_window_dtw(reference, probe)
+        compacted = sliding_window_dtw(
+            compact.sequence, probe, ref_durations=compact.durations
+        )
+        rows.append(
+            {
+                "probe": label,
+                "full_score": full,
+                "compact_score": compacted,
+                "drift": compacted - full,
+            }
+        )
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Compact reference pose files into keyframes with durations"
+    )
+    parser.add_argument("pose_files", nargs="+", help="Reference *_pose.json files")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument(
+        "--probe",
+        action="append",
+        default=[],
+        help=(
+            "User pose JSON to measure score drift with "
+            "(default: slices of the reference)"
+        ),
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Report only")
+    args = parser.parse_args(argv)
+
+    probe_seqs = {}
+    for probe_path in args.probe:
+        with open(probe_path, "r") as f:
+            probe_seqs[os.path.basename(probe_path)] = PoseSequence.from_frames(
+                json.load(f)
+            )
+
+    for pose_path in args.pose_files:
+        if pose_path.endswith(KEYFRAMES_SUFFIX):
+            continue
+        with open(pose_path, "rb") as f:
+            raw = f.read()
+        reference = PoseSequence.from_frames(json.loads(raw))
+        compact = compact_pose_sequence(reference, args.threshold)
+        print(
+            f"[Keyframes] {pose_path}: {compact.num_frames} frames -> "
+            f"{len(compact.sequence)} keyframes "
+            f"(ratio {compact.compression_ratio:.2f}x)"
+        )
+
+        probes = probe_seqs or _default_probes(reference)
+        for row in score_drift(reference, compact, probes):
+            print(
+                f"[Keyframes]   probe {row['probe']}: full {row['full_score']:.4f}, "
+                f"compact {row['compact_score']:.4f}, drift {row['drift']:+.4f}"
+            )
+
+        if not args.dry_run:
+            out_path = compact_reference_path(pose_path)
+            save_compact_reference(
+                compact, out_path, hashlib.sha1(raw).hexdigest(), args.threshold
+            )
+            print(f"[Keyframes]   wrote {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+keypoint_schemas.py
+
+Registry of the keypoint layouts pose data arrives in, with precomputed
+integer index maps between them.
+
+PoseSequence arrays always use the MediaPipe 33-landmark layout (the
+references are extracted with MediaPipe). Browser recordings come from
+MoveNet, whose 17 keypoints are a subset of it. With a schema known, a
+(frames, keypoints, 3) array in that schema's order is moved into the
+PoseSequence layout with a single fancy-index assignment instead of a name
+lookup per keypoint per frame.
+"""
+
+from functools import lru_cache
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utils.PoseTracker.landmarks import MP_LANDMARK_NAMES
+
+
+class KeypointSchema:
+    """An ordered list of keypoint names produced by one pose model."""
+
+    def __init__(self, name: str, keypoint_names: Sequence[str]):
+        self.name = name
+        self.keypoint_names: Tuple[str, ...] = tuple(keypoint_names)
+        self.index: Dict[str, int] = {
+            kp: i for i, kp in enumerate(self.keypoint_names)
+        }
+
+    def __len__(self) -> int:
+        return len(self.keypoint_names)
+
+    def __repr__(self) -> str:
+        return f"KeypointSchema({self.name!r}, {len(self)} keypoints)"
+
+
+MEDIAPIPE_33 = KeypointSchema("mediapipe33", MP_LANDMARK_NAMES)
+
+# MoveNet SinglePose output order
+MOVENET_17 = KeypointSchema(
+    "movenet17",
+    [
+        "nose",
+        "left_eye",
+        "right_eye",
+        "left_ear",
+        "right_ear",
+        "left_shoulder",
+        "right_shoulder",
+        "left_elbow",
+        "right_elbow",
+        "left_wrist",
+        "right_wrist",
+        "left_hip",
+        "right_hip",
+        "left_knee",
+        "right_knee",
+        "left_ankle",
+        "right_ankle",
+    ],
+)
+
+SCHEMAS: Dict[str, KeypointSchema] = {
+    schema.name: schema for schema in (MOVENET_17, MEDIAPIPE_33)
+}
+
+# Layout of PoseSequence arrays
+CANONICAL_SCHEMA = MEDIAPIPE_33
+
+
+def get_schema(name: str) -> KeypointSchema:
+    """Look up a schema by name ("movenet17" or "mediapipe33")."""
+    schema = SCHEMAS.get(name)
+    if schema is None:
+        raise ValueError(
+            f"Unknown keypoint schema: {name} (expected one of {', '.join(SCHEMAS)})"
+        )
+    return schema
+
+
+def detect_schema(first_frame: Sequence) -> Optional[KeypointSchema]:
+    """
+    Guess the schema of a recording from its first frame: a list of
+    {name, ...} dicts (the smallest schema containing every name wins) or a
+    dense list of [x, y, score] rows (matched by keypoint count).
+    """
+    if not first_frame:
+        return None
+    candidates = sorted(SCHEMAS.values(), key=len)
+    if isinstance(first_frame[0], dict):
+        names = {kp.get("name") for kp in first_frame}
+        for schema in candidates:
+            if names <= schema.index.keys():
+                return schema
+        return None
+    for schema in candidates:
+        if len(first_frame) == len(schema):
+            return schema
+    return None
+
+
+def _shared_columns(
+    source: KeypointSchema, target: KeypointSchema
+) -> Tuple[np.ndarray, np.ndarray]:
+    shared = [kp for kp in source.keypoint_names if kp in target.index]
+    return (
+        np.asarray([source.index[kp] for kp in shared], dtype=np.int64),
+        np.asarray([target.index[kp] for kp in shared], dtype=np.int64),
+    )
+
+
+@lru_cache(maxsize=None)
+def index_map(
+    source: KeypointSchema, target: KeypointSchema = CANONICAL_SCHEMA
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Columns of the keypoints shared by two registered schemas:
+    (source_cols, target_cols) such that
+    target_array[:, target_cols] = source_array[:, source_cols].
+    Computed once per schema pair.
+    """
+    return _shared_columns(source, target)
+
+
+@lru_cache(maxsize=64)
+def names_index_map(
+    names: Tuple[str, ...], target: KeypointSchema = CANONICAL_SCHEMA
+) -> Tuple[np.ndarray, np.ndarray]:
+    """index_map for an ad-hoc ordered name list (e.g. a pose packet header)."""
+    return _shared_columns(KeypointSchema("", names), target)
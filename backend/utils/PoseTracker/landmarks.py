@@ -0,0 +1,49 @@
+from typing import Dict, List
+
+# MediaPipe landmark names in order (33 landmarks)
+MP_LANDMARK_NAMES = [
+    "nose",
+    "left_eye_inner",
+    "left_eye",
+    "left_eye_outer",
+    "right_eye_inner",
+    "right_eye",
+    "right_eye_outer",
+    "left_ear",
+    "right_ear",
+    "mouth_left",
+    "mouth_right",
+    "left_shoulder",
+    "right_shoulder",
+    "left_elbow",
+    "right_elbow",
+    "left_wrist",
+    "right_wrist",
+    "left_pinky",
+    "right_pinky",
+    "left_index",
+    "right_index",
+    "left_thumb",
+    "right_thumb",
+    "left_hip",
+    "right_hip",
+    "left_knee",
+    "right_knee",
+    "left_ankle",
+    "right_ankle",
+    "left_heel",
+    "right_heel",
+    "left_foot_index",
+    "right_foot_index",
+]
+
+# Fixed landmark index table used by PoseSequence arrays.
+# MoveNet's 17 keypoint names are a subset of these, so both the browser
+# recordings and the MediaPipe references share the same columns.
+LANDMARK_INDEX: Dict[str, int] = {name: i for i, name in enumerate(MP_LANDMARK_NAMES)}
+NUM_LANDMARKS = len(MP_LANDMARK_NAMES)
+
+
+def landmark_names(indices) -> List[str]:
+    """Map landmark indices back to their names."""
+    return [MP_LANDMARK_NAMES[int(i)] for i in indices]
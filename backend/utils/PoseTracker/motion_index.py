@@ -0,0 +1,223 @@
+"""
+motion_index.py
+
+Exercise recognition from motion signatures.
+
+Every reference pose is reduced to a fixed-length signature of its body-joint
+trajectories: the mean normalized pose, the spread of every coordinate, and
+the trajectory resampled to SIGNATURE_FRAMES frames. A user recording is
+matched against every reference over the joints visible in both (see
+signature_points), so a joint the camera does not see neither counts as a
+difference nor shifts the per-frame scaling of the others. Signatures are
+cached per reference and joint set, so a query costs one signature of the
+recording per distinct joint set and a matrix-vector product. No DTW is run,
+so identify() can rank candidate exercises before scoring and flag recordings
+that look like a different exercise than the one they were submitted for.
+
+The index covers the exercises of the catalog whose pose file already
+exists (references are never extracted from video here). It is rebuilt when
+the catalog entries or the reference files change; checking that takes
+lookups in the reference index only, no file reads.
+"""
+
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.exercise_catalog import exercise_catalog
+from utils.PoseTracker.landmarks import LANDMARK_INDEX
+from utils.PoseTracker.pose_sequence import PoseSequence, normalize_frames
+from utils.PoseTracker.reference_index import reference_index, store_path
+from utils.PoseTracker.reference_loader import load_reference
+
+SIGNATURE_FRAMES = 16
+# A joint takes part in a signature when visible in at least this share of frames
+VISIBLE_FRACTION = float(os.getenv("POSE_SIGNATURE_VISIBLE_FRACTION", "0.5"))
+MIN_SIGNATURE_POINTS = 4  # fewer joints in common and a reference is not ranked
+
+SIGNATURE_POINTS = [
+    "nose",
+    "left_shoulder",
+    "right_shoulder",
+    "left_elbow",
+    "right_elbow",
+    "left_wrist",
+    "right_wrist",
+    "left_hip",
+    "right_hip",
+    "left_knee",
+    "right_knee",
+    "left_ankle",
+    "right_ankle",
+]
+_SIGNATURE_INDICES = np.asarray([LANDMARK_INDEX[n] for n in SIGNATURE_POINTS])
+
+
+def signature_points(seq: PoseSequence, min_score: float = 0.2) -> np.ndarray:
+    """Boolean mask over SIGNATURE_POINTS of the joints visible often enough."""
+    if not len(seq):
+        return np.zeros(len(SIGNATURE_POINTS), dtype=bool)
+    visible = seq.scores[:, _SIGNATURE_INDICES] > min_score
+    return visible.mean(axis=0) >= VISIBLE_FRACTION
+
+
+def _filled_vectors(
+    seq: PoseSequence, indices: np.ndarray, min_score: float = 0.2
+) -> np.ndarray:
+    """
+    (frames, len(indices) * 2) x, y of the given landmarks, with the frames in
+    which a point is not visible interpolated from the frames around them.
+    Every point must be visible in at least one frame.
+    """
+    frames = np.arange(len(seq))
+    xy = seq.xy[:, indices].astype(np.float64)
+    visible = seq.scores[:, indices] > min_score
+    for j in range(len(indices)):
+        if not visible[:, j].all():
+            seen = frames[visible[:, j]]
+            for axis in range(2):
+                xy[:, j, axis] = np.interp(frames, seen, xy[seen, j, axis])
+    return xy.reshape(len(seq), -1)
+
+
+def motion_signature(
+    seq: PoseSequence, points: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Fixed-length signature of a pose sequence (any number of frames >= 1) over
+    the joints selected by points, a mask over SIGNATURE_POINTS (default: the
+    ones visible in the sequence, see signature_points).
+    """
+    if points is None:
+        points = signature_points(seq)
+    vecs = normalize_frames(_filled_vectors(seq, _SIGNATURE_INDICES[points]))
+    frames = np.linspace(0, len(vecs) - 1, SIGNATURE_FRAMES)
+    trajectory = np.stack(
+        [np.interp(frames, np.arange(len(vecs)), col) for col in vecs.T], axis=1
+    )
+    # Scaled so the whole trajectory weighs about as much as one pose
+    return np.concatenate(
+        [
+            vecs.mean(axis=0),
+            vecs.std(axis=0),
+            trajectory.ravel() / np.sqrt(SIGNATURE_FRAMES),
+        ]
+    ).astype(np.float64)
+
+
+class MotionIndex:
+    """Signatures of a set of references, computed per joint set on demand."""
+
+    def __init__(self, exercises: List[Dict[str, Any]], sequences: List[PoseSequence]):
+        self.exercises = exercises  # [{"id", "name", "videolink"}] per row
+        self.sequences = sequences
+        self.points = np.stack([signature_points(seq) for seq in sequences])
+        # (joint mask bytes, row) -> signature of that reference over the joints
+        self._signatures: Dict[Tuple[bytes, int], np.ndarray] = {}
+
+    def _signature(self, row: int, points: np.ndarray) -> np.ndarray:
+        key = (points.tobytes(), row)
+        signature = self._signatures.get(key)
+        if signature is None:
+            signature = motion_signature(self.sequences[row], points)
+            self._signatures[key] = signature
+        return signature
+
+    def query(self, seq: PoseSequence, top_k: int = 3) -> List[Dict[str, Any]]:
+        """
+        Closest exercises to a recording, nearest first. Distances are per joint
+        compared, so references sharing fewer joints with it stay comparable.
+        """
+        common = self.points & signature_points(seq)
+        counts = common.sum(axis=1)
+        dists = np.full(len(self.exercises), np.inf)
+        for points in np.unique(common[counts >= MIN_SIGNATURE_POINTS], axis=0):
+            rows = np.flatnonzero((common == points).all(axis=1))
+            signatures = np.stack([self._signature(i, points) for i in rows])
+            diff = signatures - motion_signature(seq, points)
+            dists[rows] = np.linalg.norm(diff, axis=1) / np.sqrt(points.sum())
+        order = [i for i in np.argsort(dists)[:top_k] if np.isfinite(dists[i])]
+        if not order:
+            return []
+        # Relative to the nearest match: 1.0 for it, lower for the others
+        nearest = max(float(dists[order[0]]), 1e-8)
+        return [
+            {
+                "exercise_id": str(self.exercises[i]["id"]),
+                "name": self.exercises[i].get("name", ""),
+                "videolink": self.exercises[i].get("videolink"),
+                "distance": round(float(dists[i]), 4),
+                "relative_similarity": round(nearest / max(float(dists[i]), 1e-8), 4),
+                "points": int(counts[i]),
+            }
+            for i in order
+        ]
+
+
+_index: Optional[MotionIndex] = None
+_index_version: Optional[Tuple] = None
+_index_lock = threading.Lock()
+
+
+def _pose_file(exercise: Dict[str, Any]) -> Optional[str]:
+    videolink = exercise.get("videolink")
+    video_filename = videolink.split("/")[-1] if videolink else None
+    path, _ = reference_index.resolve(str(exercise.get("id")), video_filename)
+    return path
+
+
+def get_motion_index() -> Optional[MotionIndex]:
+    """
+    Index over every exercise with a pose file; None if there is none.
+    Rebuilt only when an exercise's entry or its reference files change.
+    """
+    global _index, _index_version
+    exercises = []
+    version = []
+    for exercise in exercise_catalog.all():
+        path = _pose_file(exercise)
+        if path is None:
+            continue
+        entry = {k: exercise.get(k) for k in ("id", "name", "videolink")}
+        exercises.append(entry)
+        version.append(
+            (
+                tuple(entry.values()),
+                path,
+                reference_index.version(path),
+                reference_index.version(store_path(path)),
+            )
+        )
+    version = tuple(version)
+    if version == _index_version:
+        return _index
+
+    with _index_lock:
+        if version != _index_version:
+            rows, sequences = [], []
+            for entry in exercises:
+                try:
+                    reference = load_reference(
+                        str(entry["id"]), entry["videolink"], generate=False
+                    )
+                except FileNotFoundError:
+                    continue
+                if len(reference.sequence):
+                    rows.append(entry)
+                    sequences.append(reference.sequence)
+            _index = MotionIndex(rows, sequences) if rows else None
+            _index_version = version
+            print(f"[MotionIndex] Built index over {len(rows)} references")
+        return _index
+
+
+def identify(seq: PoseSequence, top_k: int = 3) -> List[Dict[str, Any]]:
+    """Rank the exercises a recording most resembles (empty without an index)."""
+    if not len(seq):
+        return []
+    index = get_motion_index()
+    if index is None:
+        return []
+    return index.query(seq, top_k)
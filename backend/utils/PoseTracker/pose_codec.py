@@ -0,0 +1,91 @@
+"""
+pose_codec.py
+
+Compact binary encoding of a user pose sequence, as an alternative to the
+JSON list of frames of {name, x, y, score} dicts.
+
+Layout (little-endian):
+    magic       4 bytes   b"BFPS"
+    version     uint16    1
+    header_len  uint32    length of the JSON header in bytes
+    header      JSON      {"names": [landmark names], "frames": F,
+                           "timestamps": [F capture times in ms] (optional)}
+                          or {"schema": "movenet17", "frames": F, ...} for
+                          columns in a registered schema's order
+                          (keypoint_schemas)
+    payload     float32   (F, len(names), 3) array of x, y, score
+
+Landmark names are sent once, so decoding is a single np.frombuffer with no
+per-landmark Python objects.
+"""
+
+import json
+import struct
+import numpy as np
+from typing import List, Optional, Sequence, Union
+
+from utils.PoseTracker.keypoint_schemas import KeypointSchema, get_schema
+from utils.PoseTracker.pose_sequence import PoseSequence
+
+MAGIC = b"BFPS"
+VERSION = 1
+_PREFIX = struct.Struct("<4sHI")
+
+
+def encode_pose_packet(
+    names: Union[List[str], KeypointSchema],
+    values: np.ndarray,
+    timestamps: Optional[Sequence[float]] = None,
+) -> bytes:
+    """
+    Pack a (frames, len(names), 3) x/y/score array into the binary format.
+    names is the column list, or a registered schema whose order the columns follow.
+    """
+    values = np.ascontiguousarray(values, dtype="<f4")
+    if values.ndim != 3 or values.shape[1:] != (len(names), 3):
+        raise ValueError(
+            f"Expected values of shape (frames, {len(names)}, 3), got {values.shape}"
+        )
+    if isinstance(names, KeypointSchema):
+        header = {"schema": names.name, "frames": values.shape[0]}
+    else:
+        header = {"names": list(names), "frames": values.shape[0]}
+    if timestamps is not None:
+        header["timestamps"] = [float(t) for t in timestamps]
+    header = json.dumps(header).encode("utf-8")
+    return _PREFIX.pack(MAGIC, VERSION, len(header)) + header + values.tobytes()
+
+
+def decode_pose_packet(packet: Union[bytes, bytearray, memoryview]) -> PoseSequence:
+    """Decode a binary pose packet straight into a PoseSequence."""
+    packet = memoryview(packet)
+    if len(packet) < _PREFIX.size:
+        raise ValueError("Pose packet is too short")
+    magic, version, header_len = _PREFIX.unpack_from(packet)
+    if magic != MAGIC:
+        raise ValueError("Not a pose packet (bad magic)")
+    if version != VERSION:
+        raise ValueError(f"Unsupported pose packet version: {version}")
+
+    header_end = _PREFIX.size + header_len
+    header = json.loads(bytes(packet[_PREFIX.size : header_end]).decode("utf-8"))
+    schema = get_schema(header["schema"]) if header.get("schema") else None
+    names = schema.keypoint_names if schema else header.get("names") or []
+    num_frames = int(header.get("frames", 0))
+
+    expected = num_frames * len(names) * 3 * 4
+    if len(packet) - header_end != expected:
+        raise ValueError(
+            f"Pose packet payload is {len(packet) - header_end} bytes, "
+            f"expected {expected}"
+        )
+    values = np.frombuffer(packet, dtype="<f4", offset=header_end).reshape(
+        num_frames, len(names), 3
+    )
+    if schema is not None:
+        seq = PoseSequence.from_schema_array(values, schema)
+    else:
+        seq = PoseSequence.from_named_array(names, values)
+    if header.get("timestamps") is not None:
+        seq.timestamps = np.asarray(header["timestamps"], dtype=np.float64)
+    return seq
@@ -1,45 +1,87 @@
 import numpy as np
-from dtw import dtw
-from typing import List, Set, Dict, Any, Tuple
+from typing import List, Set, Dict, Any, Hashable, Optional, Tuple, Union
 import os
 import json
+import time
 import requests
-
-
-def get_all_visible_points(seq: List[List[dict]], min_score: float = 0.2) -> Set[str]:
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from utils.PoseTracker.dtw_engine import (
+    SAKOE_CHIBA,
+    dtw_distance,
+    dtw_path,
+    fast_dtw,
+    lb_keogh,
+    lb_kim,
+    pairwise_distances,
+    subsequence_dtw,
+    window_ranges,
+)
+from utils.PoseTracker.joint_angles import (
+    ANGLE_FEATURES,
+    ANGLE_NAMES,
+    COORD_FEATURES,
+    angle_vectors,
+    available_angles,
+)
+from utils.PoseTracker.landmarks import LANDMARK_INDEX, landmark_names
+from utils.PoseTracker.reference_cache import prepare_reference
+from utils.PoseTracker.pose_sequence import (
+    PoseSequence,
+    as_pose_sequence,
+    common_visible_indices,
+    motion_vectors,
+    normalize_frames,
+    resample_pose_sequence,
+)
+from utils.PoseTracker.repetitions import get_rep_template, user_repetitions
+
+PoseInput = Union[PoseSequence, List[List[dict]]]
+
+# Alignment search modes for sliding_window_dtw / compare_pose_sequences
+WINDOW_MODE = "window"  # DTW per reference window, stride = user length / 5
+SUBSEQUENCE_MODE = "subsequence"  # one open-begin/open-end DTW pass
+MULTIRES_MODE = "multires"  # coarse-to-fine alignment of the whole recording
+REPS_MODE = "reps"  # every user repetition against a single-rep template
+
+# Recordings longer than this are aligned with MULTIRES_MODE whatever the mode
+MULTIRES_MIN_FRAMES = int(os.getenv("POSE_MULTIRES_MIN_FRAMES", "600"))
+# Corridor half-width in frames around the coarse path (see dtw_engine.fast_dtw)
+MULTIRES_RADIUS = int(os.getenv("POSE_MULTIRES_RADIUS", "10"))
+# Bound on the temporary array of motion_distances (values per chunk of offsets)
+MOTION_CHUNK_CELLS = 1 << 21
+
+# Seconds the Gemini analysis may take before the DTW score is returned alone
+GEMINI_BUDGET_S = float(os.getenv("POSE_GEMINI_BUDGET_S", "4.0"))
+
+# Gemini calls are network-bound, so a few threads are enough; a call that
+# misses its budget keeps its thread until the HTTP timeout
+_gemini_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="gemini")
+
+
+def get_all_visible_points(seq: PoseInput, min_score: float = 0.2) -> Set[str]:
     """
     Get all point names that are visible (score > threshold) in a sequence.
     Returns a set of point names.
     """
-    points: Set[str] = set()
-    for frame in seq:
-        for kp in frame:
-            if kp.get("score", 0) > min_score:
-                points.add(kp.get("name"))
-    return points
+    return as_pose_sequence(seq).visible_points(min_score)
 
 
 def get_common_visible_points(
-    ref_seq: List[List[dict]], user_seq: List[List[dict]], min_score: float = 0.2
+    ref_seq: PoseInput, user_seq: PoseInput, min_score: float = 0.2
 ) -> List[str]:
     """
     Find all point names that are visible (score > threshold) in both sequences.
     Returns a sorted list of common point names.
     """
-    # Collect all point names that appear with sufficient score in reference sequence
-    ref_points = get_all_visible_points(ref_seq, min_score)
-
-    # Collect all point names that appear with sufficient score in user sequence
-    user_points = get_all_visible_points(user_seq, min_score)
-
-    # Return intersection - points visible in both sequences
-    common_points = sorted(list(ref_points.intersection(user_points)))
-    return common_points
+    indices = common_visible_indices(
+        as_pose_sequence(ref_seq), as_pose_sequence(user_seq), min_score
+    )
+    return sorted(landmark_names(indices))
 
 
 def check_point_coverage_threshold(
-    ref_seq: List[List[dict]],
-    user_seq: List[List[dict]],
+    ref_seq: PoseInput,
+    user_seq: PoseInput,
     min_coverage: float = 0.5,
     min_score: float = 0.2,
 ) -> Tuple[bool, float]:
@@ -49,22 +91,24 @@ def check_point_coverage_threshold(
     - is_valid: True if coverage >= min_coverage
     - coverage_ratio: Percentage of reference points present in user sequence (0.0 to 1.0)
     """
-    ref_points = get_all_visible_points(ref_seq, min_score)
-    user_points = get_all_visible_points(user_seq, min_score)
+    ref_mask = as_pose_sequence(ref_seq).visible_mask(min_score)
+    user_mask = as_pose_sequence(user_seq).visible_mask(min_score)
 
-    if not ref_points:
+    num_ref_points = int(ref_mask.sum())
+    if not num_ref_points:
         print("[PoseCompare] Warning: Reference sequence has no visible points")
         return True, 1.0  # Can't validate if reference has no points
 
     # Calculate coverage: how many reference points are present in user sequence
-    common_points = ref_points.intersection(user_points)
-    coverage_ratio = len(common_points) / len(ref_points)
+    num_common_points = int((ref_mask & user_mask).sum())
+    coverage_ratio = num_common_points / num_ref_points
 
     is_valid = coverage_ratio >= min_coverage
 
     print(
-        f"[PoseCompare] Point coverage: {len(common_points)}/{len(ref_points)} reference points detected "
-        f"({coverage_ratio*100:.1f}%), threshold: {min_coverage*100:.1f}%, valid: {is_valid}"
+        f"[PoseCompare] Point coverage: {num_common_points}/{num_ref_points} "
+        f"reference points detected ({coverage_ratio*100:.1f}%), "
+        f"threshold: {min_coverage*100:.1f}%, valid: {is_valid}"
     )
 
     return is_valid, coverage_ratio
@@ -77,44 +121,63 @@ def normalize_keypoints(
     Extract and normalize keypoints for the given point names.
     Only includes points that are visible (score > threshold).
     """
-    vector = []
-    for name in point_names:
-        kp = next(
-            (
-                p
-                for p in frame
-                if p.get("name") == name and p.get("score", 0) > min_score
-            ),
-            None,
-        )
-        if kp:
-            vector.extend([kp["x"], kp["y"]])
-        else:
-            # Point not visible in this frame - use zero
-            vector.extend([0.0, 0.0])
-    return np.array(vector, dtype=np.float32)
+    seq = PoseSequence.from_frames([frame])
+    indices = [LANDMARK_INDEX[name] for name in point_names]
+    return seq.keypoint_vectors(np.asarray(indices, dtype=int), min_score)[0]
 
 
 def normalize_frame(vec):
-    vec2 = vec.reshape(-1, 2)
-    min_xy = vec2.min(axis=0)
-    max_xy = vec2.max(axis=0)
-    scale = max((max_xy - min_xy).max(), 1e-6)
-    return ((vec2 - min_xy) / scale).flatten()
+    return normalize_frames(np.asarray(vec)[None, :])[0]
 
 
 def sliding_window_dtw(
-    ref_seq: List[List[dict]],
-    user_seq: List[List[dict]],
+    ref_seq: PoseInput,
+    user_seq: PoseInput,
     window=60,
     min_point_coverage: float = 0.5,
+    dtw_window: Optional[str] = None,
+    dtw_window_size: Optional[int] = None,
+    mode: str = WINDOW_MODE,
+    diagnostics: Optional[Dict[str, Any]] = None,
+    reference_key: Optional[Hashable] = None,
+    ref_durations: Optional[np.ndarray] = None,
+    features: str = COORD_FEATURES,
 ):
     """
     Compare user_seq to all sliding windows of ref_seq (window ≈ user length).
     Only compares points that are visible in both sequences.
     Returns improved score based on motion similarity.
+
+    dtw_window / dtw_window_size optionally constrain each window's alignment
+    ("sakoechiba" with a radius in frames, or "itakura").
+    mode="subsequence" replaces the window loop with one subsequence-DTW pass
+    that finds the best reference segment at any start and end offset.
+    mode="multires" aligns the whole recording against the whole reference
+    coarse-to-fine (see _multires_score); it is used automatically for
+    recordings longer than MULTIRES_MIN_FRAMES, which the other modes would
+    reject or take O(reference x user) time and memory on.
+    mode="reps" splits both sequences into repetitions and aligns every user
+    rep against one reference rep (see _rep_score); it falls back to the
+    window search when the reference or the recording does not repeat.
+    If a diagnostics dict is passed, the chosen reference segment is recorded in it.
+    With a reference_key (e.g. ReferencePose.cache_key) the normalized reference
+    matrices are reused across calls through the reference cache.
+    ref_durations marks ref_seq as a compact reference (see keyframes.py): the
+    number of original frames each keyframe stands for. Windows then span
+    len(user_seq) original frames and are aligned with duration-aware DTW;
+    reported offsets are in original frames.
+    features="angles" aligns joint angles (see joint_angles.py) of the common
+    points instead of their normalized coordinates.
     """
-    if not ref_seq or not user_seq:
+    if mode not in (WINDOW_MODE, SUBSEQUENCE_MODE, MULTIRES_MODE, REPS_MODE):
+        raise ValueError(f"Unknown pose compare mode: {mode}")
+    if features not in (COORD_FEATURES, ANGLE_FEATURES):
+        raise ValueError(f"Unknown pose compare features: {features}")
+
+    ref_seq = as_pose_sequence(ref_seq)
+    user_seq = as_pose_sequence(user_seq)
+
+    if not len(ref_seq) or not len(user_seq):
         print("[PoseCompare] Empty sequences")
         return 0.0
 
@@ -131,93 +194,424 @@ def sliding_window_dtw(
         return penalty
 
     # Find common visible points across both sequences
-    common_points = get_common_visible_points(ref_seq, user_seq)
+    common_indices = common_visible_indices(ref_seq, user_seq)
 
-    if not common_points:
+    if not len(common_indices):
         print("[PoseCompare] No common points found between sequences")
         return 0.0
 
+    common_points = landmark_names(common_indices)
     print(
         f"[PoseCompare] Comparing {len(common_points)} common points: {common_points}"
     )
 
-    # Normalize sequences using only common points
-    ref_vecs = np.stack(
-        [normalize_frame(normalize_keypoints(f, common_points)) for f in ref_seq]
-    )
-    user_vecs = np.stack(
-        [normalize_frame(normalize_keypoints(f, common_points)) for f in user_seq]
-    )
+    if features == ANGLE_FEATURES:
+        angle_indices = available_angles(common_indices)
+        if len(angle_indices) < 2:
+            print(
+                f"[PoseCompare] Only {len(angle_indices)} joint angles measurable, "
+                f"using coordinates"
+            )
+            features = COORD_FEATURES
+
+    if features == ANGLE_FEATURES:
+        print(
+            f"[PoseCompare] Comparing {len(angle_indices)} joint angles: "
+            f"{[ANGLE_NAMES[i] for i in angle_indices]}"
+        )
+        prepared = prepare_reference(
+            ref_seq, angle_indices, reference_key, features=ANGLE_FEATURES
+        )
+        user_vecs = angle_vectors(user_seq, angle_indices)
+        # position_similarity divides by two dimensions per point
+        num_points = len(angle_indices) / 2
+        feature_key = (ANGLE_FEATURES, tuple(angle_indices))
+    else:
+        # Normalize sequences using only common points
+        prepared = prepare_reference(ref_seq, common_indices, reference_key)
+        user_vecs = normalize_frames(user_seq.keypoint_vectors(common_indices))
+        num_points = len(common_points)
+        feature_key = tuple(common_indices)
+    ref_vecs = prepared.vecs
+    if diagnostics is not None:
+        diagnostics["features"] = features
 
     len_ref, len_user = len(ref_vecs), len(user_vecs)
+    if ref_durations is not None:
+        ref_durations = np.asarray(ref_durations, dtype=np.int64)
+        frame_starts = np.concatenate(([0], np.cumsum(ref_durations)[:-1]))
+        len_keyframes, len_ref = len_ref, int(ref_durations.sum())
+        print(
+            f"[PoseCompare] Reference keyframes: {len_keyframes} ({len_ref} frames)"
+        )
     print(f"[PoseCompare] Reference frames: {len_ref}, User frames: {len_user}")
 
+    if mode == REPS_MODE:
+        if ref_durations is not None:
+            ref_vecs = np.repeat(ref_vecs, ref_durations, axis=0)
+        score = _rep_score(
+            ref_vecs,
+            user_vecs,
+            num_points,
+            coverage_ratio,
+            diagnostics,
+            None if reference_key is None else (reference_key, feature_key),
+        )
+        if score is not None:
+            return score
+        mode = WINDOW_MODE
+        if ref_durations is not None:
+            ref_vecs = prepared.vecs
+
+    if mode != MULTIRES_MODE and len_user > MULTIRES_MIN_FRAMES:
+        print(
+            f"[PoseCompare] {len_user} user frames > {MULTIRES_MIN_FRAMES}, "
+            f"using multi-resolution alignment"
+        )
+        mode = MULTIRES_MODE
+    if mode == MULTIRES_MODE:
+        if ref_durations is not None:
+            ref_vecs = np.repeat(ref_vecs, ref_durations, axis=0)
+        return _multires_score(
+            ref_vecs, user_vecs, num_points, coverage_ratio, diagnostics
+        )
+
     if len_ref < len_user:
         print(f"[PoseCompare] Reference sequence shorter than user sequence")
         return 0.0
 
-    # Calculate motion vectors (velocity) for better motion comparison
-    ref_motion = np.diff(ref_vecs, axis=0)
-    user_motion = np.diff(user_vecs, axis=0)
+    # Calculate motion vectors (velocity), normalized to unit length
+    ref_motion_norm = prepared.motion_norm
+    if ref_durations is not None:
+        # Motion is compared frame by frame, so on the expanded reference
+        ref_motion_norm = motion_vectors(np.repeat(ref_vecs, ref_durations, axis=0))
+    user_motion_norm = motion_vectors(user_vecs)
 
-    # Normalize motion vectors
-    if len(ref_motion) > 0:
-        ref_motion_norm = ref_motion / (
-            np.linalg.norm(ref_motion, axis=1, keepdims=True) + 1e-8
+    best_dist = float("inf")
+    best_motion_dist = float("inf")
+    best_start = 0
+
+    # Frame-to-frame distances for the whole reference at once; every window
+    # is a row slice of this matrix
+    cost = pairwise_distances(ref_vecs, user_vecs)
+
+    # Motion distance for every start offset at once (if we have motion vectors)
+    motion_dists = motion_distances(ref_motion_norm, user_motion_norm)
+
+    if mode == SUBSEQUENCE_MODE:
+        match_dist, best_start, match_end = subsequence_dtw(cost)
+        # The asymmetric step pattern weighs each user frame once, symmetric2
+        # windows weigh a diagonal step twice; rescale to keep scores comparable
+        best_dist = 2.0 * match_dist
+        if ref_durations is not None:
+            # Every user frame is matched once either way; only map the keyframe
+            # rows back to original frames
+            match_end = int(frame_starts[match_end] + ref_durations[match_end] - 1)
+            best_start = int(frame_starts[best_start])
+        match_length = match_end - best_start + 1
+        # Motion is compared frame by frame, so keep the window inside the reference
+        if len(motion_dists):
+            motion_start = min(best_start, len_ref - len_user)
+            best_motion_dist = float(motion_dists[motion_start])
+    elif ref_durations is not None:
+        if len(motion_dists):
+            best_motion_dist = float(motion_dists.min())
+        best_dist, best_start, search = _keyframe_window_search(
+            cost, ref_durations, frame_starts, len_user, dtw_window, dtw_window_size
         )
+        print(
+            f"[PoseCompare] Keyframe windows: {search['windows']}, "
+            f"pruned by lower bound: {search['pruned_by_lower_bound']}, "
+            f"DTW evaluated: {search['dtw_evaluated']}, "
+            f"abandoned early: {search['dtw_abandoned']}"
+        )
+        if diagnostics is not None:
+            diagnostics["window_search"] = search
+        match_length = len_user
     else:
-        ref_motion_norm = ref_motion
+        step = max(1, len_user // 5)
+        ranges = window_ranges(len_user, len_user, dtw_window, dtw_window_size)
+        starts = np.arange(0, len_ref - len_user + 1, step)
+
+        # Motion is cheap to score at every offset, not just the DTW windows
+        if len(motion_dists):
+            best_motion_dist = float(motion_dists.min())
+
+        # Position-based DTW: visit windows by increasing lower bound and skip
+        # any window whose bound cannot beat the best distance found so far
+        radius = dtw_window_size if dtw_window == SAKOE_CHIBA else len_user - 1
+        lower_bounds = np.maximum(
+            lb_kim(cost, starts, len_user),
+            lb_keogh(cost, starts, len_user, radius),
+        )
+        order = np.argsort(lower_bounds, kind="stable")
+        evaluated = abandoned = 0
+        for k in order:
+            if lower_bounds[k] >= best_dist:
+                break
+            start = int(starts[k])
+            # Abandoned as soon as it cannot beat best_dist
+            dist = dtw_distance(
+                cost[start : start + len_user],
+                ranges=ranges,
+                abandon_above=best_dist,
+            )
+            evaluated += 1
+            if dist == float("inf"):
+                abandoned += 1
+            elif dist < best_dist or (dist == best_dist and start < best_start):
+                best_dist = dist
+                best_start = start
+        pruned = len(starts) - evaluated
+        print(
+            f"[PoseCompare] Windows: {len(starts)}, pruned by lower bound: {pruned}, "
+            f"DTW evaluated: {evaluated}, abandoned early: {abandoned}"
+        )
+        if diagnostics is not None:
+            diagnostics["window_search"] = {
+                "windows": int(len(starts)),
+                "pruned_by_lower_bound": int(pruned),
+                "dtw_evaluated": int(evaluated),
+                "dtw_abandoned": int(abandoned),
+            }
+        match_length = len_user
 
-    if len(user_motion) > 0:
-        user_motion_norm = user_motion / (
-            np.linalg.norm(user_motion, axis=1, keepdims=True) + 1e-8
+    print(
+        f"[PoseCompare] Mode: {mode}, matched reference frames "
+        f"{best_start}-{best_start + match_length - 1}"
+    )
+    if diagnostics is not None:
+        diagnostics.update(
+            {
+                "mode": mode,
+                "reference_start": int(best_start),
+                "reference_window": int(match_length),
+                "motion_offsets_scored": int(len(motion_dists)),
+            }
         )
-    else:
-        user_motion_norm = user_motion
+        if ref_durations is not None:
+            diagnostics["reference_keyframes"] = int(len_keyframes)
+
+    return combine_dtw_scores(
+        best_dist, best_motion_dist, len_user, num_points, coverage_ratio
+    )
 
-    best_dist = float("inf")
-    best_motion_dist = float("inf")
-    step = max(1, len_user // 5)
 
-    for start in range(0, len_ref - len_user + 1, step):
-        ref_window = ref_vecs[start : start + len_user]
+def _multires_score(
+    ref_vecs: np.ndarray,
+    user_vecs: np.ndarray,
+    num_points: float,
+    coverage_ratio: float,
+    diagnostics: Optional[Dict[str, Any]] = None,
+) -> float:
+    """
+    Score the whole user recording against the whole reference with
+    coarse-to-fine DTW (dtw_engine.fast_dtw), in time and memory linear in the
+    two lengths. Unlike the window modes, the user may be longer than the
+    reference.
+
+    Accuracy: the distance is that of a valid warping path, so it is never
+    below exact DTW. On the same movement at a different or varying tempo the
+    corridor contains the optimal path and the result is exact. When the
+    recording barely resembles the reference, the coarse path can miss and
+    the distance comes out higher. In synthetic tests with unrelated speeds
+    the mean error was about 2% and the worst case 25%, so those already-low
+    scores drop a little further. POSE_MULTIRES_RADIUS widens the corridor
+    to trade time for accuracy.
+
+    Motion is compared along the warping path rather than at a fixed offset.
+    """
+    len_ref, len_user = len(ref_vecs), len(user_vecs)
+    dist, path = fast_dtw(ref_vecs, user_vecs, MULTIRES_RADIUS)
+    best_motion_dist = _path_motion_distance(ref_vecs, user_vecs, path)
 
-        # Position-based DTW
-        alignment = dtw(
-            ref_window, user_vecs, dist_method=lambda x, y: np.linalg.norm(x - y)
+    print(
+        f"[PoseCompare] Mode: {MULTIRES_MODE}, radius {MULTIRES_RADIUS}, "
+        f"path length {len(path)}"
+    )
+    if diagnostics is not None:
+        diagnostics.update(
+            {
+                "mode": MULTIRES_MODE,
+                "reference_start": 0,
+                "reference_window": int(len_ref),
+                "multires": {"radius": MULTIRES_RADIUS, "path_length": int(len(path))},
+            }
         )
-        dist = getattr(alignment, "distance", alignment)
-
-        # Motion-based comparison (if we have motion vectors)
-        if (
-            start < len(ref_motion_norm)
-            and len(ref_motion_norm) > 0
-            and len(user_motion_norm) > 0
-        ):
-            motion_end = min(start + len_user - 1, len(ref_motion_norm))
-            ref_motion_window = ref_motion_norm[start:motion_end]
-            user_motion_len = min(len(ref_motion_window), len(user_motion_norm))
-
-            if user_motion_len > 0:
-                motion_dist = np.mean(
-                    [
-                        np.linalg.norm(ref_motion_window[i] - user_motion_norm[i])
-                        for i in range(user_motion_len)
-                    ]
-                )
-                if motion_dist < best_motion_dist:
-                    best_motion_dist = motion_dist
-
-        if dist < best_dist:
-            best_dist = dist
 
-    # Improved scoring: combine position and motion similarity
+    # A full symmetric2 path weighs about len_ref + len_user cells where a square
+    # window weighs 2 * len_user, so normalize by the mean of the two lengths
+    return combine_dtw_scores(
+        dist, best_motion_dist, (len_ref + len_user) // 2, num_points, coverage_ratio
+    )
+
+
+def _path_motion_distance(
+    ref_vecs: np.ndarray, user_vecs: np.ndarray, path: np.ndarray
+) -> float:
+    """Mean motion distance over the cells of a warping path (inf if none)."""
+    ref_motion_norm = motion_vectors(ref_vecs)
+    user_motion_norm = motion_vectors(user_vecs)
+    pairs = path[
+        (path[:, 0] < len(ref_motion_norm)) & (path[:, 1] < len(user_motion_norm))
+    ]
+    if not len(pairs):
+        return float("inf")
+    return float(
+        np.linalg.norm(
+            ref_motion_norm[pairs[:, 0]] - user_motion_norm[pairs[:, 1]], axis=1
+        ).mean()
+    )
+
+
+def _rep_score(
+    ref_vecs: np.ndarray,
+    user_vecs: np.ndarray,
+    num_points: float,
+    coverage_ratio: float,
+    diagnostics: Optional[Dict[str, Any]] = None,
+    template_key: Optional[Hashable] = None,
+) -> Optional[float]:
+    """
+    Score a recording rep by rep (see repetitions.py). The reference is reduced
+    to a single-rep template (cached under template_key), the user recording is
+    cut into reps at the same phase of the motion, and each rep is aligned
+    with exact DTW against the template: many DTWs of about period x period
+    cells instead of one over the whole recording. The score is the mean of
+    the per-rep scores.
+
+    Returns None when the reference or the recording has fewer than two
+    (respectively one) reps, so the caller can fall back to another mode.
+    """
+    template = get_rep_template(ref_vecs, template_key)
+    if template is None:
+        print("[PoseCompare] No repetitions found in the reference")
+        return None
+    reps, user_period = user_repetitions(template, user_vecs)
+    if not reps:
+        print("[PoseCompare] No repetitions found in the user recording")
+        return None
+
+    len_template = len(template.vecs)
+    full_rows = (
+        np.zeros(len_template, dtype=np.int64),
+        np.zeros(len_template, dtype=np.int64),
+    )
+    rep_scores = []
+    for start, end in reps:
+        rep_vecs = user_vecs[start:end]
+        full_rows[1][:] = len(rep_vecs)
+        dist, path = dtw_path(template.vecs, rep_vecs, full_rows)
+        rep_scores.append(
+            combine_dtw_scores(
+                dist,
+                _path_motion_distance(template.vecs, rep_vecs, path),
+                (len_template + len(rep_vecs)) // 2,
+                num_points,
+                coverage_ratio,
+            )
+        )
+
+    print(
+        f"[PoseCompare] Mode: {REPS_MODE}, {len(reps)} reps "
+        f"(period {user_period} frames, template {len_template} frames)"
+    )
+    if diagnostics is not None:
+        diagnostics.update(
+            {
+                "mode": REPS_MODE,
+                "reference_start": 0,
+                "reference_window": int(len(ref_vecs)),
+                "reps": {
+                    "count": len(reps),
+                    "scores": [round(float(s), 4) for s in rep_scores],
+                    "boundaries": [[int(a), int(b)] for a, b in reps],
+                    "user_period": int(user_period),
+                    "reference_period": int(template.period),
+                    "template_frames": int(len_template),
+                },
+            }
+        )
+    return float(np.mean(rep_scores))
+
+
+def _keyframe_window_search(
+    cost: np.ndarray,
+    durations: np.ndarray,
+    frame_starts: np.ndarray,
+    len_user: int,
+    dtw_window: Optional[str],
+    dtw_window_size: Optional[int],
+) -> Tuple[float, int, Dict[str, int]]:
+    """
+    Window search over a compact reference. Windows start at the keyframe in
+    effect every len_user // 5 original frames and cover the keyframes spanning
+    len_user original frames, the last one clipped so the durations add up to
+    len_user. Each is aligned with duration-aware DTW (dtw_distance row_weights).
+
+    Returns (best distance, best start in original frames, search counters).
+    """
+    len_ref = int(durations.sum())
+    step = max(1, len_user // 5)
+    offsets = np.arange(0, len_ref - len_user + 1, step)
+    keys = np.unique(np.searchsorted(frame_starts, offsets, side="right") - 1)
+    ends = np.searchsorted(frame_starts, frame_starts[keys] + len_user, side="left")
+
+    # Every path pays for its first and last cell at least once (LB_Kim)
+    lower_bounds = cost[keys, 0] + cost[ends - 1, len_user - 1]
+    order = np.argsort(lower_bounds, kind="stable")
+    best_dist, best_start = float("inf"), 0
+    evaluated = abandoned = 0
+    for k in order:
+        if lower_bounds[k] >= best_dist:
+            break
+        first, end = int(keys[k]), int(ends[k])
+        weights = durations[first:end].copy()
+        weights[-1] = len_user - (frame_starts[end - 1] - frame_starts[first])
+        dist = dtw_distance(
+            cost[first:end],
+            dtw_window,
+            dtw_window_size,
+            abandon_above=best_dist,
+            row_weights=weights,
+        )
+        evaluated += 1
+        start = int(frame_starts[first])
+        if dist == float("inf"):
+            abandoned += 1
+        elif dist < best_dist or (dist == best_dist and start < best_start):
+            best_dist, best_start = dist, start
+
+    search = {
+        "windows": int(len(keys)),
+        "pruned_by_lower_bound": int(len(keys) - evaluated),
+        "dtw_evaluated": int(evaluated),
+        "dtw_abandoned": int(abandoned),
+    }
+    return best_dist, best_start, search
+
+
+def position_similarity(best_dist: float, len_user: int, num_points: float) -> float:
+    """Map a symmetric2 DTW distance to a 0-1 position similarity score."""
     # Normalize distance by number of points and frames
-    num_points = len(common_points)
     normalized_dist = best_dist / (len_user * num_points * 2 + 1e-8)  # 2 for x,y
+    return float(np.exp(-normalized_dist * 10))  # Adjusted scaling
+
 
+def combine_dtw_scores(
+    best_dist: float,
+    best_motion_dist: float,
+    len_user: int,
+    num_points: float,
+    coverage_ratio: float,
+) -> float:
+    """
+    Combine the best position and motion distances into the final DTW score,
+    including the partial-coverage penalty.
+    """
+    # Improved scoring: combine position and motion similarity
     # Position similarity score (0-1)
-    position_score = float(np.exp(-normalized_dist * 10))  # Adjusted scaling
+    position_score = position_similarity(best_dist, len_user, num_points)
 
     # Motion similarity score (0-1)
     if best_motion_dist < float("inf"):
@@ -256,8 +650,46 @@ def sliding_window_dtw(
     return final_score
 
 
+def motion_distances(
+    ref_motion_norm: np.ndarray, user_motion_norm: np.ndarray
+) -> np.ndarray:
+    """
+    Mean distance between the user motion and the reference motion at every
+    start offset, in one array operation.
+
+    The reference windows are a strided view (no copy) of ref_motion_norm; each
+    is compared frame by frame with user_motion_norm, so only the pairs an
+    offset actually uses are computed, with the exact per-frame norm. Offsets
+    are processed in chunks of at most MOTION_CHUNK_CELLS values. Returns an
+    empty array when either sequence has no motion or the reference motion is
+    shorter than the user's.
+    """
+    n, m = len(ref_motion_norm), len(user_motion_norm)
+    if n == 0 or m == 0 or n < m:
+        return np.zeros(0)
+    # (offsets, dims, m) -> (offsets, m, dims)
+    windows = np.lib.stride_tricks.sliding_window_view(
+        ref_motion_norm, m, axis=0
+    ).transpose(0, 2, 1)
+    chunk = max(1, MOTION_CHUNK_CELLS // user_motion_norm.size)
+    return np.concatenate(
+        [
+            np.linalg.norm(windows[i : i + chunk] - user_motion_norm, axis=-1).mean(-1)
+            for i in range(0, len(windows), chunk)
+        ]
+    )
+
+
+def _count_motion_samples(
+    seq: PoseSequence, point_names: List[str], min_score: float = 0.2
+) -> int:
+    indices = [LANDMARK_INDEX[name] for name in point_names]
+    visible = (seq.scores[:, indices] > min_score).any(axis=1)
+    return int((visible[:-1] & visible[1:]).sum())
+
+
 def analyze_motion_with_gemini(
-    ref_seq: List[List[dict]], user_seq: List[List[dict]], task_id: str
+    ref_seq: PoseInput, user_seq: PoseInput, task_id: str, timeout: float = 10
 ) -> float:
     """
     Use Gemini to analyze motion patterns and provide intelligent scoring.
@@ -269,60 +701,18 @@ def analyze_motion_with_gemini(
         return None
 
     try:
+        ref_seq = as_pose_sequence(ref_seq)
+        user_seq = as_pose_sequence(user_seq)
+
         # Prepare summary of motion data for Gemini
         common_points = get_common_visible_points(ref_seq, user_seq)
         if not common_points:
             return None
 
-        # Calculate motion statistics
-        ref_motions = []
-        user_motions = []
-
-        for i in range(len(ref_seq) - 1):
-            if i < len(ref_seq) - 1:
-                frame1 = {
-                    kp["name"]: (kp["x"], kp["y"])
-                    for kp in ref_seq[i]
-                    if kp["name"] in common_points
-                }
-                frame2 = {
-                    kp["name"]: (kp["x"], kp["y"])
-                    for kp in ref_seq[i + 1]
-                    if kp["name"] in common_points
-                }
-                motion = {
-                    name: (
-                        frame2.get(name, (0, 0))[0] - frame1.get(name, (0, 0))[0],
-                        frame2.get(name, (0, 0))[1] - frame1.get(name, (0, 0))[1],
-                    )
-                    for name in common_points
-                    if name in frame1 and name in frame2
-                }
-                if motion:
-                    ref_motions.append(motion)
-
-        for i in range(len(user_seq) - 1):
-            if i < len(user_seq) - 1:
-                frame1 = {
-                    kp["name"]: (kp["x"], kp["y"])
-                    for kp in user_seq[i]
-                    if kp["name"] in common_points
-                }
-                frame2 = {
-                    kp["name"]: (kp["x"], kp["y"])
-                    for kp in user_seq[i + 1]
-                    if kp["name"] in common_points
-                }
-                motion = {
-                    name: (
-                        frame2.get(name, (0, 0))[0] - frame1.get(name, (0, 0))[0],
-                        frame2.get(name, (0, 0))[1] - frame1.get(name, (0, 0))[1],
-                    )
-                    for name in common_points
-                    if name in frame1 and name in frame2
-                }
-                if motion:
-                    user_motions.append(motion)
+        # Calculate motion statistics: frame pairs where a common point is
+        # visible on both sides
+        ref_motion_samples = _count_motion_samples(ref_seq, common_points)
+        user_motion_samples = _count_motion_samples(user_seq, common_points)
 
         # Create a concise summary for Gemini
         summary = {
@@ -330,8 +720,8 @@ def analyze_motion_with_gemini(
             "tracked_points": common_points,
             "reference_frames": len(ref_seq),
             "user_frames": len(user_seq),
-            "reference_motion_samples": len(ref_motions),
-            "user_motion_samples": len(user_motions),
+            "reference_motion_samples": ref_motion_samples,
+            "user_motion_samples": user_motion_samples,
         }
 
         prompt = f"""You are an expert in analyzing human movement and exercise form. 
@@ -361,7 +751,7 @@ Respond ONLY with a JSON object: {{"score": 0.85, "reasoning": "brief explanatio
             "generationConfig": {"temperature": 0.3, "maxOutputTokens": 200},
         }
 
-        resp = requests.post(url, json=payload, timeout=10)
+        resp = requests.post(url, json=payload, timeout=timeout)
         resp.raise_for_status()
         data = resp.json()
         text = (
@@ -397,7 +787,21 @@ Respond ONLY with a JSON object: {{"score": 0.85, "reasoning": "brief explanatio
 
 
 def compare_pose_sequences(
-    ref_seq, user_seq, window=60, task_id: str = "", min_point_coverage: float = 0.5
+    ref_seq,
+    user_seq,
+    window=60,
+    task_id: str = "",
+    min_point_coverage: float = 0.5,
+    dtw_window: Optional[str] = None,
+    dtw_window_size: Optional[int] = None,
+    mode: str = WINDOW_MODE,
+    diagnostics: Optional[Dict[str, Any]] = None,
+    reference_key: Optional[Hashable] = None,
+    use_gemini: bool = True,
+    gemini_budget: Optional[float] = None,
+    ref_durations: Optional[np.ndarray] = None,
+    user_timestamps: Optional[List[float]] = None,
+    features: str = COORD_FEATURES,
 ):
     """
     Compare pose sequences using improved DTW and optionally Gemini.
@@ -410,7 +814,46 @@ def compare_pose_sequences(
         task_id: Task identifier
         min_point_coverage: Minimum percentage of reference points that must be detected (0.0 to 1.0)
                            Default 0.5 means at least 50% of reference points must be present
+        dtw_window: Optional DTW global constraint ("sakoechiba" or "itakura")
+        dtw_window_size: Sakoe-Chiba radius in frames
+        mode: "window" (sliding-window search), "subsequence" (single
+              open-begin/open-end DTW pass over the whole reference),
+              "multires" (coarse-to-fine alignment of the whole recording)
+              or "reps" (per-repetition scoring against a single-rep template)
+        diagnostics: Optional dict filled with details of the alignment,
+                     e.g. the reference start offset and window length picked
+        reference_key: Optional identity of ref_seq (e.g. ReferencePose.cache_key)
+                       used to cache the preprocessed reference between calls
+        use_gemini: Set to False to skip the Gemini analysis for this call
+        gemini_budget: Seconds to wait for Gemini, counted from the start of
+                       the comparison (default GEMINI_BUDGET_S). DTW runs in
+                       the meantime; if Gemini is later, DTW is used alone.
+        ref_durations: Keyframe durations when ref_seq is a compact reference
+                       (see keyframes.py)
+        user_timestamps: Capture time of every user frame in milliseconds
+                         (defaults to user_seq.timestamps). When given, the
+                         user sequence is resampled to the reference rate
+                         (REFERENCE_FPS) before scoring.
+        features: "coords" (normalized keypoint positions) or "angles"
+                  (joint angles, invariant to framing; see joint_angles.py)
     """
+    # Convert both sequences to arrays once; every scorer below reuses them
+    ref_seq = as_pose_sequence(ref_seq)
+    user_seq = as_pose_sequence(user_seq)
+
+    # Bring the user frames to the reference rate, however fast the client ran
+    raw_user_frames = len(user_seq)
+    if user_timestamps is None:
+        user_timestamps = user_seq.timestamps
+    if user_timestamps is not None:
+        user_seq = resample_pose_sequence(user_seq, user_timestamps)
+        print(
+            f"[PoseCompare] Resampled user frames: {raw_user_frames} -> {len(user_seq)}"
+        )
+    if diagnostics is not None:
+        diagnostics["user_frames_raw"] = raw_user_frames
+        diagnostics["user_frames_resampled"] = len(user_seq)
+
     # Check point coverage threshold first (applies to both DTW and Gemini)
     is_valid, coverage_ratio = check_point_coverage_threshold(
         ref_seq, user_seq, min_point_coverage
@@ -423,14 +866,55 @@ def compare_pose_sequences(
         )
         return penalty
 
-    # First try Gemini for intelligent analysis
-    gemini_score = analyze_motion_with_gemini(ref_seq, user_seq, task_id)
+    # Start Gemini in the background and compute DTW while it runs
+    if gemini_budget is None:
+        gemini_budget = GEMINI_BUDGET_S
+    started = time.monotonic()
+    gemini_future = None
+    if use_gemini:
+        gemini_future = _gemini_executor.submit(
+            analyze_motion_with_gemini, ref_seq, user_seq, task_id, gemini_budget
+        )
+
+    dtw_score = sliding_window_dtw(
+        ref_seq,
+        user_seq,
+        window,
+        min_point_coverage,
+        dtw_window=dtw_window,
+        dtw_window_size=dtw_window_size,
+        mode=mode,
+        diagnostics=diagnostics,
+        reference_key=reference_key,
+        ref_durations=ref_durations,
+        features=features,
+    )
 
-    # Always calculate DTW score as well
-    dtw_score = sliding_window_dtw(ref_seq, user_seq, window, min_point_coverage)
+    gemini_score = None
+    gemini_status = "skipped"
+    if gemini_future is not None:
+        remaining = max(0.0, gemini_budget - (time.monotonic() - started))
+        try:
+            gemini_score = gemini_future.result(timeout=remaining)
+            gemini_status = "used" if gemini_score else "unavailable"
+        except FutureTimeoutError:
+            gemini_status = "timeout"
+            print(
+                f"[PoseCompare][Gemini] No answer within {gemini_budget:.1f}s "
+                f"budget, using DTW only"
+            )
+
+    use_gemini_score = gemini_score is not None and gemini_score > 0
+    if diagnostics is not None:
+        diagnostics["scorers"] = ["gemini", "dtw"] if use_gemini_score else ["dtw"]
+        diagnostics["gemini"] = {
+            "status": gemini_status,
+            "budget_s": gemini_budget,
+            "elapsed_s": round(time.monotonic() - started, 3),
+        }
 
     # Use Gemini if available and reasonable, otherwise use DTW
-    if gemini_score is not None and gemini_score > 0:
+    if use_gemini_score:
         # Apply coverage penalty to Gemini score as well
         if coverage_ratio < 0.8:
             # Linear interpolation: 0.5 -> 0.7, 0.8 -> 0.95
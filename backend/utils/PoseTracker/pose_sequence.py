@@ -0,0 +1,231 @@
+import numpy as np
+from typing import List, Optional, Sequence, Set, Union
+
+from utils.PoseTracker.keypoint_schemas import (
+    KeypointSchema,
+    detect_schema,
+    index_map,
+    names_index_map,
+)
+from utils.PoseTracker.landmarks import (
+    LANDMARK_INDEX,
+    NUM_LANDMARKS,
+    landmark_names,
+)
+
+# Reference poses are extracted at this rate (reference_loader)
+REFERENCE_FPS = 15
+
+
+class PoseSequence:
+    """
+    Pose sequence stored as a (frames, landmarks, 3) float32 array of x, y, score.
+    Landmark columns follow the fixed LANDMARK_INDEX table. Landmarks that are
+    missing from a frame keep x = y = score = 0, so they never count as visible.
+    """
+
+    def __init__(self, data: np.ndarray, timestamps: Optional[np.ndarray] = None):
+        self.data = np.asarray(data, dtype=np.float32)
+        # Optional capture time of every frame in milliseconds (e.g. from a packet)
+        self.timestamps = timestamps
+        self._visible_masks = {}
+
+    @classmethod
+    def from_frames(
+        cls, frames: List[list], schema: Optional[KeypointSchema] = None
+    ) -> "PoseSequence":
+        """
+        Build the array from a list of frames, each either a list of
+        {name, x, y, score} dicts or a dense list of [x, y, score] rows in the
+        order of schema. Without a schema, dense frames are matched to one by
+        keypoint count (see keypoint_schemas.detect_schema).
+        """
+        if frames and frames[0] and not isinstance(frames[0][0], dict):
+            schema = schema or detect_schema(frames[0])
+            if schema is None:
+                raise ValueError(
+                    f"Cannot tell the keypoint schema of frames with "
+                    f"{len(frames[0])} keypoints"
+                )
+            values = np.asarray(frames, dtype=np.float32)
+            if values.ndim != 3 or values.shape[1:] != (len(schema), 3):
+                raise ValueError(
+                    f"Expected frames of {len(schema)} [x, y, score] rows "
+                    f"for schema {schema.name}"
+                )
+            return cls.from_schema_array(values, schema)
+
+        data = np.zeros((len(frames), NUM_LANDMARKS, 3), dtype=np.float32)
+        rows: List[int] = []
+        cols: List[int] = []
+        values: List[tuple] = []
+        for f, frame in enumerate(frames):
+            for kp in frame:
+                idx = LANDMARK_INDEX.get(kp.get("name"))
+                if idx is None:
+                    continue
+                rows.append(f)
+                cols.append(idx)
+                values.append(
+                    (kp.get("x", 0.0), kp.get("y", 0.0), kp.get("score", 0.0))
+                )
+        if values:
+            data[rows, cols] = np.asarray(values, dtype=np.float32)
+        return cls(data)
+
+    @classmethod
+    def from_schema_array(
+        cls, values: np.ndarray, schema: KeypointSchema
+    ) -> "PoseSequence":
+        """
+        Build from a (frames, len(schema), 3) array in the schema's keypoint
+        order.
+        """
+        values = np.asarray(values, dtype=np.float32)
+        source_cols, target_cols = index_map(schema)
+        data = np.zeros((values.shape[0], NUM_LANDMARKS, 3), dtype=np.float32)
+        data[:, target_cols] = values[:, source_cols]
+        return cls(data)
+
+    @classmethod
+    def from_named_array(cls, names: List[str], values: np.ndarray) -> "PoseSequence":
+        """
+        Build from a (frames, len(names), 3) array whose columns are the given
+        landmark names. Columns with unknown names are dropped.
+        """
+        values = np.asarray(values, dtype=np.float32)
+        source_cols, target_cols = names_index_map(tuple(names))
+        data = np.zeros((values.shape[0], NUM_LANDMARKS, 3), dtype=np.float32)
+        data[:, target_cols] = values[:, source_cols]
+        return cls(data)
+
+    def __len__(self) -> int:
+        return self.data.shape[0]
+
+    @property
+    def xy(self) -> np.ndarray:
+        return self.data[:, :, :2]
+
+    @property
+    def scores(self) -> np.ndarray:
+        return self.data[:, :, 2]
+
+    def visible_mask(self, min_score: float = 0.2) -> np.ndarray:
+        """
+        Boolean (landmarks,) mask of points visible in at least one frame.
+        Memoized per threshold, so the data must not be modified afterwards.
+        """
+        mask = self._visible_masks.get(min_score)
+        if mask is None:
+            if len(self) == 0:
+                mask = np.zeros(NUM_LANDMARKS, dtype=bool)
+            else:
+                mask = (self.scores > min_score).any(axis=0)
+            self._visible_masks[min_score] = mask
+        return mask
+
+    def visible_points(self, min_score: float = 0.2) -> Set[str]:
+        return set(landmark_names(np.flatnonzero(self.visible_mask(min_score))))
+
+    def keypoint_vectors(
+        self, indices: np.ndarray, min_score: float = 0.2
+    ) -> np.ndarray:
+        """
+        Return a (frames, len(indices) * 2) array of x, y for the given landmarks.
+        Points that are not visible in a frame are zeroed.
+        """
+        xy = self.xy[:, indices]
+        visible = self.scores[:, indices] > min_score
+        vecs = np.where(visible[:, :, None], xy, np.float32(0.0))
+        return vecs.reshape(len(self), -1)
+
+
+def as_pose_sequence(
+    seq: Union[PoseSequence, List[list]], schema: Optional[KeypointSchema] = None
+) -> PoseSequence:
+    """Accept either a PoseSequence or a raw list of frames (see from_frames)."""
+    if isinstance(seq, PoseSequence):
+        return seq
+    return PoseSequence.from_frames(seq or [], schema)
+
+
+def common_visible_indices(
+    ref: PoseSequence, user: PoseSequence, min_score: float = 0.2
+) -> np.ndarray:
+    """Landmark indices visible (score > threshold) in both sequences."""
+    return np.flatnonzero(ref.visible_mask(min_score) & user.visible_mask(min_score))
+
+
+def normalize_frames(vecs: np.ndarray) -> np.ndarray:
+    """Min-max scale every frame of a (frames, points * 2) array independently."""
+    pts = vecs.reshape(len(vecs), -1, 2)
+    min_xy = pts.min(axis=1, keepdims=True)
+    max_xy = pts.max(axis=1, keepdims=True)
+    scale = np.maximum((max_xy - min_xy).max(axis=2, keepdims=True), 1e-6)
+    return ((pts - min_xy) / scale).reshape(len(vecs), -1).astype(vecs.dtype)
+
+
+def motion_vectors(vecs: np.ndarray) -> np.ndarray:
+    """Frame-to-frame motion vectors, each scaled to unit length."""
+    motion = np.diff(vecs, axis=0)
+    if len(motion) == 0:
+        return motion
+    return motion / (np.linalg.norm(motion, axis=1, keepdims=True) + 1e-8)
+
+
+def interpolate_frames(
+    data: np.ndarray,
+    times: np.ndarray,
+    grid: np.ndarray,
+    min_score: float = 0.2,
+) -> np.ndarray:
+    """
+    Sample a (frames, landmarks, 3) array captured at increasing times onto the
+    grid times (same unit, within [times[0], times[-1]]).
+
+    A landmark visible in both frames around a grid time is linearly
+    interpolated, which fills in dropped frames; otherwise the nearer of the
+    two frames is copied, so positions never blend with the zeros of a
+    missing point.
+    """
+    if len(times) == 1:
+        return np.repeat(data[:1], len(grid), axis=0)
+    right = np.clip(np.searchsorted(times, grid, side="right"), 1, len(times) - 1)
+    left = right - 1
+    span = times[right] - times[left]
+    weight = np.where(span > 0, (grid - times[left]) / np.where(span > 0, span, 1), 0.0)
+    weight = weight.astype(np.float32)[:, None, None]
+
+    before, after = data[left], data[right]
+    blended = before + (after - before) * weight
+    nearest = np.where(weight < 0.5, before, after)
+    both_visible = (before[:, :, 2] > min_score) & (after[:, :, 2] > min_score)
+    return np.where(both_visible[:, :, None], blended, nearest)
+
+
+def resample_pose_sequence(
+    seq: PoseSequence,
+    timestamps_ms: Sequence[float],
+    fps: float = REFERENCE_FPS,
+    min_score: float = 0.2,
+) -> PoseSequence:
+    """
+    Resample a sequence with per-frame capture times (milliseconds) onto a
+    uniform grid at fps, starting at the first frame. Fast clients that send
+    several frames per grid step are thinned out; gaps left by dropped frames
+    are interpolated (see interpolate_frames).
+    """
+    times = np.asarray(timestamps_ms, dtype=np.float64)
+    if times.shape != (len(seq),):
+        raise ValueError(
+            f"Expected {len(seq)} frame timestamps, "
+            f"got {times.shape[0] if times.ndim else 0}"
+        )
+    if len(seq) == 0:
+        return seq
+    if not np.isfinite(times).all() or (np.diff(times) < 0).any():
+        raise ValueError("Frame timestamps must be finite and non-decreasing")
+
+    seconds = (times - times[0]) / 1000.0
+    grid = np.arange(0.0, seconds[-1] + 1e-9, 1.0 / fps)
+    return PoseSequence(interpolate_frames(seq.data, seconds, grid, min_score))
@@ -0,0 +1,223 @@
+"""
+pose_store.py
+
+Binary store for reference poses.
+
+Next to every reference_poses/<name>_pose.json the store keeps (file names
+are defined in reference_index)
+    <name>_pose.npy        the (frames, 33, 3) float32 PoseSequence array
+    <name>_pose.meta.json  fps, source file hash and stat, video hash and
+                           extractor settings
+
+load_pose_store opens the array with np.load(mmap_mode="r"): nothing is parsed,
+pages are read on first use, and every uvicorn or scoring worker that opens
+the same file shares one copy in the page cache. The JSON file stays the
+source of truth when it exists. Whether a store is current is decided by
+content: if the JSON's size and mtime are still the ones recorded at
+conversion it is, otherwise (e.g. after a checkout or copy rewrote the mtime)
+the JSON's SHA-1 is compared with the recorded one, once per size and mtime
+of the file. A stale store is ignored until it is converted again. A store
+without a JSON file is used on its own.
+
+The store's content hash is the SHA-1 of the JSON it was converted from, so
+caches and keyframe files keyed on it stay valid.
+
+Convert existing references (from backend/):
+    python -m utils.PoseTracker.pose_store                 # all of reference_poses/
+    python -m utils.PoseTracker.pose_store reference_poses/task_3_pose.json --force
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.PoseTracker.landmarks import MP_LANDMARK_NAMES
+from utils.PoseTracker.pose_sequence import REFERENCE_FPS, PoseSequence
+from utils.PoseTracker.reference_index import store_meta_path, store_path
+
+STORE_FORMAT_VERSION = 1
+
+# Settings reference_loader extracts references with; a nonzero inference width
+# enables fast mode (check it with extract_pose_from_video --verify first)
+REFERENCE_EXTRACTOR = {
+    "tool": "mediapipe",
+    "target_fps": REFERENCE_FPS,
+    "smoothing_window": 5,
+    "max_frames": 450,
+    "inference_width": int(os.getenv("POSE_EXTRACT_INFERENCE_WIDTH", "0")) or None,
+    "model_complexity": int(os.getenv("POSE_EXTRACT_MODEL_COMPLEXITY", "1")),
+}
+
+
+def file_sha1(path: str) -> str:
+    """SHA-1 of a file, read in 1 MB chunks."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# pose JSON path -> ((mtime_ns, size), SHA-1) of the version last hashed
+_source_hashes: Dict[str, Tuple[Tuple[int, int], str]] = {}
+_source_hashes_lock = threading.Lock()
+
+
+def _source_hash(pose_path: str, version: Tuple[int, int]) -> str:
+    with _source_hashes_lock:
+        cached = _source_hashes.get(pose_path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    digest = file_sha1(pose_path)
+    with _source_hashes_lock:
+        _source_hashes[pose_path] = (version, digest)
+    return digest
+
+
+def _store_is_current(pose_path: str, meta: Dict[str, Any]) -> bool:
+    stat = os.stat(pose_path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    if (meta.get("source_mtime_ns"), meta.get("source_size")) == version:
+        return True
+    if meta.get("source_size") not in (None, stat.st_size):
+        return False
+    # Same size, other mtime: current if the content is unchanged
+    return meta.get("source_hash") == _source_hash(pose_path, version)
+
+
+def save_pose_store(
+    pose_path: str,
+    data: np.ndarray,
+    source_hash: str,
+    extractor: Optional[Dict[str, Any]] = None,
+    video_path: Optional[str] = None,
+) -> str:
+    """
+    Write the store for a reference pose path. The array is written to a
+    temporary file and renamed, so readers never map a partial file.
+    """
+    data = np.ascontiguousarray(data, dtype=np.float32)
+    meta: Dict[str, Any] = {
+        "format_version": STORE_FORMAT_VERSION,
+        "frames": int(data.shape[0]),
+        "landmarks": int(data.shape[1]) if data.ndim > 1 else 0,
+        "fps": REFERENCE_FPS,
+        "source_json": os.path.basename(pose_path),
+        "source_hash": source_hash,
+        "extractor": extractor or REFERENCE_EXTRACTOR,
+        "video_hash": None,
+    }
+    if os.path.exists(pose_path):
+        stat = os.stat(pose_path)
+        meta["source_mtime_ns"] = stat.st_mtime_ns
+        meta["source_size"] = stat.st_size
+    if video_path and os.path.exists(video_path):
+        meta["video_hash"] = file_sha1(video_path)
+
+    out_path = store_path(pose_path)
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, data)
+    os.replace(tmp_path, out_path)
+    meta_tmp = store_meta_path(pose_path) + ".tmp"
+    with open(meta_tmp, "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(meta_tmp, store_meta_path(pose_path))
+    return out_path
+
+
+def load_pose_store(pose_path: str) -> Optional[Tuple[np.ndarray, Dict[str, Any]]]:
+    """
+    (memory-mapped array, metadata) for a reference pose path, or None if there
+    is no usable store (missing, unknown format, or converted from another
+    version of the JSON).
+    """
+    array_path = store_path(pose_path)
+    if not os.path.exists(array_path):
+        return None
+    try:
+        with open(store_meta_path(pose_path), "r") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        print(f"[PoseStore] Missing or unreadable metadata for {array_path}")
+        return None
+    if meta.get("format_version") != STORE_FORMAT_VERSION:
+        print(f"[PoseStore] Unsupported store format in {array_path}")
+        return None
+    if os.path.exists(pose_path) and not _store_is_current(pose_path, meta):
+        print(f"[PoseStore] Ignoring stale store {array_path}, using {pose_path}")
+        return None
+    return np.load(array_path, mmap_mode="r"), meta
+
+
+def frames_from_array(data: np.ndarray) -> List[List[Dict[str, Any]]]:
+    """Rebuild the JSON frame layout ({name, x, y, score} dicts) from an array."""
+    return [
+        [
+            {"name": name, "x": float(x), "y": float(y), "score": float(score)}
+            for name, (x, y, score) in zip(MP_LANDMARK_NAMES, frame)
+        ]
+        for frame in np.asarray(data).tolist()
+    ]
+
+
+def convert_reference(
+    pose_path: str,
+    extractor: Optional[Dict[str, Any]] = None,
+    video_path: Optional[str] = None,
+) -> str:
+    """Convert one reference pose JSON file into the binary store."""
+    with open(pose_path, "rb") as f:
+        raw = f.read()
+    sequence = PoseSequence.from_frames(json.loads(raw))
+    return save_pose_store(
+        pose_path,
+        sequence.data,
+        hashlib.sha1(raw).hexdigest(),
+        extractor=extractor,
+        video_path=video_path,
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Convert reference pose JSON files into the memory-mapped store"
+    )
+    parser.add_argument(
+        "pose_files",
+        nargs="*",
+        help="Reference *_pose.json files (default: every one in --folder)",
+    )
+    parser.add_argument("--folder", default="reference_poses")
+    parser.add_argument(
+        "--force", action="store_true", help="Convert even if the store is current"
+    )
+    args = parser.parse_args(argv)
+
+    pose_files = args.pose_files or sorted(
+        glob.glob(os.path.join(args.folder, "*_pose.json"))
+    )
+    converted = skipped = 0
+    for pose_path in pose_files:
+        if not args.force and load_pose_store(pose_path) is not None:
+            skipped += 1
+            continue
+        out_path = convert_reference(pose_path)
+        size_json = os.path.getsize(pose_path)
+        size_store = os.path.getsize(out_path)
+        print(
+            f"[PoseStore] {pose_path} -> {out_path} "
+            f"({size_json / 1e6:.1f} MB -> {size_store / 1e6:.1f} MB)"
+        )
+        converted += 1
+    print(f"[PoseStore] Converted {converted}, already current {skipped}")
+
+
+if __name__ == "__main__":
+    main()
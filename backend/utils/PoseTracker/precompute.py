@@ -0,0 +1,288 @@
+"""
+precompute.py
+
+Deploy-time extraction of the reference poses of every exercise, so no user
+request has to wait for MediaPipe to run over a reference video.
+
+For each exercise in exercises.json the video is located in
+reference_videos/ (or downloaded there from its videolink; every video once,
+before the extractions start), hashed, and, if it changed since the last run,
+its poses are extracted with the settings reference_loader uses
+(REFERENCE_EXTRACTOR, including the optional fast mode) and written as JSON
+plus the binary store (pose_store.py). Exercises run in
+parallel on a process pool. The manifest keeps each extraction's frame counts
+and per-stage timings.
+
+reference_poses/manifest.json records per exercise the video hash, output
+files, frame count and status. It is rewritten after every exercise, so an
+interrupted run resumes where it stopped. An exercise whose video hash matches
+its last successful entry is skipped. A pose file that predates the manifest
+is adopted as is (its store is written if missing); use --force to extract
+it again.
+
+Usage (from backend/):
+    python -m utils.PoseTracker.precompute
+    python -m utils.PoseTracker.precompute --workers 4 --exercise 3 --exercise 7
+    python -m utils.PoseTracker.precompute --force
+"""
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from utils.exercise_catalog import exercise_catalog
+from utils.PoseTracker.extract_pose_from_video import extract_pose_from_video
+from utils.PoseTracker.pose_store import (
+    REFERENCE_EXTRACTOR,
+    convert_reference,
+    file_sha1,
+    load_pose_store,
+)
+from utils.PoseTracker.reference_index import (
+    REFERENCE_FOLDER,
+    VIDEO_FOLDER,
+    reference_paths,
+    store_path,
+)
+from utils.PoseTracker.reference_loader import find_reference_path
+
+MANIFEST_PATH = os.path.join(REFERENCE_FOLDER, "manifest.json")
+
+
+def _download(url: str, path: str) -> None:
+    tmp_path = path + ".part"
+    try:
+        with requests.get(url, stream=True, timeout=60) as resp:
+            resp.raise_for_status()
+            with open(tmp_path, "wb") as f:
+                for chunk in resp.iter_content(chunk_size=1 << 20):
+                    f.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _video_path(exercise: Dict[str, Any]) -> str:
+    videolink = exercise.get("videolink") or ""
+    video_filename = videolink.split("/")[-1] if videolink else None
+    return reference_paths(str(exercise.get("id")), video_filename)[1]
+
+
+def download_videos(
+    exercises: List[Dict[str, Any]], workers: Optional[int] = None
+) -> Dict[str, str]:
+    """
+    Download the missing videos of the exercises, each file once even when
+    several exercises share a videolink. Returns video path -> error message
+    of the downloads that failed.
+    """
+    downloads: Dict[str, str] = {}
+    for exercise in exercises:
+        videolink = exercise.get("videolink") or ""
+        video_path = _video_path(exercise)
+        if not os.path.exists(video_path) and videolink.startswith("http"):
+            downloads.setdefault(video_path, videolink)
+    if not downloads:
+        return {}
+
+    os.makedirs(VIDEO_FOLDER, exist_ok=True)
+    errors: Dict[str, str] = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for video_path, videolink in downloads.items():
+            print(f"[Precompute] Downloading {videolink} -> {video_path}")
+            futures[executor.submit(_download, videolink, video_path)] = video_path
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except (requests.RequestException, OSError) as e:
+                # Recorded in the manifest entries; the run goes on
+                errors[futures[future]] = str(e)
+    return errors
+
+
+def load_manifest(path: str = MANIFEST_PATH) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {"exercises": {}}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: Dict[str, Any], path: str = MANIFEST_PATH) -> None:
+    manifest["updated_at"] = datetime.utcnow().isoformat()
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def precompute_exercise(
+    exercise: Dict[str, Any],
+    previous: Optional[Dict[str, Any]],
+    force: bool = False,
+    download_error: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Bring one exercise's reference up to date (runs in a worker process).
+    Its video is downloaded beforehand (download_videos); download_error is
+    why that failed, if it did. Returns its manifest entry.
+    """
+    exercise_id = str(exercise.get("id"))
+    videolink = exercise.get("videolink") or ""
+    video_filename = videolink.split("/")[-1] if videolink else None
+    pose_path, video_path = reference_paths(exercise_id, video_filename)
+    existing = find_reference_path(exercise_id, videolink or None)
+    entry: Dict[str, Any] = {"name": exercise.get("name", ""), "video": video_path}
+
+    try:
+        if download_error is not None:
+            if not existing:
+                raise FileNotFoundError(
+                    f"Download of {videolink} failed: {download_error}"
+                )
+            print(
+                f"[Precompute] Download failed ({download_error}), "
+                f"keeping {existing}"
+            )
+        if os.path.exists(video_path):
+            video_hash = file_sha1(video_path)
+        elif existing:
+            video_hash = None  # nothing to compare against; keep the pose file
+        else:
+            raise FileNotFoundError(f"No video at {video_path} and no videolink")
+        entry["video_hash"] = video_hash
+
+        if existing and not force:
+            unchanged = (
+                previous is not None
+                and previous.get("status") == "ok"
+                and previous.get("video_hash") == video_hash
+            )
+            if unchanged or previous is None or video_hash is None:
+                # Adopted or unchanged; only make sure the store is current
+                if load_pose_store(existing) is None:
+                    convert_reference(existing, video_path=video_path)
+                entry.update(
+                    {
+                        "status": "ok",
+                        "pose_path": existing,
+                        "store_path": store_path(existing),
+                        "action": "unchanged" if unchanged else "adopted",
+                    }
+                )
+                if previous:
+                    for key in ("frames", "extracted_at"):
+                        if key in previous:
+                            entry[key] = previous[key]
+                return entry
+
+        if video_hash is None:
+            raise FileNotFoundError(f"No video at {video_path} to extract from")
+        # Overwrite the file the loader actually serves, if there is one
+        out_path = existing or pose_path
+        stats: Dict[str, Any] = {}
+        frames = extract_pose_from_video(
+            video_path=video_path,
+            out_json_path=out_path,
+            target_fps=REFERENCE_EXTRACTOR["target_fps"],
+            smoothing_window=REFERENCE_EXTRACTOR["smoothing_window"],
+            max_frames=REFERENCE_EXTRACTOR["max_frames"],
+            inference_width=REFERENCE_EXTRACTOR["inference_width"],
+            model_complexity=REFERENCE_EXTRACTOR["model_complexity"],
+            stats=stats,
+        )
+        convert_reference(
+            out_path, extractor=REFERENCE_EXTRACTOR, video_path=video_path
+        )
+        entry.update(
+            {
+                "status": "ok",
+                "pose_path": out_path,
+                "store_path": store_path(out_path),
+                "frames": len(frames),
+                "extracted_at": datetime.utcnow().isoformat(),
+                "action": "extracted",
+                "extraction": stats,
+            }
+        )
+    except Exception as e:
+        entry.update({"status": "error", "error": str(e)})
+    return entry
+
+
+def precompute_references(
+    workers: Optional[int] = None,
+    exercise_ids: Optional[List[str]] = None,
+    force: bool = False,
+) -> Dict[str, Any]:
+    """Run precompute_exercise over the catalog; returns the updated manifest."""
+    os.makedirs(REFERENCE_FOLDER, exist_ok=True)
+    manifest = load_manifest()
+    entries = manifest.setdefault("exercises", {})
+    exercises = [
+        ex
+        for ex in exercise_catalog.all()
+        if not exercise_ids or str(ex.get("id")) in exercise_ids
+    ]
+    print(
+        f"[Precompute] {len(exercises)} exercises, "
+        f"{workers or os.cpu_count()} workers"
+    )
+
+    # Up front, so exercises sharing a video do not download it concurrently
+    download_errors = download_videos(exercises, workers)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                precompute_exercise,
+                ex,
+                entries.get(str(ex.get("id"))),
+                force,
+                download_errors.get(_video_path(ex)),
+            ): str(ex.get("id"))
+            for ex in exercises
+        }
+        for future in as_completed(futures):
+            exercise_id = futures[future]
+            entry = future.result()
+            entries[exercise_id] = entry
+            save_manifest(manifest)
+            detail = entry.get("action") if entry["status"] == "ok" else entry["error"]
+            print(f"[Precompute] Exercise {exercise_id} ({entry['name']}): {detail}")
+    return manifest
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Extract reference poses for every exercise in exercises.json"
+    )
+    parser.add_argument("--workers", type=int, default=None, help="Default: CPU count")
+    parser.add_argument(
+        "--exercise", action="append", default=[], help="Only these exercise ids"
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Extract even if the video is unchanged"
+    )
+    args = parser.parse_args(argv)
+
+    manifest = precompute_references(args.workers, args.exercise, args.force)
+    failed = [
+        ex_id
+        for ex_id, entry in manifest["exercises"].items()
+        if entry.get("status") != "ok"
+    ]
+    print(f"[Precompute] Wrote {MANIFEST_PATH}")
+    if failed:
+        print(f"[Precompute] Failed: {', '.join(sorted(failed))}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
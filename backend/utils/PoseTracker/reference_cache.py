@@ -0,0 +1,105 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import numpy as np
+
+from utils.PoseTracker.joint_angles import ANGLE_FEATURES, COORD_FEATURES, angle_vectors
+from utils.PoseTracker.pose_sequence import (
+    PoseSequence,
+    motion_vectors,
+    normalize_frames,
+)
+
+# Roughly 20 exercises times a handful of visible-point subsets
+REFERENCE_CACHE_SIZE = int(os.getenv("POSE_REFERENCE_CACHE_SIZE", "128"))
+
+
+class PreparedReference:
+    """Reference side of a comparison for one set of compared points."""
+
+    def __init__(
+        self, vecs: np.ndarray, motion_norm: np.ndarray, visible_mask: np.ndarray
+    ):
+        self.vecs = vecs  # (frames, points * 2) normalized positions, or joint angles
+        self.motion_norm = motion_norm  # (frames - 1, points * 2) unit motion
+        self.visible_mask = visible_mask  # (landmarks,) visible anywhere
+
+
+class LRUCache:
+    """Thread-safe size-bounded LRU with hit/miss counters."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        # Built outside the lock; a concurrent miss on the same key just builds twice
+        value = build()
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+_prepared_references = LRUCache(REFERENCE_CACHE_SIZE)
+
+
+def prepare_reference(
+    reference: PoseSequence,
+    point_indices: np.ndarray,
+    reference_key: Optional[Hashable] = None,
+    min_score: float = 0.2,
+    features: str = COORD_FEATURES,
+) -> PreparedReference:
+    """
+    Normalized position and motion matrices of a reference for the given points.
+    With features="angles", point_indices are joint angles (see joint_angles.py)
+    and the matrices hold those angles instead of positions.
+
+    With a reference_key (e.g. (exercise_id, content hash)) the result is kept in
+    an in-process LRU keyed by (reference_key, point set, min_score, features);
+    without one it is computed directly.
+    """
+
+    def build() -> PreparedReference:
+        if features == ANGLE_FEATURES:
+            vecs = angle_vectors(reference, point_indices, min_score)
+        else:
+            vecs = normalize_frames(
+                reference.keypoint_vectors(point_indices, min_score)
+            )
+        return PreparedReference(
+            vecs, motion_vectors(vecs), reference.visible_mask(min_score)
+        )
+
+    if reference_key is None:
+        return build()
+    key = (reference_key, tuple(int(i) for i in point_indices), min_score, features)
+    return _prepared_references.get_or_build(key, build)
+
+
+def reference_cache_stats() -> Dict[str, int]:
+    return _prepared_references.stats()
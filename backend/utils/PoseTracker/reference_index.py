@@ -0,0 +1,255 @@
+"""
+reference_index.py
+
+Where the reference artifacts of an exercise live, and how their files are
+named: pose JSON files, their binary stores (pose_store.py) and keyframe files
+(keyframes.py) are all derived from the names defined here.
+
+reference_poses/ and reference_videos/ are scanned into an in-memory map of
+file path -> (mtime, size). Resolving an exercise to its pose file and video
+is then a few dictionary lookups, memoized per (exercise id, video file name)
+until the next scan, so a compare makes no filesystem calls unless it has to
+read a reference that changed.
+
+At most every POSE_REFERENCE_INDEX_POLL_S seconds (default 2), the first
+lookup stats the two folders, and they are re-scanned only if one of their
+mtimes changed, i.e. a file was added, removed or renamed into place. This
+process re-scans right after writing a reference (refresh()). Files written
+by other processes, e.g. precompute.py, show up within one poll interval as
+long as they are written to a temporary file and renamed, as every writer
+here does; a file rewritten in place is only noticed at the next change of
+its folder.
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+REFERENCE_FOLDER = "reference_poses"
+VIDEO_FOLDER = "reference_videos"  # where Veo3 videos are stored
+POLL_INTERVAL_S = float(os.getenv("POSE_REFERENCE_INDEX_POLL_S", "2"))
+# Folder mtimes this recent (ns) may still change without moving, see _current
+_RACY_NS = 1_000_000_000
+
+# Files kept next to a <name>_pose.json reference
+STORE_SUFFIX = ".npy"  # <name>_pose.npy, binary array (pose_store.py)
+STORE_META_SUFFIX = ".meta.json"  # <name>_pose.meta.json, its metadata
+KEYFRAMES_SUFFIX = "_keyframes.json"  # <name>_pose_keyframes.json (keyframes.py)
+
+
+def _base(pose_path: str) -> str:
+    return pose_path[:-5] if pose_path.endswith(".json") else pose_path
+
+
+def store_path(pose_path: str) -> str:
+    """Binary array file of a reference pose JSON path."""
+    return _base(pose_path) + STORE_SUFFIX
+
+
+def store_meta_path(pose_path: str) -> str:
+    return _base(pose_path) + STORE_META_SUFFIX
+
+
+def compact_reference_path(pose_path: str) -> str:
+    """Where the compact form of a reference pose file is stored."""
+    return _base(pose_path) + KEYFRAMES_SUFFIX
+
+
+def reference_paths(
+    exercise_id: str, video_filename: Optional[str] = None
+) -> Tuple[str, str]:
+    """
+    (pose path, video path) under which a newly generated reference of an
+    exercise is written and its video is looked for.
+    """
+    # Use exercise_id-based naming, or video filename if available
+    if video_filename:
+        # Remove .mp4 extension for pose file
+        base_name = video_filename.replace(".mp4", "")
+        path = os.path.join(
+            REFERENCE_FOLDER, f"exercise_{exercise_id}_{base_name}_pose.json"
+        )
+        video_path = os.path.join(VIDEO_FOLDER, video_filename)
+    else:
+        # Fallback to exercise_id-based naming
+        path = os.path.join(REFERENCE_FOLDER, f"exercise_{exercise_id}_pose.json")
+        video_path = os.path.join(VIDEO_FOLDER, f"exercise_{exercise_id}.mp4")
+    return path, video_path
+
+
+def pose_candidates(
+    exercise_id: str, video_filename: Optional[str] = None
+) -> List[str]:
+    """Pose file paths an exercise's reference may have, in order of preference."""
+    path, _ = reference_paths(exercise_id, video_filename)
+    candidates = [
+        path,  # Primary: exercise_{id}_{name}_pose.json or exercise_{id}_pose.json
+        os.path.join(REFERENCE_FOLDER, f"task_{exercise_id}_pose.json"),  # Legacy
+        os.path.join(REFERENCE_FOLDER, f"exercise_{exercise_id}_pose.json"),
+    ]
+    if video_filename:
+        # Video name directly
+        base_name = video_filename.replace(".mp4", "")
+        candidates.insert(
+            0, os.path.join(REFERENCE_FOLDER, f"{base_name}_pose.json")
+        )
+    return list(dict.fromkeys(candidates))
+
+
+def video_candidates(
+    exercise_id: str, video_filename: Optional[str] = None
+) -> List[str]:
+    """Video paths an exercise's reference may be extracted from, in order."""
+    _, video_path = reference_paths(exercise_id, video_filename)
+    candidates = [
+        video_path,
+        os.path.join(VIDEO_FOLDER, f"task_{exercise_id}.mp4"),  # Legacy
+        os.path.join(VIDEO_FOLDER, f"exercise_{exercise_id}.mp4"),
+    ]
+    return list(dict.fromkeys(candidates))
+
+
+class _Snapshot:
+    """One scan of the folders plus the lookups answered from it."""
+
+    def __init__(self, files: Dict[str, Tuple[int, int]]):
+        self.files = files
+        # (exercise id, video file name) -> (pose path, video path)
+        self.resolved: Dict[Tuple[str, Optional[str]], Tuple] = {}
+
+
+class ReferenceIndex:
+    """Reference pose and video files, re-scanned at most every poll interval."""
+
+    def __init__(
+        self,
+        folders: Tuple[str, ...] = (REFERENCE_FOLDER, VIDEO_FOLDER),
+        poll_interval_s: float = POLL_INTERVAL_S,
+    ):
+        self.folders = folders
+        self.poll_interval_s = poll_interval_s
+        self.scans = 0
+        self.checks = 0
+        self._snapshot: Optional[_Snapshot] = None
+        self._checked_at = 0.0
+        # Folder mtimes the snapshot was scanned at; None forces a scan
+        self._folder_mtimes: Optional[Tuple[Optional[int], ...]] = None
+        self._lock = threading.Lock()
+
+    def _stat_folders(self) -> Tuple[Optional[int], ...]:
+        mtimes = []
+        for folder in self.folders:
+            try:
+                mtimes.append(os.stat(folder).st_mtime_ns)
+            except FileNotFoundError:
+                mtimes.append(None)
+        self.checks += 1
+        return tuple(mtimes)
+
+    def _scan(self) -> _Snapshot:
+        files: Dict[str, Tuple[int, int]] = {}
+        for folder in self.folders:
+            try:
+                with os.scandir(folder) as entries:
+                    for entry in entries:
+                        if entry.is_file():
+                            stat = entry.stat()
+                            files[os.path.join(folder, entry.name)] = (
+                                stat.st_mtime_ns,
+                                stat.st_size,
+                            )
+            except FileNotFoundError:
+                continue
+        self.scans += 1
+        return _Snapshot(files)
+
+    def _current(self, force: bool = False) -> _Snapshot:
+        snapshot = self._snapshot
+        if (
+            not force
+            and snapshot is not None
+            and time.monotonic() - self._checked_at < self.poll_interval_s
+        ):
+            return snapshot
+        with self._lock:
+            if (
+                force
+                or self._snapshot is None
+                or time.monotonic() - self._checked_at >= self.poll_interval_s
+            ):
+                # Stat the folders before listing them, so a change made during
+                # the scan shows up as a new mtime at the next check
+                mtimes = self._stat_folders()
+                if force or self._snapshot is None or mtimes != self._folder_mtimes:
+                    self._snapshot = self._scan()
+                    # A folder changed within the mtime granularity of the scan
+                    # may change again without its mtime moving: scan it again
+                    recent = time.time_ns() - _RACY_NS
+                    racy = any(m is not None and m >= recent for m in mtimes)
+                    self._folder_mtimes = None if racy else mtimes
+                self._checked_at = time.monotonic()
+            return self._snapshot
+
+    def refresh(self) -> None:
+        """Re-scan now, e.g. after writing a reference."""
+        self._current(force=True)
+
+    def version(self, path: str) -> Optional[Tuple[int, int]]:
+        """(mtime_ns, size) of an indexed file, or None if it does not exist."""
+        return self._current().files.get(path)
+
+    def exists(self, path: str) -> bool:
+        return path in self._current().files
+
+    def resolve(
+        self, exercise_id: str, video_filename: Optional[str] = None
+    ) -> Tuple[Optional[str], Optional[str]]:
+        """
+        (pose path, video path) of an exercise, each None if missing. A pose
+        path counts as present when its JSON or its binary store exists.
+        """
+        snapshot = self._current()
+        key = (str(exercise_id), video_filename)
+        resolved = snapshot.resolved.get(key)
+        if resolved is None:
+            pose_path = next(
+                (
+                    path
+                    for path in pose_candidates(exercise_id, video_filename)
+                    if path in snapshot.files or store_path(path) in snapshot.files
+                ),
+                None,
+            )
+            video_path = next(
+                (
+                    path
+                    for path in video_candidates(exercise_id, video_filename)
+                    if path in snapshot.files
+                ),
+                None,
+            )
+            resolved = snapshot.resolved[key] = (pose_path, video_path)
+        return resolved
+
+    def videos(self) -> List[str]:
+        """File names of the videos in the video folder."""
+        prefix = VIDEO_FOLDER + os.sep
+        return sorted(
+            path[len(prefix) :]
+            for path in self._current().files
+            if path.startswith(prefix) and path.endswith(".mp4")
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._current()
+        return {
+            "files": len(snapshot.files),
+            "resolved": len(snapshot.resolved),
+            "scans": self.scans,
+            "folder_checks": self.checks,
+            "poll_interval_s": self.poll_interval_s,
+        }
+
+
+reference_index = ReferenceIndex()
@@ -1,11 +1,81 @@
+import hashlib
 import json
 import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from utils.exercise_catalog import exercise_catalog
 from utils.PoseTracker.extract_pose_from_video import (
     extract_pose_from_video,
 )  # import the extractor function
+from utils.PoseTracker.keyframes import (
+    CompactReference,
+    load_compact_reference,
+)
+from utils.PoseTracker.pose_sequence import PoseSequence
+from utils.PoseTracker.reference_index import (
+    REFERENCE_FOLDER,
+    VIDEO_FOLDER,
+    compact_reference_path,
+    pose_candidates,
+    reference_index,
+    reference_paths,
+    store_path,
+    video_candidates,
+)
+from utils.PoseTracker.pose_store import (
+    REFERENCE_EXTRACTOR,
+    convert_reference,
+    frames_from_array,
+    load_pose_store,
+)
 
-REFERENCE_FOLDER = "reference_poses"
-VIDEO_FOLDER = "reference_videos"  # where Veo3 videos are stored
+# Seconds a failed extraction is reported again instead of being retried
+EXTRACTION_FAILURE_TTL_S = float(os.getenv("POSE_EXTRACTION_FAILURE_TTL_S", "30"))
+
+
+class ReferencePose:
+    """Parsed reference pose plus the identity used to cache work derived from it"""
+
+    def __init__(
+        self,
+        exercise_id: str,
+        sequence: PoseSequence,
+        content_hash: str,
+        path: str,
+        keyframes: Optional[CompactReference] = None,
+    ):
+        self.exercise_id = exercise_id
+        self.sequence = sequence
+        self.content_hash = content_hash
+        self.path = path
+        self.keyframes = keyframes  # set when an up-to-date keyframe file exists
+
+    @property
+    def cache_key(self) -> Tuple[str, str]:
+        return (self.exercise_id, self.content_hash)
+
+
+# path -> (stat of the pose, store and keyframe files, ReferencePose); references
+# are loaded once per version of those files
+_reference_files: Dict[str, Tuple[Tuple, ReferencePose]] = {}
+_reference_files_lock = threading.Lock()
+
+
+class _Extraction:
+    """An on-demand extraction in progress; concurrent callers wait on it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.frames: Optional[List] = None
+        self.error: Optional[str] = None
+
+
+# pose path -> extraction in progress, and pose path -> (monotonic expiry,
+# error) of recently failed ones
+_extractions: Dict[str, _Extraction] = {}
+_failed_extractions: Dict[str, Tuple[float, str]] = {}
+_extractions_lock = threading.Lock()
 
 
 def load_reference_pose(exercise_id: str, video_url: str = None):
@@ -15,147 +85,166 @@ def load_reference_pose(exercise_id: str, video_url: str = None):
     Uses exercise_id to match with exercises.json and find the correct video.
     Can also accept video_url directly to use hosted video URLs.
     """
-    import json
+    path, frames = _resolve_or_generate_reference(exercise_id, video_url)
+    if frames is not None:
+        return frames
+    if not reference_index.exists(path):
+        # Only the binary store is deployed (see pose_store.py)
+        return frames_from_array(_load_store_only(path)[0])
+    with open(path, "r") as f:
+        return json.load(f)
 
-    os.makedirs(REFERENCE_FOLDER, exist_ok=True)
 
-    # Try to find the exercise in exercises.json to get the video URL/filename
-    exercises_path = os.path.join(
-        os.path.dirname(__file__), "..", "..", "exercises.json"
+def _load_store_only(path: str):
+    """load_pose_store for a reference without a JSON file to fall back to."""
+    store = load_pose_store(path)
+    if store is None:
+        raise RuntimeError(
+            f"Binary store {store_path(path)} is unusable (missing or unreadable "
+            f"metadata, or another format version) and there is no {path} to "
+            f"fall back to; convert or extract the reference again"
+        )
+    return store
+
+
+def load_reference(
+    exercise_id: str, video_url: str = None, generate: bool = True
+) -> ReferencePose:
+    """
+    Same lookup as load_reference_pose, but returns the reference as a
+    PoseSequence with its content hash, plus its keyframes when a matching
+    <name>_keyframes.json exists (see keyframes.py). The files are only re-read
+    and re-parsed when their mtime or size in the reference index changes.
+    A current binary store (<name>_pose.npy, see pose_store.py) is memory-mapped
+    instead of parsing the JSON file.
+    With generate=False a missing pose file raises FileNotFoundError instead of
+    being extracted from the video.
+    """
+    path, _ = _resolve_or_generate_reference(exercise_id, video_url, generate)
+    keyframes_path = compact_reference_path(path)
+    version = (
+        reference_index.version(path),
+        reference_index.version(store_path(path)),
+        reference_index.version(keyframes_path),
     )
+    with _reference_files_lock:
+        cached = _reference_files.get(path)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    if reference_index.exists(path):
+        store = load_pose_store(path)
+    else:
+        # Only the binary store is deployed
+        store = _load_store_only(path)
+    if store is not None:
+        data, meta = store
+        sequence = PoseSequence(data)
+        content_hash = meta["source_hash"]
+        source = store_path(path)
+    else:
+        with open(path, "rb") as f:
+            raw = f.read()
+        content_hash = hashlib.sha1(raw).hexdigest()
+        sequence = PoseSequence.from_frames(json.loads(raw))
+        source = path
+    reference = ReferencePose(
+        str(exercise_id),
+        sequence,
+        content_hash,
+        path,
+        keyframes=load_compact_reference(keyframes_path, content_hash),
+    )
+    with _reference_files_lock:
+        _reference_files[path] = (version, reference)
+    print(f"[ReferenceLoader] Loaded reference pose file: {source}")
+    return reference
+
+
+def find_reference_path(exercise_id: str, video_url: str = None) -> Optional[str]:
+    """Existing pose file (JSON or binary store) of an exercise, or None."""
+    try:
+        path, _ = _resolve_or_generate_reference(exercise_id, video_url, generate=False)
+    except FileNotFoundError:
+        return None
+    return path
+
+
+def missing_references() -> List[Dict]:
+    """Exercises of the catalog without a precomputed reference pose."""
+    return [
+        exercise
+        for exercise in exercise_catalog.all()
+        if find_reference_path(str(exercise.get("id")), exercise.get("videolink"))
+        is None
+    ]
+
+
+def _resolve_or_generate_reference(
+    exercise_id: str, video_url: Optional[str] = None, generate: bool = True
+) -> Tuple[str, Optional[List]]:
+    """
+    Find the pose file for an exercise, generating it from the video if missing
+    (unless generate is False).
+    Returns (path, frames) where frames is only set when it was just generated.
+    """
+    # Find the exercise in the catalog (exercises.json) to get the video URL/filename
+    exercise = exercise_catalog.by_id(exercise_id)
     video_filename = None
     videolink = video_url  # Use provided URL if available
 
-    if os.path.exists(exercises_path):
-        try:
-            with open(exercises_path, "r") as f:
-                exercises_data = json.load(f)
-
-            for exercise in exercises_data.get("exercises", []):
-                if str(exercise.get("id")) == str(exercise_id):
-                    if not videolink:
-                        videolink = exercise.get("videolink", "")
-                    if videolink:
-                        # Extract filename from URL (e.g., "DeepLung.mp4" from full URL)
-                        video_filename = videolink.split("/")[-1]
-                        break
-        except Exception as e:
-            print(f"[ReferenceLoader] Error reading exercises.json: {e}")
-
-    # Use exercise_id-based naming, or video filename if available
-    if video_filename:
-        # Remove .mp4 extension for pose file
-        base_name = video_filename.replace(".mp4", "")
-        path = os.path.join(
-            REFERENCE_FOLDER, f"exercise_{exercise_id}_{base_name}_pose.json"
+    if exercise is not None:
+        if not videolink:
+            videolink = exercise.get("videolink", "")
+        if videolink:
+            # Extract filename from URL (e.g., "DeepLung.mp4" from full URL)
+            video_filename = videolink.split("/")[-1]
+
+    # ✅ Case 1 — Existing pose file, under any of its naming patterns
+    existing_path, found_video_path = reference_index.resolve(
+        exercise_id, video_filename
+    )
+    if existing_path is not None:
+        print(f"[ReferenceLoader] Found existing pose file: {existing_path}")
+        return existing_path, None
+    if not generate:
+        raise FileNotFoundError(
+            f"No reference pose file for exercise {exercise_id} "
+            f"(tried {', '.join(pose_candidates(exercise_id, video_filename))})"
         )
-        video_path = os.path.join(VIDEO_FOLDER, video_filename)
-    else:
-        # Fallback to exercise_id-based naming
-        path = os.path.join(REFERENCE_FOLDER, f"exercise_{exercise_id}_pose.json")
-        video_path = os.path.join(VIDEO_FOLDER, f"exercise_{exercise_id}.mp4")
-
-    # ✅ Case 1 — Try multiple naming patterns to find existing pose file
-    possible_paths = [
-        path,  # Primary: exercise_{id}_{name}_pose.json or exercise_{id}_pose.json
-        os.path.join(
-            REFERENCE_FOLDER, f"task_{exercise_id}_pose.json"
-        ),  # Legacy: task_{id}_pose.json
-        os.path.join(
-            REFERENCE_FOLDER, f"exercise_{exercise_id}_pose.json"
-        ),  # Alternative
-    ]
 
-    if video_filename:
-        base_name = video_filename.replace(".mp4", "")
-        possible_paths.insert(
-            0, os.path.join(REFERENCE_FOLDER, f"{base_name}_pose.json")
-        )  # Try video name directly
-
-    for possible_path in possible_paths:
-        if os.path.exists(possible_path):
-            print(f"[ReferenceLoader] Found existing pose file: {possible_path}")
-            with open(possible_path, "r") as f:
-                return json.load(f)
-
-    # ✅ Case 2 — Try multiple video paths
-    possible_video_paths = []
-
-    # Add paths in order of preference
-    if video_filename:
-        possible_video_paths.append(
-            os.path.join(VIDEO_FOLDER, video_filename)
-        )  # Try video name directly
-        possible_video_paths.append(video_path)  # Primary path with video_filename
-
-    # Add fallback paths
-    possible_video_paths.append(
-        os.path.join(VIDEO_FOLDER, f"task_{exercise_id}.mp4")
-    )  # Legacy: task_{id}.mp4
-    possible_video_paths.append(
-        os.path.join(VIDEO_FOLDER, f"exercise_{exercise_id}.mp4")
-    )  # Alternative
-
-    # If video_path wasn't added yet (no video_filename), add it
-    if video_path not in possible_video_paths:
-        possible_video_paths.insert(0, video_path)
-
-    found_video_path = None
-    for possible_video in possible_video_paths:
-        if possible_video and os.path.exists(possible_video):
-            found_video_path = possible_video
-            print(f"[ReferenceLoader] Found video file: {found_video_path}")
-            break
-        elif possible_video:
-            print(f"[ReferenceLoader] Video not found at: {possible_video}")
-
-    # If no local file found but we have a video URL, use the URL directly
-    if not found_video_path and videolink and videolink.startswith("http"):
+    # ✅ Case 2 — Local video, or the video URL directly
+    if found_video_path:
+        print(f"[ReferenceLoader] Found video file: {found_video_path}")
+    elif videolink and videolink.startswith("http"):
         found_video_path = videolink
         print(f"[ReferenceLoader] Using video URL directly: {found_video_path}")
 
     if not found_video_path:
         # List available video files for debugging
-        available_videos = []
-        if os.path.exists(VIDEO_FOLDER):
-            available_videos = [
-                f for f in os.listdir(VIDEO_FOLDER) if f.endswith(".mp4")
-            ]
+        available_videos = reference_index.videos()
 
         # If video not found locally, provide helpful error message
-        if video_filename and exercises_path and os.path.exists(exercises_path):
-            try:
-                with open(exercises_path, "r") as f:
-                    exercises_data = json.load(f)
-
-                for exercise in exercises_data.get("exercises", []):
-                    if str(exercise.get("id")) == str(exercise_id):
-                        videolink = exercise.get("videolink", "")
-                        if videolink and videolink.startswith("http"):
-                            expected_path = (
-                                os.path.join(VIDEO_FOLDER, video_filename)
-                                if video_filename
-                                else os.path.join(
-                                    VIDEO_FOLDER, f"exercise_{exercise_id}.mp4"
-                                )
-                            )
-                            error_msg = (
-                                f"Reference video not found for exercise {exercise_id} ({exercise.get('name', 'unknown')}).\n"
-                                f"Expected video file: {video_filename}\n"
-                                f"Expected path: {expected_path}\n"
-                                f"Video URL: {videolink}\n"
-                                f"Available videos in {VIDEO_FOLDER}: {', '.join(available_videos) if available_videos else 'none'}\n"
-                                f"Please download the video from the URL and save it as: {expected_path}"
-                            )
-                            print(f"[ReferenceLoader] {error_msg}")
-                            raise FileNotFoundError(error_msg)
-            except FileNotFoundError:
-                raise
-            except Exception as e:
-                print(f"[ReferenceLoader] Error reading exercises.json: {e}")
+        if video_filename and exercise is not None:
+            videolink = exercise.get("videolink", "")
+            if videolink and videolink.startswith("http"):
+                expected_path = os.path.join(VIDEO_FOLDER, video_filename)
+                error_msg = (
+                    f"Reference video not found for exercise {exercise_id} "
+                    f"({exercise.get('name', 'unknown')}).\n"
+                    f"Expected video file: {video_filename}\n"
+                    f"Expected path: {expected_path}\n"
+                    f"Video URL: {videolink}\n"
+                    f"Available videos in {VIDEO_FOLDER}: "
+                    f"{', '.join(available_videos) if available_videos else 'none'}\n"
+                    f"Please download the video from the URL and save it as: "
+                    f"{expected_path}"
+                )
+                print(f"[ReferenceLoader] {error_msg}")
+                raise FileNotFoundError(error_msg)
 
         # Build error message with all tried paths
-        tried_paths = ", ".join([p for p in possible_video_paths if p])
+        tried_paths = ", ".join(video_candidates(exercise_id, video_filename))
         error_msg = (
             f"Reference pose and video not found for exercise {exercise_id}.\n"
             f"Tried paths: {tried_paths}\n"
@@ -163,22 +252,93 @@ def load_reference_pose(exercise_id: str, video_url: str = None):
         )
         raise FileNotFoundError(error_msg)
 
+    os.makedirs(REFERENCE_FOLDER, exist_ok=True)
+    path, _ = reference_paths(exercise_id, video_filename)
+    return path, _extract_reference(exercise_id, path, found_video_path)
+
+
+def _extract_reference(
+    exercise_id: str, path: str, found_video_path: str
+) -> Optional[List]:
+    """
+    Single-flight extraction of a reference: the first caller for a pose path
+    runs it, concurrent callers wait for its result. A failure is re-raised to
+    every caller for EXTRACTION_FAILURE_TTL_S before extraction is tried again.
+    Returns None if another caller wrote the file in the meantime.
+
+    This only covers callers in one process, so worker processes load
+    references with generate=False (see scoring_service, rescore).
+    """
+    with _extractions_lock:
+        failure = _failed_extractions.get(path)
+        if failure is not None:
+            if failure[0] > time.monotonic():
+                raise RuntimeError(failure[1])
+            del _failed_extractions[path]
+        extraction = _extractions.get(path)
+        leader = extraction is None
+        if leader:
+            extraction = _extractions[path] = _Extraction()
+
+    if not leader:
+        print(f"[ReferenceLoader] Waiting for extraction in progress: {path}")
+        extraction.done.wait()
+        if extraction.error is not None:
+            raise RuntimeError(extraction.error)
+        return extraction.frames
+
+    try:
+        if os.path.exists(path):
+            # Finished just before this call became the leader
+            return None
+        extraction.frames = _generate_reference(exercise_id, path, found_video_path)
+        return extraction.frames
+    except Exception as e:
+        extraction.error = str(e)
+        with _extractions_lock:
+            _failed_extractions[path] = (
+                time.monotonic() + EXTRACTION_FAILURE_TTL_S,
+                extraction.error,
+            )
+        raise
+    finally:
+        with _extractions_lock:
+            del _extractions[path]
+        extraction.done.set()
+
+
+def _generate_reference(exercise_id: str, path: str, found_video_path: str) -> List:
     print(
         f"[ReferenceLoader] Reference JSON not found. Generating from video: {found_video_path}"
     )
 
-    # 🧠 Generate pose keypoints from video and store as JSON
+    # 🧠 Generate pose keypoints from video and store as JSON (written atomically)
     try:
         frames = extract_pose_from_video(
             video_path=found_video_path,
             out_json_path=path,
-            target_fps=15,
-            smoothing_window=5,
-            max_frames=450,
+            target_fps=REFERENCE_EXTRACTOR["target_fps"],
+            smoothing_window=REFERENCE_EXTRACTOR["smoothing_window"],
+            max_frames=REFERENCE_EXTRACTOR["max_frames"],
+            inference_width=REFERENCE_EXTRACTOR["inference_width"],
+            model_complexity=REFERENCE_EXTRACTOR["model_complexity"],
         )
         print(
             f"[ReferenceLoader] Successfully created reference pose for exercise {exercise_id}"
         )
-        return frames
     except Exception as e:
         raise RuntimeError(f"Failed to extract pose for exercise {exercise_id}: {e}")
+
+    # The JSON is written either way; the store only speeds up later loads
+    try:
+        convert_reference(
+            path,
+            extractor=REFERENCE_EXTRACTOR,
+            video_path=(
+                None if found_video_path.startswith("http") else found_video_path
+            ),
+        )
+    except Exception as e:
+        print(f"[ReferenceLoader] Could not write binary pose store for {path}: {e}")
+    reference_index.refresh()
+    return frames
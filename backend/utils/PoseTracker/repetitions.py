@@ -0,0 +1,182 @@
+"""
+repetitions.py
+
+Repetition detection for exercises that repeat a short motion ("Repeat this
+breathing cycle 10 times").
+
+The dominant motion of a sequence is its first principal component: the
+normalized keypoint vectors projected on the direction of largest variance
+give a 1-D signal that rises and falls once per repetition. The rep period is
+the first strong peak of that signal's autocorrelation, and reps are cut at
+the signal minima one period apart.
+
+A reference is reduced to a RepTemplate, its most typical single rep, cached
+per exercise and point set. User recordings are projected on the
+reference's component, so their reps are cut at the same phase of the motion
+and each can be aligned against the short template.
+"""
+
+import os
+from typing import Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from utils.PoseTracker.dtw_engine import dtw_distance, pairwise_distances
+from utils.PoseTracker.reference_cache import LRUCache
+
+# Shortest repetition considered, in frames (0.5 s at REFERENCE_FPS)
+REP_MIN_FRAMES = int(os.getenv("POSE_REP_MIN_FRAMES", "8"))
+# Autocorrelation a period needs to count as a repetition
+REP_MIN_PERIODICITY = float(os.getenv("POSE_REP_MIN_PERIODICITY", "0.4"))
+
+_rep_templates = LRUCache(int(os.getenv("POSE_REP_TEMPLATE_CACHE_SIZE", "64")))
+
+
+class RepTemplate:
+    """A single reference repetition plus the axis its reps were cut on."""
+
+    def __init__(
+        self,
+        vecs: np.ndarray,
+        period: int,
+        mean: np.ndarray,
+        component: np.ndarray,
+        reference_reps: int,
+    ):
+        self.vecs = vecs  # (frames, points * 2) normalized positions of one rep
+        self.period = period  # reference rep period in frames
+        self.mean = mean  # reference mean pose (PCA centre)
+        self.component = component  # first principal component of the reference
+        self.reference_reps = reference_reps
+
+    def signal(self, vecs: np.ndarray) -> np.ndarray:
+        """Dominant-motion signal of any sequence on this template's axis."""
+        return _smooth((vecs - self.mean) @ self.component)
+
+
+def _smooth(signal: np.ndarray, width: int = 3) -> np.ndarray:
+    if len(signal) < width:
+        return signal
+    return np.convolve(signal, np.ones(width) / width, mode="same")
+
+
+def dominant_component(vecs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(mean, first principal component) of a (frames, dims) matrix."""
+    mean = vecs.mean(axis=0)
+    _, _, vt = np.linalg.svd(vecs - mean, full_matrices=False)
+    return mean, vt[0]
+
+
+def estimate_period(
+    signal: np.ndarray,
+    min_period: int = REP_MIN_FRAMES,
+    max_period: Optional[int] = None,
+    min_periodicity: float = REP_MIN_PERIODICITY,
+) -> Optional[int]:
+    """
+    Repetition period of a 1-D signal in frames, or None if it does not
+    repeat at least twice.
+
+    The autocorrelation is computed for all lags at once with an FFT and
+    corrected for the shrinking overlap. The first local peak within half of
+    the highest one is taken, so a period is not mistaken for its multiples.
+    """
+    n = len(signal)
+    max_period = min(max_period or n // 2, n // 2)
+    if max_period <= min_period:
+        return None
+    centred = signal - signal.mean()
+    spectrum = np.fft.rfft(centred, 2 * n)
+    acf = np.fft.irfft(spectrum * np.conj(spectrum))[:n]
+    if acf[0] <= 0:
+        return None
+    acf = acf / (n - np.arange(n)) / (acf[0] / n)
+
+    lags = np.arange(min_period, max_period + 1)
+    values = acf[lags]
+    strongest = values.max()
+    if strongest < min_periodicity:
+        return None
+    peaks = (values >= acf[lags - 1]) & (values >= acf[lags + 1])
+    candidates = lags[peaks & (values >= 0.5 * strongest) & (values >= min_periodicity)]
+    return int(candidates[0]) if len(candidates) else None
+
+
+def segment_repetitions(signal: np.ndarray, period: int) -> List[Tuple[int, int]]:
+    """
+    Cut a signal into reps [start, end) at its minima: the first cut is the
+    lowest point of the first period, each next one the lowest point between
+    0.6 and 1.4 periods later. Frames before the first and after the last cut
+    (partial reps) are left out.
+    """
+    n = len(signal)
+    if n < period:
+        return []
+    cuts = [int(np.argmin(signal[:period]))]
+    while True:
+        lo = cuts[-1] + max(1, int(0.6 * period))
+        hi = min(n, cuts[-1] + int(1.4 * period) + 1)
+        if lo >= n or hi - lo < 1 or cuts[-1] + period > n:
+            break
+        cuts.append(lo + int(np.argmin(signal[lo:hi])))
+    return list(zip(cuts[:-1], cuts[1:]))
+
+
+def build_rep_template(ref_vecs: np.ndarray) -> Optional[RepTemplate]:
+    """
+    Template of a periodic reference: its medoid rep (smallest total DTW
+    distance to the other reps). None if fewer than two reps are found.
+    """
+    mean, component = dominant_component(ref_vecs)
+    signal = _smooth((ref_vecs - mean) @ component)
+    period = estimate_period(signal)
+    if period is None:
+        return None
+    reps = segment_repetitions(signal, period)
+    if len(reps) < 2:
+        return None
+
+    segments = [ref_vecs[start:end] for start, end in reps]
+    totals = np.zeros(len(segments))
+    for i in range(len(segments)):
+        for j in range(i + 1, len(segments)):
+            d = dtw_distance(pairwise_distances(segments[i], segments[j]))
+            d /= len(segments[i]) + len(segments[j])
+            totals[i] += d
+            totals[j] += d
+    medoid = int(np.argmin(totals))
+    return RepTemplate(segments[medoid], period, mean, component, len(reps))
+
+
+def get_rep_template(
+    ref_vecs: np.ndarray, cache_key: Optional[Hashable] = None
+) -> Optional[RepTemplate]:
+    """build_rep_template, cached under cache_key (e.g. reference key + point set)."""
+    if cache_key is None:
+        return build_rep_template(ref_vecs)
+    return _rep_templates.get_or_build(cache_key, lambda: build_rep_template(ref_vecs))
+
+
+def user_repetitions(
+    template: RepTemplate, user_vecs: np.ndarray
+) -> Tuple[List[Tuple[int, int]], int]:
+    """
+    Rep boundaries of a user recording, cut on the template's axis. The user's
+    own period is searched between half and twice the reference period; if
+    the recording is too short to measure it, the reference period is used.
+
+    Returns (reps, period).
+    """
+    signal = template.signal(user_vecs)
+    period = estimate_period(
+        signal,
+        max(REP_MIN_FRAMES, template.period // 2),
+        2 * template.period,
+    )
+    if period is None:
+        period = template.period
+    return segment_repetitions(signal, period), period
+
+
+def rep_template_cache_stats():
+    return _rep_templates.stats()
@@ -0,0 +1,325 @@
+"""
+rescore.py
+
+Re-score archived user recordings with the current scoring code.
+
+Every compare saves the user sequence to user_poses/ together with a
+<recording>.meta.json (exercise, mode, timestamps, the score given at the
+time). This job reads the metadata, groups recordings by exercise and scores
+each group in chunks on a process pool, so a worker loads each reference once
+and every core is busy. Recordings are read inside the workers one at a time,
+never all at once.
+
+Recordings saved before metadata was written (user_task<task>_<time>.json)
+only name their task. They are included when their task is mapped to an
+exercise with --task-exercise, and scored in window mode, the only mode back
+then. Their stored score is not known, so they get a new score but no drift.
+
+Usage (from backend/):
+    python -m utils.PoseTracker.rescore
+    python -m utils.PoseTracker.rescore --dir user_poses --out rescore_results.npz \\
+        --workers 4 --exercise 3
+    python -m utils.PoseTracker.rescore --task-exercise 1=3 --task-exercise 2=7
+
+Outputs:
+    <out>.npz          one array per column (recording, exercise_id, task_id,
+                       mode, frames, old_score, new_score, old_scorers, error)
+    <out>_drift.json   per-exercise and overall old-vs-new score drift
+
+The Gemini analysis is skipped, so drift statistics only include recordings
+whose stored score came from DTW alone; the others are counted separately.
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from utils.PoseTracker.joint_angles import COORD_FEATURES
+from utils.PoseTracker.keypoint_schemas import get_schema
+from utils.PoseTracker.pose_codec import decode_pose_packet
+from utils.PoseTracker.pose_compare import (
+    SUBSEQUENCE_MODE,
+    WINDOW_MODE,
+    compare_pose_sequences,
+)
+from utils.PoseTracker.pose_sequence import PoseSequence
+from utils.PoseTracker.reference_loader import load_reference
+from utils.PoseTracker.stream_scorer import STREAM_MODE
+
+USER_POSE_DIR = "user_poses"
+CHUNK_SIZE = 16  # recordings per worker task
+# Name under which the router saves recordings (see poserouter._save_user_pose)
+RECORDING_NAME = re.compile(r"^user_task(?P<task_id>.+)_\d{8}_\d{6}\.(json|bfps)$")
+
+
+def _legacy_recordings(
+    pose_dir: str, task_exercises: Dict[str, str]
+) -> Iterator[Dict[str, Any]]:
+    """Metadata for recordings saved without a .meta.json, if their task is mapped."""
+    unmapped: Dict[str, int] = defaultdict(int)
+    for path in sorted(glob.glob(os.path.join(pose_dir, "user_task*"))):
+        name = os.path.basename(path)
+        match = RECORDING_NAME.match(name)
+        if match is None or os.path.exists(os.path.splitext(path)[0] + ".meta.json"):
+            continue
+        task_id = match.group("task_id")
+        if task_id not in task_exercises:
+            unmapped[task_id] += 1
+            continue
+        yield {
+            "recording": name,
+            "task_id": task_id,
+            "exercise_id": task_exercises[task_id],
+            "mode": WINDOW_MODE,
+            "score": None,
+            "scorers": None,
+            "path": path,
+        }
+    if unmapped:
+        print(
+            f"[Rescore] Skipping {sum(unmapped.values())} recordings without metadata "
+            f"of unmapped tasks {', '.join(sorted(unmapped))} (see --task-exercise)"
+        )
+
+
+def iter_recordings(
+    pose_dir: str,
+    exercise_id: Optional[str] = None,
+    task_exercises: Optional[Dict[str, str]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the metadata of every archived recording that has one, then of the
+    older recordings whose task is in task_exercises (task id -> exercise id).
+    """
+    for meta_path in sorted(glob.glob(os.path.join(pose_dir, "*.meta.json"))):
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[Rescore] Skipping unreadable metadata {meta_path}: {e}")
+            continue
+        if exercise_id is not None and str(meta.get("exercise_id")) != exercise_id:
+            continue
+        meta["path"] = os.path.join(pose_dir, meta.get("recording", ""))
+        yield meta
+    for meta in _legacy_recordings(pose_dir, task_exercises or {}):
+        if exercise_id is None or meta["exercise_id"] == exercise_id:
+            yield meta
+
+
+def _load_recording(meta: Dict[str, Any]) -> PoseSequence:
+    path = meta["path"]
+    if path.endswith(".bfps"):
+        with open(path, "rb") as f:
+            return decode_pose_packet(f.read())
+    with open(path, "r") as f:
+        frames = json.load(f)
+    schema = (
+        get_schema(meta["keypoint_schema"]) if meta.get("keypoint_schema") else None
+    )
+    return PoseSequence.from_frames(frames, schema)
+
+
+def score_chunk(exercise_id: str, metas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Score recordings of one exercise (runs in a worker process)."""
+    rows = []
+    try:
+        reference = load_reference(
+            exercise_id, metas[0].get("reference_video_url"), generate=False
+        )
+        reference_error = None
+    except Exception as e:
+        reference, reference_error = None, f"reference: {e}"
+
+    for meta in metas:
+        # Stream sessions are scored like subsequence mode
+        mode = meta.get("mode") or WINDOW_MODE
+        if mode == STREAM_MODE:
+            mode = SUBSEQUENCE_MODE
+        row = {
+            "recording": meta.get("recording", ""),
+            "exercise_id": exercise_id,
+            "task_id": str(meta.get("task_id", "")),
+            "mode": mode,
+            "frames": 0,
+            "old_score": meta.get("score"),
+            "new_score": None,
+            "old_scorers": ",".join(meta.get("scorers") or []),
+            "error": reference_error or "",
+        }
+        if reference is not None:
+            try:
+                user_seq = _load_recording(meta)
+                row["frames"] = len(user_seq)
+                keyframes = reference.keyframes
+                row["new_score"] = compare_pose_sequences(
+                    keyframes.sequence if keyframes else reference.sequence,
+                    user_seq,
+                    task_id=row["task_id"],
+                    mode=mode,
+                    reference_key=(
+                        reference.cache_key + ("keyframes",)
+                        if keyframes
+                        else reference.cache_key
+                    ),
+                    use_gemini=False,
+                    ref_durations=keyframes.durations if keyframes else None,
+                    user_timestamps=meta.get("user_frame_timestamps"),
+                    features=meta.get("features") or COORD_FEATURES,
+                )
+            except Exception as e:
+                row["error"] = str(e)
+        rows.append(row)
+    return rows
+
+
+def _to_columns(rows: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    def scores(key: str) -> np.ndarray:
+        return np.asarray(
+            [np.nan if r[key] is None else float(r[key]) for r in rows],
+            dtype=np.float64,
+        )
+
+    return {
+        "recording": np.asarray([r["recording"] for r in rows], dtype=str),
+        "exercise_id": np.asarray([r["exercise_id"] for r in rows], dtype=str),
+        "task_id": np.asarray([r["task_id"] for r in rows], dtype=str),
+        "mode": np.asarray([r["mode"] for r in rows], dtype=str),
+        "frames": np.asarray([r["frames"] for r in rows], dtype=np.int64),
+        "old_score": scores("old_score"),
+        "new_score": scores("new_score"),
+        "old_scorers": np.asarray([r["old_scorers"] for r in rows], dtype=str),
+        "error": np.asarray([r["error"] for r in rows], dtype=str),
+    }
+
+
+def _drift_stats(old: np.ndarray, new: np.ndarray) -> Dict[str, Any]:
+    diff = new - old
+    if not len(diff):
+        return {"count": 0}
+    return {
+        "count": int(len(diff)),
+        "mean_old": float(old.mean()),
+        "mean_new": float(new.mean()),
+        "mean_drift": float(diff.mean()),
+        "mean_abs_drift": float(np.abs(diff).mean()),
+        "max_abs_drift": float(np.abs(diff).max()),
+        "p95_abs_drift": float(np.percentile(np.abs(diff), 95)),
+    }
+
+
+def drift_report(columns: Dict[str, np.ndarray]) -> Dict[str, Any]:
+    """Old-vs-new drift over recordings scored both times by DTW alone."""
+    scored = ~np.isnan(columns["new_score"]) & ~np.isnan(columns["old_score"])
+    comparable = scored & (columns["old_scorers"] == "dtw")
+    report: Dict[str, Any] = {
+        "recordings": int(len(columns["recording"])),
+        "rescored": int((~np.isnan(columns["new_score"])).sum()),
+        "failed": int((columns["error"] != "").sum()),
+        "old_score_used_gemini": int((scored & ~comparable).sum()),
+        "overall": _drift_stats(
+            columns["old_score"][comparable], columns["new_score"][comparable]
+        ),
+        "by_exercise": {},
+    }
+    for exercise_id in np.unique(columns["exercise_id"]):
+        mask = comparable & (columns["exercise_id"] == exercise_id)
+        report["by_exercise"][str(exercise_id)] = _drift_stats(
+            columns["old_score"][mask], columns["new_score"][mask]
+        )
+    return report
+
+
+def rescore(
+    pose_dir: str = USER_POSE_DIR,
+    workers: Optional[int] = None,
+    exercise_id: Optional[str] = None,
+    task_exercises: Optional[Dict[str, str]] = None,
+) -> List[Dict[str, Any]]:
+    """Score every archived recording (see iter_recordings); one row per recording."""
+    groups: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for meta in iter_recordings(pose_dir, exercise_id, task_exercises):
+        groups[str(meta.get("exercise_id"))].append(meta)
+    print(
+        f"[Rescore] {sum(len(g) for g in groups.values())} recordings "
+        f"across {len(groups)} exercises"
+    )
+
+    # Missing references are extracted here, once, not by parallel chunks
+    for ex_id, metas in groups.items():
+        try:
+            load_reference(ex_id, metas[0].get("reference_video_url"))
+        except Exception as e:
+            print(f"[Rescore] No reference for exercise {ex_id}: {e}")
+
+    rows: List[Dict[str, Any]] = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(score_chunk, ex_id, metas[i : i + CHUNK_SIZE])
+            for ex_id, metas in groups.items()
+            for i in range(0, len(metas), CHUNK_SIZE)
+        ]
+        for future in as_completed(futures):
+            rows.extend(future.result())
+            print(f"[Rescore] {len(rows)} recordings scored")
+    rows.sort(key=lambda r: (r["exercise_id"], r["recording"]))
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Re-score archived user pose recordings with the current algorithm"
+    )
+    parser.add_argument("--dir", default=USER_POSE_DIR, help="Recording archive")
+    parser.add_argument("--out", default="rescore_results.npz")
+    parser.add_argument("--workers", type=int, default=None, help="Default: CPU count")
+    parser.add_argument("--exercise", default=None, help="Only this exercise id")
+    parser.add_argument(
+        "--task-exercise",
+        action="append",
+        default=[],
+        metavar="TASK_ID=EXERCISE_ID",
+        help="Exercise of a task's recordings saved without metadata (repeatable)",
+    )
+    args = parser.parse_args(argv)
+
+    task_exercises = {}
+    for mapping in args.task_exercise:
+        task_id, sep, ex_id = mapping.partition("=")
+        if not sep or not task_id or not ex_id:
+            parser.error(f"--task-exercise expects TASK_ID=EXERCISE_ID, got {mapping}")
+        task_exercises[task_id] = ex_id
+
+    rows = rescore(args.dir, args.workers, args.exercise, task_exercises)
+    columns = _to_columns(rows)
+    np.savez_compressed(args.out, **columns)
+    print(f"[Rescore] Wrote {args.out}")
+
+    report = drift_report(columns)
+    report_path = os.path.splitext(args.out)[0] + "_drift.json"
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    overall = report["overall"]
+    print(f"[Rescore] Wrote {report_path}")
+    if overall.get("count"):
+        print(
+            f"[Rescore] Drift over {overall['count']} DTW-only recordings: "
+            f"mean {overall['mean_drift']:+.4f}, "
+            f"mean |d| {overall['mean_abs_drift']:.4f}, "
+            f"max |d| {overall['max_abs_drift']:.4f}"
+        )
+    print(
+        f"[Rescore] {report['failed']} failed, {report['old_score_used_gemini']} not "
+        f"comparable (stored score included Gemini)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+result_cache.py
+
+Cache of finished compare results, so a client retrying the same attempt gets
+the stored result back instead of the recording being scored (and the score
+saved) again.
+
+Entries are keyed by compare_cache_key: a hash of the decoded user sequence
+and everything else that decides the score (user, task, exercise, reference
+version, scoring parameters). The cache is bounded in entries and every entry
+expires after a TTL.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional
+
+import numpy as np
+
+RESULT_CACHE_SIZE = int(os.getenv("POSE_RESULT_CACHE_SIZE", "256"))
+RESULT_CACHE_TTL_S = float(os.getenv("POSE_RESULT_CACHE_TTL_S", "600"))
+
+
+def compare_cache_key(
+    user_data: np.ndarray,
+    user_timestamps: Optional[List[float]],
+    **params: Any,
+) -> str:
+    """Hash of a user sequence (array contents and shape) plus scoring parameters."""
+    digest = hashlib.sha1()
+    data = np.ascontiguousarray(user_data)
+    digest.update(str(data.shape).encode())
+    digest.update(data.tobytes())
+    if user_timestamps is not None:
+        digest.update(np.asarray(user_timestamps, dtype=np.float64).tobytes())
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Thread-safe LRU of results that expire ttl_s seconds after being stored."""
+
+    def __init__(self, max_entries: int, ttl_s: float):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.hits = 0
+        self.misses = 0
+        # key -> (expiry on the monotonic clock, result)
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, result: Dict[str, Any]) -> None:
+        if self.max_entries <= 0 or self.ttl_s <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_s, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl_s,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+compare_results = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL_S)
@@ -0,0 +1,185 @@
+"""
+scoring_service.py
+
+Runs pose comparisons on a bounded pool of worker processes, so the DTW work
+neither holds the API process's GIL nor queues behind other compares on a
+single core.
+
+Each worker loads references through load_reference and keeps its own parsed
+reference files and prepared-reference cache, so after the first compare of
+an exercise a worker only receives the user frames. Workers never extract a
+reference: the caller resolves it, extracting it if missing, before
+dispatching a compare (see poserouter._prepare_compare), because concurrent
+extractions are only merged within one process. When more than
+workers + POSE_SCORING_MAX_QUEUE compares are in flight, new ones are
+rejected with ScoringBusyError (HTTP 503 in the router) instead of piling up.
+
+POSE_SCORING_WORKERS=0 runs compares on the event loop's thread pool instead,
+e.g. for local debugging.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.PoseTracker.joint_angles import COORD_FEATURES
+from utils.PoseTracker.pose_compare import compare_pose_sequences
+from utils.PoseTracker.pose_sequence import PoseSequence
+from utils.PoseTracker.reference_index import reference_index
+from utils.PoseTracker.reference_loader import load_reference
+
+SCORING_WORKERS = int(os.getenv("POSE_SCORING_WORKERS", str(os.cpu_count() or 2)))
+# Compares allowed to wait for a free worker before new ones get a 503
+SCORING_MAX_QUEUE = int(
+    os.getenv("POSE_SCORING_MAX_QUEUE", str(2 * max(SCORING_WORKERS, 1)))
+)
+
+
+class ScoringBusyError(Exception):
+    """All workers are busy and the queue is full; retry later."""
+
+
+def score_user_sequence(
+    exercise_id: str,
+    video_url: Optional[str],
+    user_data: np.ndarray,
+    user_timestamps: Optional[List[float]],
+    task_id: str,
+    mode: str,
+    use_gemini: bool,
+    features: str = COORD_FEATURES,
+) -> Tuple[float, Dict[str, Any]]:
+    """
+    Score a user recording against an exercise's reference, which must already
+    exist. Runs in a worker process; user_data is the (frames, landmarks, 3)
+    PoseSequence array.
+
+    Returns (score, diagnostics).
+    """
+    try:
+        try:
+            reference = load_reference(str(exercise_id), video_url, generate=False)
+        except FileNotFoundError:
+            # Just written by the API process; this worker's index may predate it
+            reference_index.refresh()
+            reference = load_reference(str(exercise_id), video_url, generate=False)
+        print(
+            f"[PoseCompare] Loaded pre-computed reference poses for exercise "
+            f"{exercise_id} (task {task_id})"
+        )
+    except Exception as e:
+        print(f"[PoseCompare] Error loading reference poses: {e}")
+        raise RuntimeError(
+            f"Failed to load reference poses for exercise {exercise_id}: {str(e)}"
+        )
+
+    # A keyframe-compacted reference (keyframes.py) shrinks the DTW matrix
+    diagnostics: Dict[str, Any] = {}
+    keyframes = reference.keyframes
+    score = compare_pose_sequences(
+        keyframes.sequence if keyframes else reference.sequence,
+        PoseSequence(user_data),
+        task_id=task_id,
+        mode=mode,
+        diagnostics=diagnostics,
+        reference_key=(
+            reference.cache_key + ("keyframes",) if keyframes else reference.cache_key
+        ),
+        use_gemini=use_gemini,
+        ref_durations=keyframes.durations if keyframes else None,
+        user_timestamps=user_timestamps,
+        features=features,
+    )
+    diagnostics["worker_pid"] = os.getpid()
+    return score, diagnostics
+
+
+class ScoringService:
+    """Process pool with a bound on in-flight work."""
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_in_flight = max(workers, 1) + max_queue
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a process that runs an event loop and
+                # background threads is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def start(self) -> None:
+        """
+        Spawn the workers ahead of the first compare (imports take a second
+        or two).
+        """
+        if self.workers > 0:
+            executor = self._get_executor()
+            for _ in range(self.workers):
+                executor.submit(os.getpid)
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Run fn(*args) on a worker; raises ScoringBusyError when saturated."""
+        with self._lock:
+            if self.in_flight >= self.max_in_flight:
+                self.rejected += 1
+                raise ScoringBusyError(
+                    f"Pose scoring is busy ({self.in_flight} compares in flight), "
+                    f"retry shortly"
+                )
+            self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            if self.workers <= 0:
+                result = await loop.run_in_executor(None, fn, *args)
+            else:
+                executor = self._get_executor()
+                try:
+                    result = await loop.run_in_executor(executor, fn, *args)
+                except BrokenProcessPool:
+                    # A worker died (e.g. OOM); start a fresh pool for later calls
+                    with self._lock:
+                        if self._executor is executor:
+                            self._executor = None
+                    executor.shutdown(wait=False)
+                    raise
+            with self._lock:
+                self.completed += 1
+            return result
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+scoring_service = ScoringService(SCORING_WORKERS, SCORING_MAX_QUEUE)
@@ -0,0 +1,235 @@
+import numpy as np
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from utils.PoseTracker.dtw_engine import SubsequenceDTW, pairwise_distances
+from utils.PoseTracker.keypoint_schemas import KeypointSchema, detect_schema
+from utils.PoseTracker.landmarks import landmark_names
+from utils.PoseTracker.pose_compare import (
+    PoseInput,
+    check_point_coverage_threshold,
+    combine_dtw_scores,
+    motion_distances,
+    position_similarity,
+)
+from utils.PoseTracker.pose_sequence import (
+    REFERENCE_FPS,
+    PoseSequence,
+    as_pose_sequence,
+    interpolate_frames,
+    motion_vectors,
+    normalize_frames,
+)
+from utils.PoseTracker.reference_cache import prepare_reference
+
+STREAM_MODE = "stream"
+
+
+class StreamingPoseScorer:
+    """
+    Scores a user recording against a reference while its frames arrive.
+
+    Each batch is normalized and appended to an incremental subsequence DTW
+    (see dtw_engine.SubsequenceDTW), so when the recording stops only the
+    motion term and the coverage penalty are left to compute.
+
+    The compared points are fixed by the first batch that shares visible points
+    with the reference (batch scoring uses the whole recording instead), and
+    frames received before that are aligned as soon as the set is known.
+
+    If batches come with capture timestamps, frames are resampled to the
+    reference rate as they arrive; the last raw frame is carried over so
+    interpolation continues across batch boundaries. The first batch decides:
+    a session sends timestamps with every batch or with none.
+    """
+
+    def __init__(
+        self,
+        reference: PoseInput,
+        min_point_coverage: float = 0.5,
+        min_score: float = 0.2,
+        reference_key: Optional[Hashable] = None,
+        schema: Optional[KeypointSchema] = None,
+    ):
+        self.reference = as_pose_sequence(reference)
+        self.schema = schema  # keypoint schema of the user frames, if declared
+        self.reference_key = reference_key
+        self.min_point_coverage = min_point_coverage
+        self.min_score = min_score
+        self.point_indices: Optional[np.ndarray] = None
+        self.ref_vecs: Optional[np.ndarray] = None
+        self.ref_motion_norm: Optional[np.ndarray] = None
+        self.dtw: Optional[SubsequenceDTW] = None
+        self._chunks: List[np.ndarray] = []
+        self._pending: List[np.ndarray] = []
+        self._user_vecs: List[np.ndarray] = []
+        self._num_frames = 0
+        self._num_raw_frames = 0
+        self._num_aligned = 0
+        # Whether batches carry timestamps (set by the first batch)
+        self._timed: Optional[bool] = None
+        # Resampling state: first capture time (ms), last raw frame and its time
+        # in seconds, and the index of the next grid point
+        self._t0: Optional[float] = None
+        self._last_raw: Optional[Tuple[np.ndarray, float]] = None
+        self._next_grid = 0
+
+    def add_frames(
+        self, frames: PoseInput, timestamps: Optional[List[float]] = None
+    ) -> Dict[str, Any]:
+        """
+        Append a batch of frames, advance the alignment and return progress.
+        timestamps are the capture times of the frames in milliseconds; either
+        every batch of a session has them or none does (ValueError otherwise).
+        """
+        if self._timed is None:
+            self._timed = timestamps is not None
+        elif self._timed != (timestamps is not None):
+            raise ValueError(
+                "Send timestamps with every frames message of a session or with none"
+            )
+        if self.schema is None and not isinstance(frames, PoseSequence) and frames:
+            self.schema = detect_schema(frames[0])
+        batch = as_pose_sequence(frames, self.schema)
+        self._num_raw_frames += len(batch)
+        if self._timed:
+            batch = self._resample(batch, timestamps)
+        if len(batch):
+            self._chunks.append(batch.data)
+            self._pending.append(batch.data)
+            self._num_frames += len(batch)
+            if self.point_indices is None:
+                self._select_points(batch)
+            if self.point_indices is not None:
+                self._align_pending()
+        return self.progress()
+
+    def _resample(
+        self, batch: PoseSequence, timestamps: Optional[List[float]]
+    ) -> PoseSequence:
+        times = np.asarray(timestamps, dtype=np.float64)
+        if times.shape != (len(batch),):
+            raise ValueError(f"Expected {len(batch)} frame timestamps")
+        if not len(batch):
+            return batch
+        if self._t0 is None:
+            self._t0 = float(times[0])
+        seconds = (times - self._t0) / 1000.0
+        data = batch.data
+        if self._last_raw is not None:
+            data = np.concatenate((self._last_raw[0], data), axis=0)
+            seconds = np.concatenate(([self._last_raw[1]], seconds))
+        if not np.isfinite(seconds).all() or (np.diff(seconds) < 0).any():
+            raise ValueError("Frame timestamps must be finite and non-decreasing")
+
+        last_grid = int(np.floor(seconds[-1] * REFERENCE_FPS + 1e-6))
+        grid = np.arange(self._next_grid, last_grid + 1) / REFERENCE_FPS
+        self._next_grid = max(self._next_grid, last_grid + 1)
+        self._last_raw = (data[-1:], float(seconds[-1]))
+        return PoseSequence(
+            interpolate_frames(data, seconds, grid, self.min_score)
+            if len(grid)
+            else data[:0]
+        )
+
+    def _select_points(self, batch: PoseSequence) -> None:
+        indices = np.flatnonzero(
+            self.reference.visible_mask(self.min_score)
+            & batch.visible_mask(self.min_score)
+        )
+        if not len(indices):
+            return
+        self.point_indices = indices
+        prepared = prepare_reference(
+            self.reference, indices, self.reference_key, self.min_score
+        )
+        self.ref_vecs = prepared.vecs
+        self.ref_motion_norm = prepared.motion_norm
+        self.dtw = SubsequenceDTW(len(self.ref_vecs))
+        print(
+            f"[PoseStream] Tracking {len(indices)} points: {landmark_names(indices)}"
+        )
+
+    def _align_pending(self) -> None:
+        if not self._pending:
+            return
+        data = np.concatenate(self._pending, axis=0)
+        self._pending = []
+        vecs = normalize_frames(
+            PoseSequence(data).keypoint_vectors(self.point_indices, self.min_score)
+        )
+        self.dtw.update(pairwise_distances(self.ref_vecs, vecs))
+        self._user_vecs.append(vecs)
+        self._num_aligned += len(vecs)
+
+    def progress(self) -> Dict[str, Any]:
+        """Frame counts plus a position-only partial score for the frames so far."""
+        result: Dict[str, Any] = {
+            "frames": self._num_raw_frames,
+            "resampled_frames": self._num_frames,
+            "aligned_frames": self._num_aligned,
+            "partial_score": None,
+        }
+        if self.dtw is not None and self._num_aligned:
+            dist, start, end = self.dtw.best()
+            result.update(
+                {
+                    "partial_score": position_similarity(
+                        2.0 * dist, self._num_aligned, len(self.point_indices)
+                    ),
+                    "reference_start": start,
+                    "reference_end": end,
+                }
+            )
+        return result
+
+    def finish(self) -> Tuple[float, Dict[str, Any]]:
+        """Final DTW score (0.0 to 1.0) and alignment diagnostics."""
+        diagnostics: Dict[str, Any] = {"mode": STREAM_MODE, **self.progress()}
+        if not self._num_frames or not len(self.reference):
+            print("[PoseStream] Empty sequences")
+            return 0.0, diagnostics
+
+        user = PoseSequence(np.concatenate(self._chunks, axis=0))
+        is_valid, coverage_ratio = check_point_coverage_threshold(
+            self.reference, user, self.min_point_coverage, self.min_score
+        )
+        if not is_valid:
+            penalty = coverage_ratio * 0.3  # Max score of 0.3 if below threshold
+            print(
+                f"[PoseStream] Insufficient point coverage, returning penalty "
+                f"score: {penalty:.3f}"
+            )
+            return penalty, diagnostics
+
+        if self.point_indices is None:
+            print("[PoseStream] No common points found between sequences")
+            return 0.0, diagnostics
+
+        len_ref, len_user = len(self.ref_vecs), self._num_aligned
+        if len_ref < len_user:
+            print("[PoseStream] Reference sequence shorter than user sequence")
+            return 0.0, diagnostics
+
+        dist, start, end = self.dtw.best()
+        user_vecs = np.concatenate(self._user_vecs, axis=0)
+        motion_dists = motion_distances(
+            self.ref_motion_norm, motion_vectors(user_vecs)
+        )
+        best_motion_dist = (
+            float(motion_dists[min(start, len_ref - len_user)])
+            if len(motion_dists)
+            else float("inf")
+        )
+        diagnostics.update(
+            {"reference_start": start, "reference_window": end - start + 1}
+        )
+
+        # Same rescaling as subsequence mode in sliding_window_dtw
+        score = combine_dtw_scores(
+            2.0 * dist,
+            best_motion_dist,
+            len_user,
+            len(self.point_indices),
+            coverage_ratio,
+        )
+        return score, diagnostics
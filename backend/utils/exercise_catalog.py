@@ -0,0 +1,123 @@
+"""
+exercise_catalog.py
+
+In-memory catalog of exercises.json with constant-time lookups by id,
+videolink, addiction tag and name.
+
+The file is parsed once and re-parsed only when its mtime changes, so editing
+exercises.json takes effect without a restart. The mtime is checked at most
+every EXERCISES_POLL_S seconds (default 2), so lookups make no filesystem calls
+in between. Every lookup works on an
+immutable snapshot, which a reload replaces as a whole.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+EXERCISES_PATH = os.path.join(os.path.dirname(__file__), "..", "exercises.json")
+POLL_INTERVAL_S = float(os.getenv("EXERCISES_POLL_S", "2"))
+
+
+def _name_key(name: str) -> str:
+    return (name or "").lower().strip()
+
+
+class _Snapshot:
+    """Exercises of one version of the file plus their indexes."""
+
+    def __init__(self, exercises: List[Dict[str, Any]]):
+        self.exercises = exercises
+        self.by_id: Dict[str, Dict[str, Any]] = {}
+        self.by_videolink: Dict[str, Dict[str, Any]] = {}
+        self.by_name: Dict[str, Dict[str, Any]] = {}
+        # lowercase tag -> positions in file order
+        self.by_addiction: Dict[str, List[int]] = {}
+        for position, exercise in enumerate(exercises):
+            # First entry wins on duplicates, as with the linear scans
+            self.by_id.setdefault(str(exercise.get("id")), exercise)
+            if exercise.get("videolink"):
+                self.by_videolink.setdefault(exercise["videolink"], exercise)
+            self.by_name.setdefault(_name_key(exercise.get("name", "")), exercise)
+            for tag in exercise.get("addictions", []):
+                self.by_addiction.setdefault(tag.lower(), []).append(position)
+
+
+class ExerciseCatalog:
+    """exercises.json, reloaded when the file changes."""
+
+    def __init__(
+        self, path: str = EXERCISES_PATH, poll_interval_s: float = POLL_INTERVAL_S
+    ):
+        self.path = path
+        self.poll_interval_s = poll_interval_s
+        self._version: Optional[Tuple[int, int]] = None
+        self._snapshot = _Snapshot([])
+        self._checked_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _current(self) -> _Snapshot:
+        now = time.monotonic()
+        checked_at = self._checked_at
+        if checked_at is not None and now - checked_at < self.poll_interval_s:
+            return self._snapshot
+        try:
+            stat = os.stat(self.path)
+            version = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            version = None
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._snapshot = self._read(version)
+                    self._version = version
+        self._checked_at = now
+        return self._snapshot
+
+    def _read(self, version: Optional[Tuple[int, int]]) -> _Snapshot:
+        if version is None:
+            print(f"[Exercises] exercises.json not found at {self.path}")
+            return _Snapshot([])
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                exercises = json.load(f).get("exercises", [])
+        except Exception as e:
+            # Keep serving the last good version
+            print(f"[Exercises] Error loading exercises.json: {e}")
+            return self._snapshot
+        print(f"[Exercises] Loaded {len(exercises)} exercises from exercises.json")
+        return _Snapshot(exercises)
+
+    def load(self) -> None:
+        """Parse the file now (e.g. at startup) instead of on first use."""
+        self._current()
+
+    def all(self) -> List[Dict[str, Any]]:
+        """All exercises in file order."""
+        return list(self._current().exercises)
+
+    def by_id(self, exercise_id) -> Optional[Dict[str, Any]]:
+        return self._current().by_id.get(str(exercise_id))
+
+    def by_videolink(self, videolink: str) -> Optional[Dict[str, Any]]:
+        return self._current().by_videolink.get(videolink)
+
+    def by_name(self, name: str) -> Optional[Dict[str, Any]]:
+        """Case- and surrounding-whitespace-insensitive name lookup."""
+        return self._current().by_name.get(_name_key(name))
+
+    def for_addiction(self, addiction: Optional[str]) -> List[Dict[str, Any]]:
+        """
+        Exercises tagged with the addiction (case-insensitive) or with "all",
+        in file order; only the "all" ones if no addiction is given.
+        """
+        snapshot = self._current()
+        positions = set(snapshot.by_addiction.get("all", []))
+        if addiction:
+            positions.update(snapshot.by_addiction.get(addiction.lower().strip(), []))
+        return [snapshot.exercises[i] for i in sorted(positions)]
+
+
+exercise_catalog = ExerciseCatalog()
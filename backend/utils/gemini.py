@@ -2,8 +2,8 @@ import os
 import json
 import requests
 import random
-from pathlib import Path
 from utils import firebase_utils
+from utils.exercise_catalog import exercise_catalog
 from utils.PoseTracker.extract_pose_from_video import extract_pose_from_video
 from typing import Optional, Any, Dict, List
 
@@ -13,24 +13,8 @@ def _get_api_key() -> Optional[str]:
 
 
 def _load_exercises() -> List[Dict[str, Any]]:
-    """Load exercises from exercises.json file."""
-    try:
-        # Get the path to exercises.json relative to this file
-        current_dir = Path(__file__).parent.parent
-        exercises_path = current_dir / "exercises.json"
-
-        if not exercises_path.exists():
-            print(f"[Exercises] exercises.json not found at {exercises_path}")
-            return []
-
-        with open(exercises_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            exercises = data.get("exercises", [])
-            print(f"[Exercises] Loaded {len(exercises)} exercises from exercises.json")
-            return exercises
-    except Exception as e:
-        print(f"[Exercises] Error loading exercises.json: {e}")
-        return []
+    """All exercises from the exercise catalog (exercises.json)."""
+    return exercise_catalog.all()
 
 
 def _get_user_addiction(onboarding: Optional[Any]) -> Optional[str]:
@@ -67,27 +51,14 @@ def _get_user_addiction(onboarding: Optional[Any]) -> Optional[str]:
         return None
 
 
-def _filter_exercises_by_addiction(
-    exercises: List[Dict[str, Any]], addiction: Optional[str]
-) -> List[Dict[str, Any]]:
-    """Filter exercises that match the user's addiction or are applicable to all."""
-    if not addiction:
-        # If no addiction specified, return exercises tagged with "all"
-        return [ex for ex in exercises if "all" in ex.get("addictions", [])]
-
-    addiction_normalized = addiction.lower().strip()
-    filtered = []
-
-    for exercise in exercises:
-        addictions = exercise.get("addictions", [])
-        # Include if addiction matches or exercise is for "all"
-        if (
-            addiction_normalized in [a.lower() for a in addictions]
-            or "all" in addictions
-        ):
-            filtered.append(exercise)
-
-    print(f"[Exercises] Filtered {len(filtered)} exercises for addiction: {addiction}")
+def _filter_exercises_by_addiction(addiction: Optional[str]) -> List[Dict[str, Any]]:
+    """Exercises that match the user's addiction or are applicable to all."""
+    # Without an addiction, only the exercises tagged with "all"
+    filtered = exercise_catalog.for_addiction(addiction)
+    if addiction:
+        print(
+            f"[Exercises] Filtered {len(filtered)} exercises for addiction: {addiction}"
+        )
     return filtered
 
 
@@ -350,18 +321,20 @@ def generate_daily_tasks(
         # 🏋️ Load and filter exercises from exercises.json
         all_exercises = _load_exercises()
         user_addiction = _get_user_addiction(onboarding)
-        filtered_exercises = _filter_exercises_by_addiction(
-            all_exercises, user_addiction
-        )
+        filtered_exercises = _filter_exercises_by_addiction(user_addiction)
 
         # Filter out exercises used in the last 2 days
         if recently_used_exercises:
-            recently_used_set = {ex.lower().strip() for ex in recently_used_exercises}
+            recently_used_ids = set()
+            for name in recently_used_exercises:
+                exercise = exercise_catalog.by_name(name)
+                if exercise is not None:
+                    recently_used_ids.add(str(exercise.get("id")))
             original_count = len(filtered_exercises)
             filtered_exercises = [
                 ex
                 for ex in filtered_exercises
-                if ex.get("name", "").lower().strip() not in recently_used_set
+                if str(ex.get("id")) not in recently_used_ids
             ]
             print(
                 f"[Exercises] Filtered out {len(recently_used_exercises)} recently used exercises. {len(filtered_exercises)} exercises remaining (from {original_count})."
@@ -372,9 +345,7 @@ def generate_daily_tasks(
                 print(
                     "[Exercises] Warning: Too few exercises after filtering. Using all available exercises."
                 )
-                filtered_exercises = _filter_exercises_by_addiction(
-                    all_exercises, user_addiction
-                )
+                filtered_exercises = _filter_exercises_by_addiction(user_addiction)
 
         # If no filtered exercises, use exercises tagged with "all" as fallback
         if not filtered_exercises:
@@ -138,7 +138,31 @@ class PoseCompareRequest(BaseModel):
     reference_pose_sequence: Optional[list] = (
         None  # Optional: backend loads from pre-computed files if not provided
     )
-    user_pose_sequence: list  # Real-time extracted from user camera
+    user_pose_sequence: Optional[list] = (
+        None  # Real-time extracted from user camera: frames of {name, x, y, score}
+    )  # dicts, or of [x, y, score] rows in keypoint_schema order
+    keypoint_schema: Optional[str] = (
+        None  # "movenet17" or "mediapipe33"; detected from the first frame if omitted
+    )
+    user_frame_timestamps: Optional[list] = (
+        None  # Capture time (ms) of each user frame; enables resampling to 15 fps
+    )
+    user_pose_packed: Optional[str] = (
+        None  # Alternative to user_pose_sequence: base64 pose packet (pose_codec)
+    )
+    mode: str = (
+        "window"  # Alignment search: "window", "subsequence", "multires" or "reps"
+    )
+    use_gemini: bool = True  # False skips the Gemini analysis (DTW score only)
+    features: str = "coords"  # DTW feature space: "coords" or "angles" (joint angles)
+    recognize: bool = False  # Also rank the exercises the recording resembles
+
+
+class PoseIdentifyRequest(BaseModel):
+    user_pose_sequence: Optional[list] = None  # Same formats as PoseCompareRequest
+    keypoint_schema: Optional[str] = None
+    user_pose_packed: Optional[str] = None
+    top_k: int = 3  # Number of candidate exercises returned
 
 
 # Contact form models